@@ -0,0 +1,280 @@
+"""
+Benchmarks
+
+Times the equity queries and solver passes that everything else is built on, on synthetic
+inputs, so that the numbers don't depend on which eqarray/ files happen to be on a machine
+and can be compared across commits.  Run from the repository root, e.g.
+
+    python -m lib.hunl_bench                                 # every benchmark
+    python -m lib.hunl_bench --output bench.json --repeat 7  # also write the results as JSON
+    python -m lib.hunl_bench --only doFPIteration --sizes small,medium
+    python -m lib.hunl_bench --compare before.json after.json
+
+The synthetic equity arrays are shaped like real ones (-1 for matchups that conflict with each
+other or the board, and the equity of b vs a is 1 minus that of a vs b), with equities given
+by a made-up hand strength made symmetric under the suit permutations that leave the board
+unchanged (as real equities are, so trees built with mergeIsomorphic=True solve the same game),
+and are pinned in the shared EquityArrayCache: nothing is read from or written to eqarray/.
+Trees are built by lib/hunl_treebuild.py from the TreeSpecs in treeSpecs.
+
+Every benchmark is run repeat times, each run timing number calls, and reports the min,
+median and mean seconds per call.
+"""
+import sys
+import json
+import time
+import zlib
+import platform
+import argparse
+import subprocess
+import numpy
+from lib.hunl_combos import numCards, numHands, comboCards, comboOverlap, getLiveComboMask, parseCards
+from lib.hunl_equity import packEquityTable
+from lib.hunl_iso import getCanonicalBoard, getComboPerm, permuteCards, suitPerms
+from lib.hunl_fn import EquityArray, Range, StrategyPair, equityArrayCache, getEquityVsRange, \
+    plotEqDistn, doShoveFoldGame, doFPIteration
+from lib.hunl_treebuild import TreeSpec, walkTree, buildTree
+
+numRanks = 13
+
+turnBoard = parseCards('AhKdQs2d')
+riverBoard = parseCards('AhKdQs2d6c')
+
+# trees starting on turnBoard; the sizes differ in the rivers dealt and the bets allowed
+treeSpecs = {
+    'small': dict(riverCards=parseCards('6c6s'), raiseCap=2),
+    'medium': dict(riverCards=parseCards('6c6sTcTh3h7d'), raiseCap=3),
+    'large': dict(riverCards=parseCards('6c6sTcTh3h7d9c9s4h4c5d8s8hJcJh2c'), raiseCap=3,
+                  betSizes={'turn': [0.5, 1.0], 'river': [0.5, 1.0]}),
+}
+treeSizes = ['small', 'medium', 'large']
+
+### Synthetic equity arrays ###
+
+def makeSyntheticEquityTable(board, seed = 0):
+    """
+    Input:
+      board - list of 5 numbers describing a board
+      seed - seed of the random part of the hand strengths
+    Output: numHands x numHands float32 equity table: -1 for matchups that conflict with each
+            other or board, and otherwise a logistic function of the difference of the hands'
+            strengths (from their ranks, pairs, suitedness and cards paired with the board, plus
+            noise), so that the equity of b vs a is 1 minus that of a vs b.  Like real equities,
+            it doesn't change under the suit permutations that map board's cards onto themselves.
+    Side-effects: N/A
+    """
+    rng = numpy.random.RandomState(seed)
+    ranks = comboCards % numRanks
+    boardRanks = set(c % numRanks for c in board if c < numCards)
+    strengths = (ranks.sum(axis=1) / 4.0 + 3.0 * (ranks[:, 0] == ranks[:, 1]) +
+                 1.0 * (comboCards[:, 0] // numRanks == comboCards[:, 1] // numRanks) +
+                 2.0 * numpy.isin(ranks, list(boardRanks)).sum(axis=1) +
+                 0.5 * rng.randn(numHands))
+    table = 1.0 / (1.0 + numpy.exp(strengths[None, :] - strengths[:, None]))
+    # average over the board's suit symmetries; they form a group, so the result is invariant
+    known = set(c for c in board if c < numCards)
+    comboPerms = [getComboPerm(perm) for perm in suitPerms if set(permuteCards(list(known), perm)) == known]
+    symmetric = numpy.zeros_like(table)
+    for comboPerm in comboPerms:
+        symmetric += table[numpy.ix_(comboPerm, comboPerm)]
+    table = symmetric / len(comboPerms)
+    live = getLiveComboMask(board)
+    table[comboOverlap | ~live[:, None] | ~live[None, :]] = -1
+    return table.astype(numpy.float32)
+
+def installSyntheticEquityArray(board):
+    """
+    Input: board - list of 5 numbers describing a board
+    Output: the synthetic EquityArray for board
+    Side-effects: makes it the shared EquityArray for board, pinned so that the cache never
+                  evicts it (and so never rebuilds the real one from eqarray/ or by enumeration
+                  in its place).  Boards that are isomorphic get the same equities.
+    """
+    canonicalBoard = getCanonicalBoard(board)[0]
+    seed = zlib.crc32(bytes(bytearray(canonicalBoard)))
+    ea = EquityArray(list(board), packEquityTable(makeSyntheticEquityTable(canonicalBoard, seed)))
+    equityArrayCache.put(ea, pin=True)
+    return ea
+
+def makeSyntheticTree(size):
+    """
+    Input: size - one of treeSizes
+    Output: the Tree of treeSpecs[size], with synthetic EquityArrays on all its boards
+    Side-effects: installs the EquityArrays
+    """
+    spec = TreeSpec(20, turnBoard, pot=4, **treeSpecs[size])
+    boards = set()
+
+    def collect(player, sbCIP, bbCIP, board, parentAction, parent, isoDeals = None):
+        boards.add(tuple(board))
+
+    walkTree(spec, collect)
+    for board in boards:
+        installSyntheticEquityArray(list(board))
+    return buildTree(spec)
+
+### Timing ###
+
+def timeCalls(fn, repeat, number):
+    """
+    Inputs:
+      fn - function of no arguments
+      repeat - number of runs
+      number - calls of fn per run
+    Output: dict with repeat, number, and the min, median and mean seconds per call over the runs
+    Side-effects: calls fn repeat * number times
+    """
+    times = []
+    for r in range(repeat):
+        start = time.perf_counter()
+        for k in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {'repeat': repeat, 'number': number, 'min': min(times),
+            'median': float(numpy.median(times)), 'mean': float(numpy.mean(times))}
+
+def getBenchmarks(sizes):
+    """
+    Input: sizes - list of tree sizes to time doFPIteration on
+    Output: list of (name, setup) where setup() installs what the benchmark needs and returns
+            (fn, number, info): the function to time, calls per run, and a dict describing the inputs
+    """
+    def equityVsRange():
+        ea = installSyntheticEquityArray(riverBoard)
+        villainRange = Range(1.0)
+        villainRange.removeHandsWithConflicts(riverBoard)
+        hand = parseCards('AsKs')
+        return (lambda: getEquityVsRange(hand, villainRange, ea)), 100, {'board': 'AhKdQs2d6c'}
+
+    def handsSortedAndEquities():
+        installSyntheticEquityArray(riverBoard)
+        heroRange = Range(1.0)
+        villainRange = Range(0.5)
+        return (lambda: heroRange.getHandsSortedAndEquities(villainRange, riverBoard)), 10, {'board': 'AhKdQs2d6c'}
+
+    def setToTop():
+        installSyntheticEquityArray(riverBoard)
+        r = Range()
+        return (lambda: r.setToTop(0.3, riverBoard)), 100, {'board': 'AhKdQs2d6c', 'fraction': 0.3}
+
+    def eqDistn():
+        installSyntheticEquityArray(riverBoard)
+        r1 = Range(1.0)
+        r2 = Range(0.5)
+        return (lambda: plotEqDistn(r1, r2, riverBoard)), 10, {'board': 'AhKdQs2d6c'}
+
+    def shoveFoldGame():
+        installSyntheticEquityArray([255] * 5)
+        return (lambda: doShoveFoldGame(10, 200)), 1, {'S': 10, 'nIter': 200}
+
+    def fpIteration(size):
+        def setup():
+            tree = makeSyntheticTree(size)
+            sbStartingRange = Range(1.0)
+            sbStartingRange.removeHandsWithConflicts(turnBoard)
+            bbStartingRange = sbStartingRange.copy()
+            strats = StrategyPair(tree, sbStartingRange, bbStartingRange)
+            iteration = [0]
+
+            def iterate():
+                iteration[0] += 1
+                doFPIteration(tree, strats, iteration[0])
+            return iterate, 1, {'numPoints': tree.getNumPoints()}
+        return setup
+
+    benchmarks = [('getEquityVsRange', equityVsRange),
+                  ('getHandsSortedAndEquities', handsSortedAndEquities),
+                  ('setToTop', setToTop),
+                  ('plotEqDistn', eqDistn),
+                  ('doShoveFoldGame', shoveFoldGame)]
+    benchmarks += [('doFPIteration/' + size, fpIteration(size)) for size in sizes]
+    return benchmarks
+
+def getRunInfo():
+    """ Output: dict describing the commit, machine and library versions the benchmarks ran on """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': numpy.__version__, 'machine': platform.machine(), 'processor': platform.processor()}
+
+def runBenchmarks(repeat = 5, only = None, sizes = None):
+    """
+    Inputs:
+      repeat - number of runs of every benchmark
+      only - optional list of strings; only benchmarks whose name contains one of them are run
+      sizes - tree sizes for doFPIteration (default: all of treeSizes)
+    Output: dict with the run's info ('run', see getRunInfo) and, for every benchmark, its
+            timings and inputs ('benchmarks')
+    Side-effects: prints every benchmark's median time as it finishes
+    """
+    results = {}
+    for name, setup in getBenchmarks(treeSizes if sizes is None else sizes):
+        if only and not any(s in name for s in only):
+            continue
+        fn, number, info = setup()
+        fn() # warm up: unpack equity matrices, build rankings
+        timing = timeCalls(fn, repeat, number)
+        timing.update(info)
+        results[name] = timing
+        print("%-32s %12.6f s" % (name, timing['median']))
+        sys.stdout.flush()
+    equityArrayCache.clear()
+    return {'run': getRunInfo(), 'benchmarks': results}
+
+def compareResults(old, new, threshold = 1.1):
+    """
+    Inputs:
+      old, new - dicts returned by runBenchmarks (or loaded from their JSON)
+      threshold - ratio of median times above which a benchmark counts as slower
+    Output: list of the names of the benchmarks that got slower
+    Side-effects: prints the median times of the benchmarks in both and their ratios
+    """
+    slower = []
+    print("%-32s %12s %12s %8s" % ("benchmark", "old (s)", "new (s)", "ratio"))
+    for name in old['benchmarks']:
+        if name not in new['benchmarks']:
+            continue
+        oldTime = old['benchmarks'][name]['median']
+        newTime = new['benchmarks'][name]['median']
+        ratio = newTime / oldTime
+        flag = ""
+        if ratio > threshold:
+            slower.append(name)
+            flag = "  slower"
+        print("%-32s %12.6f %12.6f %8.2f%s" % (name, oldTime, newTime, ratio, flag))
+    return slower
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Time equity queries and solver iterations on synthetic inputs.")
+    parser.add_argument('--output', help="JSON file to write the results to")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of every benchmark (default: %(default)s)")
+    parser.add_argument('--only', help="comma-separated parts of the names of the benchmarks to run")
+    parser.add_argument('--sizes', default=','.join(treeSizes),
+                        help="comma-separated tree sizes for doFPIteration (default: %(default)s)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two JSON result files instead of running")
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help="ratio of median times that counts as slower, with --compare (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        return 1 if compareResults(old, new, args.threshold) else 0
+
+    sizes = [size for size in args.sizes.split(',') if size]
+    for size in sizes:
+        if size not in treeSpecs:
+            parser.error("unknown tree size %s, expected some of %s" % (size, ','.join(treeSizes)))
+    results = runBenchmarks(args.repeat, args.only.split(',') if args.only else None, sizes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
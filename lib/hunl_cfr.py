@@ -0,0 +1,295 @@
+"""
+Counterfactual regret minimization
+
+An alternative to fictitious play (hunl_fn.doFP) that solves the same Trees and returns the
+same StrategyPair.  Instead of mixing in a best response with weight 1/(n+2), every player
+keeps, for every hand at every one of his decision points, the regret of not having taken
+each action, and plays the actions in proportion to their positive regret ("regret
+matching").  The average of the strategies played converges to an equilibrium.
+
+Everything is done for all 1326 hands at once, as in the max expl EV code:
+  - reaches: for every point, the weight of every villain hand that gets there
+  - counterfactual values: for every point, the sum over villain hands of (villain reach) *
+    (hero's payoff), for every hero hand, found from the leaves up
+
+Two variants are implemented:
+  'cfr+': regrets are floored at 0 after every update, and iteration t's strategy counts t
+          times in the average
+  'dcfr': discounted CFR (alpha = 1.5, beta = 0, gamma = 2): positive regrets are scaled by
+          t^1.5 / (t^1.5 + 1) and negative ones halved before every update, and the average
+          is scaled by (t / (t + 1))^2
+Both update the players in turn (SB, then BB), as doFP does.
+"""
+import collections
+import numpy
+from lib.hunl_combos import numHands, getLiveComboMask, getUnblockedCounts
+from lib.hunl_fn import StrategyPair, Range, nodeTypeCodes, getExploitability, doFPIteration
+
+variants = ['cfr+', 'dcfr']
+
+class CFRSolver:
+    """
+    State of a CFR run on a tree:
+    tree: the Tree being solved
+    startingRanges: dict mapping "SB" and "BB" to their starting Ranges
+    variant: one of variants
+    iteration: number of iterations run so far
+    regrets: (tree size, numHands) array; regrets[i] is, for every hand, the cumulative regret of
+             the action leading to point i, for the player deciding at point i's parent
+    strategy: same shape; the current probability of taking the action leading to point i
+    strategySums: same shape; the (weighted) sum of the strategies played, with each
+                  iteration's strategy weighted by how often the player reaches the decision
+    All of them, and the reaches and counterfactual values of every iteration, are float32 like
+    the blocks of a StrategyPair (see getCFRSolverNumBytes).
+    """
+    def __init__(self, tree, sbStartingRange = None, bbStartingRange = None, variant = 'cfr+'):
+        if variant not in variants:
+            raise ValueError("Unknown CFR variant %s, expected one of %s" % (variant, variants))
+        self.tree = tree
+        self.variant = variant
+        self.iteration = 0
+        self.startingRanges = {'SB': sbStartingRange if sbStartingRange is not None else Range(1.0),
+                               'BB': bbStartingRange if bbStartingRange is not None else Range(1.0)}
+        size = tree.getNumPoints()
+        self.regrets = numpy.zeros((size, numHands), dtype=numpy.float32)
+        self.strategySums = numpy.zeros((size, numHands), dtype=numpy.float32)
+        self.strategy = numpy.zeros((size, numHands), dtype=numpy.float32)
+
+        # hands that don't conflict with every point's board, and what the leaves need
+        boardLive = {}
+        self.live = numpy.zeros((size, numHands), dtype=bool)
+        for i, point in enumerate(tree.decPts):
+            key = tuple(point.eArray.board)
+            if key not in boardLive:
+                boardLive[key] = getLiveComboMask(point.eArray.board)
+            self.live[i] = boardLive[key]
+        self.decisionPts = [i for i in range(size) if tree.decPts[i].player in ('SB', 'BB')]
+        # leaves only depend on the villain's reaches, so they are done all at once: folds
+        # together and showdowns grouped by board (one matrix product per board)
+        self.foldLeaves = numpy.array([i for i in range(size) if tree.decPts[i].player == 'Leaf'
+                                       and tree.decPts[i].parentAction == "fold"], dtype=numpy.int64)
+        showdowns = collections.OrderedDict()
+        for i in range(size):
+            point = tree.decPts[i]
+            if point.player == 'Leaf' and point.parentAction != "fold":
+                showdowns.setdefault(tuple(point.eArray.board), []).append(i)
+        self.showdownGroups = [numpy.array(leaves, dtype=numpy.int64) for leaves in showdowns.values()]
+        self.innerPostOrder = numpy.array([i for i in tree.postOrder if tree.decPts[i].player != 'Leaf'],
+                                          dtype=numpy.int64)
+        for i in self.decisionPts:
+            children = tree.children[i]
+            self.strategy[children] = 1.0 / len(children)
+
+    def getReaches(self, player):
+        """
+        Input: player: "SB" or "BB"
+        Output: (tree size, numHands) array of the weight of every one of player's hands that
+                gets to every point, playing the current strategy
+        """
+        reaches = numpy.empty((self.tree.getNumPoints(), numHands), dtype=numpy.float32)
+        reaches[0] = self.startingRanges[player].v * self.live[0]
+        playerCode = nodeTypeCodes[player]
+        playerCodes = self.tree.playerCodes
+        for i in self.tree.preOrder:
+            children = self.tree.children[i]
+            if not children:
+                continue
+            if playerCodes[i] == playerCode:
+                reaches[children] = reaches[i] * self.strategy[children]
+            else:
+                reaches[children] = reaches[i]
+        return reaches
+
+    def getCounterfactualValues(self, hero, villainReaches):
+        """
+        Inputs:
+          hero: "SB" or "BB"
+          villainReaches: getReaches(villain)
+        Output: (tree size, numHands) array of hero's counterfactual value of every hand at every point
+        """
+        tree = self.tree
+        S = tree.effStack
+        heroCode = nodeTypeCodes[hero]
+        villain = 'BB' if hero == 'SB' else 'SB'
+        playerCodes = tree.playerCodes
+        heroCIPs = tree.sbCIPs if hero == 'SB' else tree.bbCIPs
+        villainCIPs = tree.bbCIPs if hero == 'SB' else tree.sbCIPs
+        values = numpy.zeros((tree.getNumPoints(), numHands), dtype=numpy.float32)
+
+        leaves = self.foldLeaves
+        if len(leaves) > 0:
+            # with one column per leaf, the villain's combos that don't conflict with each hand
+            counts = getUnblockedCounts((villainReaches[leaves] * self.live[leaves]).T).T
+            heroFolded = playerCodes[tree.parentIndices[leaves]] == heroCode
+            payoffs = numpy.where(heroFolded, S - heroCIPs[leaves], S + villainCIPs[leaves])
+            values[leaves] = payoffs[:, None] * counts * self.live[leaves]
+        for leaves in self.showdownGroups:
+            villainReach = (villainReaches[leaves] * self.live[leaves]).T
+            counts = getUnblockedCounts(villainReach)
+            eqMatrix = tree.decPts[leaves[0]].eArray.getEquityMatrix()
+            eqSums = eqMatrix.dot(villainReach)
+            pots = heroCIPs[leaves] + villainCIPs[leaves]
+            values[leaves] = ((S - heroCIPs[leaves]) * counts + pots * eqSums).T * self.live[leaves]
+
+        for i in self.innerPostOrder:
+            point = tree.decPts[i]
+            children = tree.children[i]
+            if playerCodes[i] == heroCode:
+                values[i] = numpy.sum(self.strategy[children] * values[children], axis=0)
+            elif point.player == villain:
+                values[i] = numpy.sum(values[children], axis=0)
+            else: # Nature: weight every card by how often it can come, given both players' hands
+                # (a child standing for several isomorphic deals counts once for every one of
+                # them, with the hero's hands mapped to the ones they play like in the child)
+                freqs = []
+                childCounts = []
+                childValues = []
+                for c in children:
+                    for board, comboMap, freq in tree.decPts[c].getDeals():
+                        live = getLiveComboMask(board)
+                        freqs.append(freq)
+                        childCounts.append(getUnblockedCounts(villainReaches[c] * live) * live)
+                        childValues.append(values[c] if comboMap is None else values[c][comboMap])
+                freqs = numpy.array(freqs)[:, None]
+                total = numpy.sum(numpy.array(childCounts) * freqs, axis=0)
+                counts = getUnblockedCounts(villainReaches[i] * self.live[i])
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    values[i] = numpy.where(total > 0, numpy.sum(numpy.array(childValues) * freqs, axis=0) * counts / total, 0.0)
+        return values
+
+    def updatePlayer(self, hero):
+        """
+        Input: hero: "SB" or "BB"
+        Output: N/A
+        Side-effects: one CFR update of hero's regrets, strategy and average strategy
+        """
+        t = self.iteration
+        villain = 'BB' if hero == 'SB' else 'SB'
+        heroCode = nodeTypeCodes[hero]
+        heroReaches = self.getReaches(hero)
+        values = self.getCounterfactualValues(hero, self.getReaches(villain))
+        for i in self.decisionPts:
+            if self.tree.playerCodes[i] != heroCode:
+                continue
+            children = self.tree.children[i]
+            regrets = self.regrets[children]
+            strategy = self.strategy[children]
+            if self.variant == 'dcfr':
+                positive = t ** 1.5 / (t ** 1.5 + 1)
+                regrets = numpy.where(regrets > 0, regrets * positive, regrets * 0.5)
+                self.strategySums[children] *= (t / (t + 1.0)) ** 2
+                weight = 1.0
+            else:
+                weight = t
+            # the strategy that was played this iteration goes into the average
+            self.strategySums[children] += weight * heroReaches[i] * strategy
+            regrets += values[children] - values[i]
+            if self.variant == 'cfr+':
+                regrets = numpy.maximum(regrets, 0)
+            self.regrets[children] = regrets
+            # regret matching
+            positiveRegrets = numpy.maximum(regrets, 0)
+            total = numpy.sum(positiveRegrets, axis=0)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                self.strategy[children] = numpy.where(total > 0, positiveRegrets / total, 1.0 / len(children))
+
+    def doIteration(self):
+        """
+        Output: N/A
+        Side-effects: runs one iteration, updating the SB and then the BB
+        """
+        self.iteration += 1
+        self.updatePlayer('SB')
+        self.updatePlayer('BB')
+
+    def getStrategyPair(self):
+        """
+        Output: a StrategyPair holding the average strategies played so far, as ranges: the
+                range for point i is the part of the acting player's starting range that takes
+                the action leading to point i
+        """
+        tree = self.tree
+        strats = StrategyPair(tree, self.startingRanges['SB'], self.startingRanges['BB'])
+        reaches = {'SB': self.startingRanges['SB'].v.copy(), 'BB': self.startingRanges['BB'].v.copy()}
+        currReaches = {0: reaches}
+        for i in tree.preOrder:
+            children = tree.children[i]
+            player = tree.decPts[i].player
+            if player not in ('SB', 'BB'):
+                for iChild in children:
+                    currReaches[iChild] = currReaches[i]
+                continue
+            sums = self.strategySums[children]
+            total = numpy.sum(sums, axis=0)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                avgStrategy = numpy.where(total > 0, sums / total, 1.0 / len(children))
+            for k, iChild in enumerate(children):
+                strats.ranges[iChild].v = currReaches[i][player] * avgStrategy[k]
+                strats.ranges[iChild].removeHandsWithConflicts(tree.decPts[i].eArray.board)
+                childReaches = dict(currReaches[i])
+                childReaches[player] = strats.ranges[iChild].v
+                currReaches[iChild] = childReaches
+        return strats
+
+def getCFRSolverNumBytes(numPoints):
+    """
+    Input: numPoints - number of decision points in a tree
+    Output: number of bytes a CFRSolver on such a tree needs at its peak: its regrets,
+            strategies, strategy sums and live hands, plus the two players' reaches and the
+            counterfactual values of an update
+    Side-effects: N/A
+    """
+    stateBytes = 3 * numPoints * numHands * 4 + numPoints * numHands # float32 blocks and the bool live block
+    updateBytes = 3 * numPoints * numHands * 4 # reaches of both players and values, float32
+    return stateBytes + updateBytes
+
+def doCFR(tree, nIter, sbStartingRange = None, bbStartingRange = None, variant = 'cfr+', checkEvery = None):
+    """
+    Inputs:
+      tree: a Tree that we are going to solve
+      nIter: number of iterations to run for
+      sbStartingRange and bbStartingRange: optional, Range objects
+      variant: 'cfr+' or 'dcfr'
+      checkEvery: optional; measure the exploitability of the average strategies every
+                  checkEvery iterations
+    Output: a StrategyPair holding the average strategies, with its evs set to both players'
+            max expl EVs.  Its convergence attribute lists (iteration, exploitability in BB)
+            for every check (and always for the last iteration).
+    Side-effects: N/A
+    """
+    solver = CFRSolver(tree, sbStartingRange, bbStartingRange, variant)
+    convergence = []
+    for i in range(1, nIter+1):
+        solver.doIteration()
+        if checkEvery and i % checkEvery == 0 and i != nIter:
+            convergence.append((i, getExploitability(tree, solver.getStrategyPair())))
+    strats = solver.getStrategyPair()
+    convergence.append((nIter, getExploitability(tree, strats)))
+    strats.convergence = convergence
+    return strats
+
+def compareConvergence(tree, nIter, checkEvery = 10, sbStartingRange = None, bbStartingRange = None):
+    """
+    Inputs:
+      tree: a Tree
+      nIter: number of iterations to run every engine for
+      checkEvery: number of iterations between exploitability measurements
+      sbStartingRange and bbStartingRange: optional, Range objects
+    Output: dict mapping 'fp', 'cfr+' and 'dcfr' to lists of (iteration, exploitability in BB)
+    Side-effects: prints the exploitability of the engines side by side.  Every iteration of
+                  every engine is two passes over the tree (one per player).
+    """
+    results = {}
+    strats = StrategyPair(tree, sbStartingRange, bbStartingRange)
+    results['fp'] = []
+    for i in range(1, nIter+1):
+        doFPIteration(tree, strats, i)
+        if i % checkEvery == 0 or i == nIter:
+            results['fp'].append((i, getExploitability(tree, strats)))
+    for variant in variants:
+        results[variant] = doCFR(tree, nIter, sbStartingRange, bbStartingRange, variant, checkEvery).convergence
+
+    print("%10s %12s %12s %12s" % ('iteration', 'fp', 'cfr+', 'dcfr'))
+    for k, (i, fpExpl) in enumerate(results['fp']):
+        print("%10d %12.5f %12.5f %12.5f" % (i, fpExpl, results['cfr+'][k][1], results['dcfr'][k][1]))
+    return results
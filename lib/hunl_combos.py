@@ -0,0 +1,86 @@
+"""
+Hand combo indexing
+
+The 1326 two-card combos are numbered in the same order the rest of the code walks them,
+    for i in range(numCards):
+        for j in range(i+1, numCards):
+so combo 0 is [0, 1] (2h 3h) and combo 1325 is [50, 51] (Ks As).
+"""
+import numpy
+
+numCards = 52
+numHands = 1326 # nchoosek(52,2)
+
+# cardStrings[c] is the name of card c, in the same order as hunl_fn.cards ('2h' ... 'As')
+cardStrings = [r + s for s in 'hdcs' for r in '23456789TJQKA']
+
+# comboCards[k] is the pair of cards [i, j] (i < j) of combo k
+comboCards = numpy.array([[i, j] for i in range(numCards) for j in range(i+1, numCards)],
+                         dtype=numpy.int32)
+
+# comboIndex[i][j] (and comboIndex[j][i]) is the combo number of the hand [i, j], -1 if i == j
+comboIndex = numpy.full((numCards, numCards), -1, dtype=numpy.int32)
+comboIndex[comboCards[:, 0], comboCards[:, 1]] = numpy.arange(numHands)
+comboIndex[comboCards[:, 1], comboCards[:, 0]] = numpy.arange(numHands)
+
+def getComboIndex(hand):
+    """
+    Input: hand - list of two card numbers
+    Output: the combo number of hand
+    Side-effects: N/A
+    """
+    return int(comboIndex[hand[0]][hand[1]])
+
+### Blocker index ###
+
+# cardComboMask[c] is True for the combos that contain card c
+cardComboMask = numpy.zeros((numCards, numHands), dtype=bool)
+cardComboMask[comboCards[:, 0], numpy.arange(numHands)] = True
+cardComboMask[comboCards[:, 1], numpy.arange(numHands)] = True
+
+# comboOverlap[a][b] is True when combos a and b share a card (including a == b)
+comboOverlap = cardComboMask[comboCards[:, 0]] | cardComboMask[comboCards[:, 1]]
+
+def getCardBits(cardslist):
+    """
+    Input: cardslist - list of card numbers (cards equal to 255 are ignored)
+    Output: integer with bit c set for every card c in cardslist
+    Side-effects: N/A
+    """
+    bits = 0
+    for c in cardslist:
+        if c < numCards:
+            bits |= 1 << int(c)
+    return bits
+
+def getLiveComboMask(cardslist):
+    """
+    Input: cardslist - list of card numbers (cards equal to 255 are ignored)
+    Output: boolean array of length numHands, True for the combos containing none of cardslist
+    Side-effects: N/A
+    """
+    dead = [c for c in cardslist if c < numCards]
+    return ~cardComboMask[dead].any(axis=0)
+
+def getUnblockedCounts(v):
+    """
+    Input: v - array of length numHands of combo weights (e.g. Range.v), or a numHands x k
+               array holding k such weight vectors as columns
+    Output: array shaped like v: for every combo h, the total weight of v on the combos
+            that share no card with h (the same as (~comboOverlap).dot(v), in O(numHands))
+    Side-effects: N/A
+    """
+    # weight on combos containing each card; a combo sharing both cards with h is h itself
+    if v.ndim == 1:
+        cardSums = numpy.bincount(comboCards[:, 0], v, numCards) + numpy.bincount(comboCards[:, 1], v, numCards)
+    else:
+        cardSums = cardComboMask.astype(v.dtype).dot(v)
+    return numpy.sum(v, axis=0) - cardSums[comboCards[:, 0]] - cardSums[comboCards[:, 1]] + v
+
+def parseCards(cardsStr):
+    """
+    Input: cardsStr - cards run together in one string, e.g. 'AhKd2c'
+    Output: list of card numbers
+    Side-effects: N/A
+    """
+    return [cardStrings.index(cardsStr[i:i+2]) for i in range(0, len(cardsStr), 2)]
@@ -0,0 +1,280 @@
+"""
+Exact hand vs hand equity tables
+
+An equity table for a board is a numHands x numHands float32 matrix whose entry [a, b] is the
+all-in equity of combo a against combo b on that board (combos numbered as in hunl_combos),
+or -1 if a, b and the board conflict.
+
+Rather than running a Monte Carlo simulation per matchup, the builder enumerates every
+runout of the board exactly once.  For each runout it ranks every live combo in one batched
+call to the evaluator, and then scores all matchups for that runout at once from those
+ranks, so each showdown is evaluated once and shared by every matchup that needs it.
+"""
+import os
+import numpy
+from scipy.special import comb
+from lib.hunl_eval import evalHands, getRunouts
+from lib.hunl_combos import numCards, numHands, cardStrings, comboCards, getLiveComboMask, getUnblockedCounts
+
+# Approximate number of hands ranked per call to the evaluator
+builderBatchSize = 1 << 18
+
+class EquityTableBuilder:
+    """
+    Builds the equity table of a board incrementally:
+      builder = EquityTableBuilder(board)
+      while not builder.isDone():
+          builder.addRunouts(100)
+      table = builder.getTable()
+    The state between calls is just the index of the next runout and the running sum, over
+    runouts seen so far, of sign(rank of a - rank of b) for every pair of live combos.
+    """
+    def __init__(self, board):
+        """
+        Input: board - list of 5 numbers describing a board (255 for cards not yet dealt);
+                       at least the flop must be known
+        """
+        self.board = list(board)
+        self.known = [c for c in self.board if c < numCards]
+        if len(self.known) < 3:
+            raise ValueError("EquityTableBuilder needs at least a flop, got board %s" % (self.board,))
+        self.nMissing = 5 - len(self.known)
+        self.runouts = getRunouts(self.known, self.nMissing)
+        self.liveCombos = numpy.nonzero(getLiveComboMask(self.known))[0]
+        self.liveCards = comboCards[self.liveCombos]
+        # liveHasCard[c] is 1 for the live combos that contain card c
+        self.liveHasCard = numpy.zeros((numCards, len(self.liveCombos)), dtype=numpy.int32)
+        self.liveHasCard[self.liveCards[:, 0], numpy.arange(len(self.liveCombos))] = 1
+        self.liveHasCard[self.liveCards[:, 1], numpy.arange(len(self.liveCombos))] = 1
+        self.nextRunout = 0
+        self.signSum = numpy.zeros((len(self.liveCombos), len(self.liveCombos)), dtype=numpy.int32)
+
+    def getNumRunouts(self):
+        """ Output: total number of runouts that have to be enumerated """
+        return len(self.runouts)
+
+    def isDone(self):
+        """ Output: True once every runout has been added """
+        return self.nextRunout >= len(self.runouts)
+
+    def addRunouts(self, n):
+        """
+        Input: n - maximum number of runouts to process
+        Output: N/A
+        Side-effects: scores every matchup on the next n runouts and adds them to the running sums
+        """
+        runouts = self.runouts[self.nextRunout:self.nextRunout + n]
+        nLive = len(self.liveCombos)
+        perBatch = max(1, builderBatchSize // nLive)
+        for start in range(0, len(runouts), perBatch):
+            chunk = runouts[start:start + perBatch]
+            boards = numpy.hstack([numpy.tile(numpy.array(self.known, dtype=numpy.int32), (len(chunk), 1)),
+                                   chunk])
+            # rank every (runout, live combo) showdown once
+            hands = numpy.concatenate([numpy.repeat(self.liveCards[None, :, :], len(chunk), axis=0),
+                                       numpy.repeat(boards[:, None, :], nLive, axis=1)], axis=2)
+            values = evalHands(hands.reshape(-1, 7)).reshape(len(chunk), nLive)
+            for r in range(len(chunk)):
+                valid = (self.liveHasCard[chunk[r]].sum(axis=0) == 0).astype(numpy.int32)
+                v = values[r]
+                signs = numpy.sign(numpy.subtract.outer(v, v))
+                signs *= valid[:, None]
+                signs *= valid[None, :]
+                self.signSum += signs
+        self.nextRunout += len(runouts)
+
+    def saveCheckpoint(self, path):
+        """
+        Input: path - file to write
+        Output: N/A
+        Side-effects: atomically writes the builder's progress (next runout and running sums) to path
+        """
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            numpy.savez(f, board=numpy.array(self.board), nextRunout=self.nextRunout, signSum=self.signSum)
+        os.replace(tmpPath, path)
+
+    def loadCheckpoint(self, path):
+        """
+        Input: path - a file written by saveCheckpoint for the same board
+        Output: N/A
+        Side-effects: restores the builder's progress from path
+        """
+        with numpy.load(path) as data:
+            if list(data['board']) != self.board:
+                raise ValueError("Checkpoint %s is for board %s, not %s" % (path, list(data['board']), self.board))
+            self.nextRunout = int(data['nextRunout'])
+            self.signSum = data['signSum']
+
+    def getTable(self):
+        """
+        Output: the finished numHands x numHands float32 equity table
+        Side-effects: N/A
+        """
+        if not self.isDone():
+            raise RuntimeError("EquityTableBuilder.getTable called with runouts left to add")
+        # every non-conflicting matchup sees the same number of runouts
+        nRunouts = comb(numCards - len(self.known) - 4, self.nMissing, exact=True)
+        liveTable = 0.5 + 0.5 * self.signSum.astype(numpy.float64) / nRunouts
+        cards = self.liveCards
+        overlap = ((cards[:, 0, None] == cards[None, :, 0]) | (cards[:, 0, None] == cards[None, :, 1]) |
+                   (cards[:, 1, None] == cards[None, :, 0]) | (cards[:, 1, None] == cards[None, :, 1]))
+        liveTable[overlap] = -1
+        table = numpy.full((numHands, numHands), -1, dtype=numpy.float32)
+        table[numpy.ix_(self.liveCombos, self.liveCombos)] = liveTable
+        return table
+
+def buildEquityTable(board):
+    """
+    Input: board - list of 5 numbers describing a board, at least the flop known
+    Output: the board's numHands x numHands equity table (see the module docstring)
+    Side-effects: N/A
+    """
+    builder = EquityTableBuilder(board)
+    builder.addRunouts(builder.getNumRunouts())
+    return builder.getTable()
+
+### Compact storage ###
+
+# On disk and in memory an equity table is stored as one triangle of the matrix: for every
+# pair of combos a < b, the equity of a vs b quantized to a uint16 (eq(b, a) is 1 - eq(a, b)).
+# Matchups where a, b and the board conflict are stored as EQ_NONE.  That is numHands *
+# (numHands - 1) / 2 entries, about 1.7 MB per board.
+EQ_SCALE = 65534
+EQ_NONE = 65535
+numPairs = numHands * (numHands - 1) // 2
+
+def getPairIndex(a, b):
+    """
+    Input: a, b - combo numbers (or arrays of them), a != b
+    Output: position of the matchup in the packed triangle (works elementwise on arrays)
+    Side-effects: N/A
+    """
+    lo = numpy.minimum(a, b)
+    hi = numpy.maximum(a, b)
+    return lo * numHands - lo * (lo + 1) // 2 + hi - lo - 1
+
+def packEquityTable(table):
+    """
+    Input: table - a numHands x numHands equity table (-1 marking conflicts)
+    Output: the packed uint16 triangle of table (see above)
+    Side-effects: N/A
+    """
+    rows, cols = numpy.triu_indices(numHands, 1)
+    eqs = table[rows, cols]
+    packed = numpy.round(numpy.clip(eqs, 0, 1) * EQ_SCALE).astype(numpy.uint16)
+    packed[eqs < 0] = EQ_NONE
+    return packed
+
+def unpackEquityTable(packed):
+    """
+    Input: packed - a packed uint16 triangle
+    Output: the full numHands x numHands float32 equity table, -1 marking conflicts
+    Side-effects: N/A
+    """
+    rows, cols = numpy.triu_indices(numHands, 1)
+    packed = numpy.asarray(packed)
+    none = packed == EQ_NONE
+    eqs = packed.astype(numpy.float32) / EQ_SCALE
+    table = numpy.full((numHands, numHands), -1, dtype=numpy.float32)
+    table[rows, cols] = numpy.where(none, -1, eqs)
+    table[cols, rows] = numpy.where(none, -1, 1 - eqs)
+    return table
+
+def getPackedEquityRow(packed, a):
+    """
+    Input:
+      packed - a packed uint16 triangle
+      a - a combo number
+    Output: float32 array of length numHands: the equity of combo a against every combo, -1 marking conflicts
+    Side-effects: N/A
+    """
+    b = numpy.arange(numHands)
+    q = numpy.asarray(packed[getPairIndex(a, numpy.where(b == a, (a + 1) % numHands, b))])
+    eqs = q.astype(numpy.float32) / EQ_SCALE
+    eqs = numpy.where(b < a, 1 - eqs, eqs)
+    eqs[(q == EQ_NONE) | (b == a)] = -1
+    return eqs
+
+def getPackedEquity(packed, a, b):
+    """
+    Input:
+      packed - a packed uint16 triangle
+      a, b - combo numbers
+    Output: equity of combo a vs combo b, -1 if they conflict with each other or the board
+    Side-effects: N/A
+    """
+    if a == b:
+        return -1.0
+    q = int(packed[getPairIndex(a, b)])
+    if q == EQ_NONE:
+        return -1.0
+    eq = q / float(EQ_SCALE)
+    return eq if a < b else 1 - eq
+
+### Hand strength ranking ###
+
+def rankHands(table, board):
+    """
+    Input:
+      table - the board's numHands x numHands equity table
+      board - list of numbers representing the board
+    Output: int16 array of the combo numbers of every hand that doesn't conflict with board,
+            sorted by equity vs any two cards (highest first)
+    Side-effects: N/A
+    """
+    live = getLiveComboMask(board)
+    anyTwo = live.astype(numpy.float64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        eqs = numpy.maximum(table, 0).dot(anyTwo) / getUnblockedCounts(anyTwo)
+    combos = numpy.nonzero(live)[0]
+    return combos[numpy.argsort(-eqs[combos], kind='stable')].astype(numpy.int16)
+
+### Files ###
+
+# Directory holding the equity files
+equityDir = 'eqarray'
+
+def getBoardString(board):
+    """
+    Input: board - list of numbers representing a board
+    Output: the board's cards as one string, e.g. 'AhJd2c', or 'preflop' for the empty board
+    Side-effects: N/A
+    """
+    boardStr = ''.join(cardStrings[c] for c in board if c < numCards)
+    if boardStr == '': #this is the case when we have the preflop board
+        boardStr = 'preflop'
+    return boardStr
+
+def getEquityFilename(board):
+    """
+    Input: board - list of numbers representing a (canonical) board
+    Output: name of the board's compact equity file, e.g. 'AhJd2c.ea16.npy'
+    Side-effects: N/A
+    """
+    return getBoardString(board) + '.ea16.npy'
+
+def getRankingFilename(board):
+    """
+    Input: board - list of numbers representing a (canonical) board
+    Output: name of the file holding the board's hand ranking (see rankHands), e.g. 'AhJd2c.rank.npy'
+    Side-effects: N/A
+    """
+    return getBoardString(board) + '.rank.npy'
+
+def saveArrayAtomic(path, array):
+    """
+    Input:
+      path - .npy file to write
+      array - numpy array
+    Output: N/A
+    Side-effects: writes array to path via a temporary file, so that readers (and a run that
+                  is killed part way through) never see a partially written file
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        numpy.save(f, array)
+    os.replace(tmpPath, path)
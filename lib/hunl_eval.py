@@ -0,0 +1,191 @@
+"""
+Vectorized, table-driven hand evaluator
+
+Cards use the same numbering as hunl_fn.cards: card c has rank c % 13 (0 is a deuce,
+12 is an ace) and suit c // 13.  A hand value is a non-negative integer; higher values
+are better hands and equal values split the pot.  Values are laid out as
+
+    (category << 20) | (5 ranks packed 4 bits each, most significant first)
+
+so hands can be compared with ordinary integer comparison, and handCategory() recovers
+the category (HIGH_CARD ... STRAIGHT_FLUSH).
+
+All of the per-hand work is done on whole NumPy arrays, using lookup tables indexed by
+13-bit rank masks (one bit per rank), so ranking thousands of hands costs a handful of
+array operations rather than a Python loop per hand.
+"""
+import itertools
+import numpy
+
+numCards = 52
+numRanks = 13
+numSuits = 4
+
+# Hand categories
+HIGH_CARD = 0
+PAIR = 1
+TWO_PAIR = 2
+TRIPS = 3
+STRAIGHT = 4
+FLUSH = 5
+FULL_HOUSE = 6
+QUADS = 7
+STRAIGHT_FLUSH = 8
+categoryNames = ['high card', 'pair', 'two pair', 'three of a kind', 'straight',
+                 'flush', 'full house', 'four of a kind', 'straight flush']
+
+# Number of hands ranked per batch by evalHands
+evalBatchSize = 1 << 18
+
+### Lookup tables indexed by 13-bit rank masks ###
+
+def _makeRankTables():
+    """
+    Input: N/A
+    Output: (popCount, highBit, topFive, straightHigh) -- arrays of length 2^13 giving, for
+            every rank mask, the number of ranks set, the highest rank set, the highest five
+            ranks packed 4 bits each (most significant first), and the high card of the best
+            straight contained in the mask (-1 if there is none)
+    Side-effects: N/A
+    """
+    masks = numpy.arange(1 << numRanks, dtype=numpy.int32)
+    popCount = numpy.zeros(len(masks), dtype=numpy.int32)
+    topFive = numpy.zeros(len(masks), dtype=numpy.int32)
+    for r in range(numRanks - 1, -1, -1):
+        has = ((masks >> r) & 1).astype(bool) & (popCount < 5)
+        topFive[has] |= r << (4 * (4 - popCount[has]))
+        popCount += (masks >> r) & 1
+    highBit = topFive >> 16
+
+    straightHigh = numpy.full(len(masks), -1, dtype=numpy.int32)
+    wheel = (1 << 12) | 0xF # A2345
+    straightHigh[(masks & wheel) == wheel] = 3
+    for r in range(4, numRanks): # later (higher) straights overwrite lower ones
+        pattern = 0x1F << (r - 4)
+        straightHigh[(masks & pattern) == pattern] = r
+    return popCount, highBit, topFive, straightHigh
+
+_popCount, _highBit, _topFive, _straightHigh = _makeRankTables()
+_rankWeights = (1 << numpy.arange(numRanks)).astype(numpy.int32)
+
+### Evaluation ###
+
+def _evalBatch(hands):
+    """ evalHands() for a single batch """
+    n, k = hands.shape
+    rows = numpy.arange(n)
+    ranks = hands % numRanks
+    suits = hands // numRanks
+    rankBits = (1 << ranks).astype(numpy.int32)
+
+    counts = numpy.zeros((n, numRanks), dtype=numpy.int8)
+    suitMasks = numpy.zeros((n, numSuits), dtype=numpy.int32)
+    for col in range(k):
+        counts[rows, ranks[:, col]] += 1
+        suitMasks[rows, suits[:, col]] |= rankBits[:, col]
+
+    rankMask = (counts > 0).astype(numpy.int32).dot(_rankWeights)
+    pairMask = (counts == 2).astype(numpy.int32).dot(_rankWeights)
+    tripMask = (counts == 3).astype(numpy.int32).dot(_rankWeights)
+    quadMask = (counts == 4).astype(numpy.int32).dot(_rankWeights)
+    flushMask = numpy.where(_popCount[suitMasks] >= 5, suitMasks, 0).max(axis=1)
+
+    straightFlushHigh = _straightHigh[flushMask]
+    straightHigh = _straightHigh[rankMask]
+
+    quad = _highBit[quadMask]
+    quadKicker = _highBit[rankMask & ~(1 << quad)]
+    trip = _highBit[tripMask]
+    tripBit = 1 << trip
+    fullHousePairMask = (tripMask & ~tripBit) | pairMask
+    pair1 = _highBit[pairMask]
+    pair2 = _highBit[pairMask & ~(1 << pair1)]
+    twoPairKicker = _highBit[rankMask & ~(1 << pair1) & ~(1 << pair2)]
+
+    conditions = [straightFlushHigh >= 0,
+                  quadMask != 0,
+                  (tripMask != 0) & (fullHousePairMask != 0),
+                  flushMask != 0,
+                  straightHigh >= 0,
+                  tripMask != 0,
+                  _popCount[pairMask] >= 2,
+                  pairMask != 0]
+    values = [(STRAIGHT_FLUSH << 20) | (straightFlushHigh << 16),
+              (QUADS << 20) | (quad << 16) | (quadKicker << 12),
+              (FULL_HOUSE << 20) | (trip << 16) | (_highBit[fullHousePairMask] << 12),
+              (FLUSH << 20) | _topFive[flushMask],
+              (STRAIGHT << 20) | (straightHigh << 16),
+              (TRIPS << 20) | (trip << 16) | ((_topFive[rankMask & ~tripBit] >> 12) << 8),
+              (TWO_PAIR << 20) | (pair1 << 16) | (pair2 << 12) | (twoPairKicker << 8),
+              (PAIR << 20) | (pair1 << 16) | ((_topFive[rankMask & ~(1 << pair1)] >> 8) << 4)]
+    return numpy.select(conditions, values, default=_topFive[rankMask]).astype(numpy.int32)
+
+def evalHands(hands):
+    """
+    Input: hands - array-like of shape (n, k) of card numbers, 5 <= k <= 7, where each row is
+                   one player's hole cards plus the board (no empty cards, no duplicates)
+    Output: numpy int32 array of length n holding the value of each row's best 5-card hand
+    Side-effects: N/A
+    """
+    hands = numpy.asarray(hands, dtype=numpy.int32)
+    if hands.ndim == 1:
+        hands = hands.reshape(1, -1)
+    result = numpy.empty(len(hands), dtype=numpy.int32)
+    for start in range(0, len(hands), evalBatchSize):
+        result[start:start + evalBatchSize] = _evalBatch(hands[start:start + evalBatchSize])
+    return result
+
+def evalHand(cardsList):
+    """
+    Input: cardsList - list of 5 to 7 card numbers
+    Output: value of the best 5-card hand (see the module docstring)
+    Side-effects: N/A
+    """
+    return int(evalHands([cardsList])[0])
+
+def handCategory(value):
+    """
+    Input: value - a hand value (or array of them) returned by evalHand(s)
+    Output: the hand category, e.g. FLUSH; works elementwise on arrays
+    Side-effects: N/A
+    """
+    return value >> 20
+
+### Runouts and hand vs hand equity ###
+
+def getRunouts(deadCards, nCards):
+    """
+    Input:
+      deadCards - list of card numbers that cannot be dealt (cards equal to 255 are ignored)
+      nCards - how many more board cards are to be dealt
+    Output: int32 array of shape (number of runouts, nCards) listing every set of nCards cards
+            that can still come, each exactly once
+    Side-effects: N/A
+    """
+    dead = set(c for c in deadCards if c < numCards)
+    deck = [c for c in range(numCards) if c not in dead]
+    runouts = list(itertools.combinations(deck, nCards))
+    return numpy.array(runouts, dtype=numpy.int32).reshape(len(runouts), nCards)
+
+def getEquityVsHand(hand, villainHand, board):
+    """
+    Input:
+      hand and villainHand - lists of two card numbers
+      board - list of 5 card numbers, 255 for cards not yet dealt
+    Output: exact all-in equity of hand vs villainHand on board, enumerating every runout
+            -1 if any of hand, villainHand and board conflict
+    Side-effects: N/A
+    """
+    known = [c for c in board if c < numCards]
+    allCards = list(hand) + list(villainHand) + known
+    if len(set(allCards)) != len(allCards):
+        return -1
+    runouts = getRunouts(allCards, 5 - len(known))
+    heroSum = 0.0
+    for start in range(0, len(runouts), evalBatchSize):
+        chunk = runouts[start:start + evalBatchSize]
+        boards = numpy.hstack([numpy.tile(known, (len(chunk), 1)).astype(numpy.int32), chunk])
+        heroValues = evalHands(numpy.hstack([numpy.tile(hand, (len(chunk), 1)), boards]))
+        villValues = evalHands(numpy.hstack([numpy.tile(villainHand, (len(chunk), 1)), boards]))
+        heroSum += numpy.sum(heroValues > villValues) + 0.5 * numpy.sum(heroValues == villValues)
+    return heroSum / len(runouts)
@@ -1,13 +1,17 @@
 import os
-import sys
-import rayeval as re
-import scipy.misc
-import pydot
+import collections
+import time
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import scipy.special
 import numpy
-import matplotlib
-matplotlib.use('Qt5Agg')
-from matplotlib import pylab, mlab, pyplot
-from pylab import *
+from lib.hunl_combos import comboCards, comboIndex, getCardBits, getLiveComboMask, getUnblockedCounts
+from lib.hunl_equity import buildEquityTable, packEquityTable, unpackEquityTable, getPackedEquity, getPackedEquityRow, \
+    rankHands, getBoardString, getEquityFilename, getRankingFilename, saveArrayAtomic
+from lib.hunl_iso import getCanonicalBoard, getComboPerm, permuteCards, suitPerms, identityPerm
+from lib.hunl_profile import timed
+from lib.hunl_pushfold import getStackGrid, solveShoveFold, buildShoveFoldCharts, loadShoveFoldCharts, chartsFilename
 
 # Define some useful constants
 numCards = 52
@@ -46,55 +50,264 @@ def pe_card2string(cards_inp):
 
 def conflicts(cards1, cards2):
     """ Test of hand conflicts with other hand, or board """
-    for i in cards1:
-        for j in cards2:
-            if i == j and i < numCards:
-                return True
-    return False
+    return (getCardBits(cards1) & getCardBits(cards2)) != 0
 
 ### Set up EquityArray class ###
 class EquityArray:
     """
+    Hand vs hand equities on a board, for every pair of hand combos
+    The data:
+      eqs - the packed uint16 triangle described in lib/hunl_equity.py; entry
+            getPairIndex(a, b) holds the equity of combo a vs combo b for a < b, and the
+            equity of b vs a is 1 minus that
+      Boards that only differ by a relabelling of suits share one stored array (see
+      lib/hunl_iso.py): eqs is kept for canonicalBoard, and every lookup maps the hands on
+      self.board to canonicalBoard through comboPerm first.
     Constructor
     Input:
     b - list of numbers representing a board
+    eqs - optional packed triangle for the canonical board to use instead of the board's file
+          (e.g. a synthetic one); nothing is then read from or written to eqarray/
     """
-    def __init__(self, b):
+    def __init__(self, b, eqs = None):
         self.board = b
-        self.eArray = numpy.zeros((numCards,numCards,numCards,numCards))
+        self.canonicalBoard, self.suitPerm = getCanonicalBoard(b)
+        self.comboPerm = getComboPerm(self.suitPerm)
+        self.eqs = eqs
+        self.inMemory = eqs is not None
+        self.eqMatrix = None
+        self.handRanking = None
+        self.lock = threading.Lock() # held while eqMatrix or handRanking is being made
+        self.cache = None # the EquityArrayCache holding this array, told when it grows
+        if self.inMemory:
+            return
         if os.path.isfile('eqarray/' + self.getFilename()):
-            self.eArray = numpy.load('eqarray/' + self.getFilename())
+            # memory-map the file, so only the pages we actually read are loaded
+            self.eqs = numpy.load('eqarray/' + self.getFilename(), mmap_mode='r')
+        elif os.path.isfile('eqarray/' + self.getLegacyFilename()):
+            self.convertLegacyArray()
         else:
             self.makeArray()
 
     def makeArray(self):
         """
-        Until we figure out a way to computer this faster, only load from
-        EquityArrays created from Ubuntu instance
+        Build the equity array by exact enumeration of the board's runouts (see
+        lib/hunl_equity.py) and save it to eqarray/.  Preflop has far too many runouts
+        for that, so the preflop array still has to be supplied (ValueError if it isn't).
         """
-        print("ERROR! Cannot make new EquityArrays on this system")
-        sys.exit()
+        if len([c for c in self.board if c < numCards]) < 3:
+            raise ValueError("Cannot make preflop EquityArrays by exact enumeration: eqarray/%s is missing"
+                             % self.getFilename())
+        self.eqs = packEquityTable(buildEquityTable(self.canonicalBoard))
+        self.save()
 
-    # Output: filename built from self.board
-    # For example, if card2string(self.board) == ['Ah', 'Jd', '2c', '__','__']
-    # then x return 'AhJd2c.ea.npy'.
+    def convertLegacyArray(self):
+        """
+        Load an old-style numCards^4 float64 equity array (.ea.npy) for self.board and save it
+        in the compact format for the canonical board, so that later loads use the compact file
+        """
+        eArray = numpy.load('eqarray/' + self.getLegacyFilename())
+        # canonical combo comboPerm[a] is combo a on self.board
+        fromCanonical = numpy.argsort(self.comboPerm)
+        c1 = comboCards[fromCanonical, 0]
+        c2 = comboCards[fromCanonical, 1]
+        self.eqs = packEquityTable(eArray[c1[:, None], c2[:, None], c1[None, :], c2[None, :]])
+        self.save()
+
+    def save(self):
+        """ Write the compact equity array to eqarray/ """
+        saveArrayAtomic('eqarray/' + self.getFilename(), self.eqs)
+        self.eqs = numpy.load('eqarray/' + self.getFilename(), mmap_mode='r')
+
+    def getNumBytes(self):
+        """
+        Output: number of bytes of equity data this EquityArray keeps in memory: the unpacked
+                matrix and ranking, and eqs unless it is memory-mapped from its file (its
+                pages are then only read in as needed, and can be dropped by the OS)
+        """
+        numBytes = 0 if isinstance(self.eqs, numpy.memmap) else self.eqs.nbytes
+        if self.eqMatrix is not None:
+            numBytes += self.eqMatrix.nbytes
+        if self.handRanking is not None:
+            numBytes += self.handRanking.nbytes
+        return numBytes
+
+    def getEquityMatrix(self):
+        """
+        Output: numHands x numHands float32 matrix whose [a, b] entry is the equity of combo a
+                vs combo b on self.board, with 0 for matchups that conflict.  It is unpacked on
+                first use and kept, so that whole-range equities are one matrix product.
+                Threads sharing the array unpack it once.
+        """
+        if self.eqMatrix is None:
+            with self.lock:
+                if self.eqMatrix is None:
+                    eqMatrix = unpackEquityTable(self.eqs)[numpy.ix_(self.comboPerm, self.comboPerm)]
+                    self.eqMatrix = numpy.maximum(eqMatrix, 0)
+            if self.cache is not None:
+                self.cache.fitToBudget()
+        return self.eqMatrix
+
+    def getEquity(self, hand, villainHand):
+        """
+        Input: hand and villainHand - lists of two card numbers
+        Output: equity of hand vs villainHand, -1 if they conflict with each other or the board
+        """
+        return getPackedEquity(self.eqs, self.comboPerm[comboIndex[hand[0]][hand[1]]],
+                               self.comboPerm[comboIndex[villainHand[0]][villainHand[1]]])
+
+    def getEquityRow(self, hand):
+        """
+        Input: hand - list of two card numbers
+        Output: array of length numHands of the equities of hand against every combo (-1 for conflicts)
+        """
+        return getPackedEquityRow(self.eqs, self.comboPerm[comboIndex[hand[0]][hand[1]]])[self.comboPerm]
+
+    def getHandRanking(self):
+        """
+        Output: array of the combo numbers of every hand that doesn't conflict with self.board,
+                sorted by equity vs any two cards (highest first).  The ranking only depends on
+                the board, so it is computed once, stored next to the equity file, and loaded
+                from there afterwards.
+        """
+        if self.handRanking is None:
+            with self.lock:
+                if self.handRanking is None:
+                    filename = 'eqarray/' + getRankingFilename(self.canonicalBoard)
+                    if self.inMemory:
+                        ranking = rankHands(unpackEquityTable(self.eqs), self.canonicalBoard)
+                    elif os.path.isfile(filename):
+                        ranking = numpy.load(filename)
+                    else:
+                        ranking = rankHands(unpackEquityTable(self.eqs), self.canonicalBoard)
+                        saveArrayAtomic(filename, ranking)
+                    # ranking holds canonical combos; comboPerm maps our combos to canonical ones
+                    self.handRanking = numpy.argsort(self.comboPerm)[ranking]
+            if self.cache is not None:
+                self.cache.fitToBudget()
+        return self.handRanking
+
+    # Output: filename built from self.canonicalBoard
+    # For example, if self.board is AsJc2d then card2string(self.canonicalBoard) ==
+    # ['Ah', 'Jd', '2c', '__','__'] and we return 'AhJd2c.ea16.npy'.
     def getFilename(self):
         """
-        Get the filename of equity array, and load it if file exists
+        Get the filename of the compact equity array (shared by all boards isomorphic to this one)
+        """
+        return getEquityFilename(self.canonicalBoard)
+
+    def getLegacyFilename(self):
+        """
+        Get the filename of an old-style numCards^4 equity array, e.g. 'AhJd2c.ea.npy'
+        """
+        return getBoardString(self.board) + '.ea.npy'
+
+### Process-wide EquityArray registry ###
+
+class EquityArrayCache:
+    """
+    Hands out one shared EquityArray per board, so that repeated queries on a board don't
+    reload its file.  The least recently used boards are dropped once the arrays held keep more
+    than maxBytes in memory (see EquityArray.getNumBytes; memory-mapped files don't count, and
+    unpacked matrices count from when they are unpacked); boards put in with pin=True are never
+    dropped.  Safe to use from several threads; a board requested by two threads
+    at once is only loaded (or built) once.
+    """
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.arrays = collections.OrderedDict() # board (as a tuple) -> EquityArray, oldest first
+        self.loading = {} # board -> lock held while that board's EquityArray is being constructed
+        self.pinned = set() # boards never evicted
+        self.lock = threading.Lock()
+
+    def get(self, board):
+        """
+        Input: board - list of numbers representing a board
+        Output: the shared EquityArray for board
+        Side-effects: loads or builds the board's EquityArray if it isn't held, evicting old boards as needed
+        """
+        key = tuple(board)
+        with self.lock:
+            if key in self.arrays:
+                self.arrays.move_to_end(key)
+                return self.arrays[key]
+            boardLock = self.loading.setdefault(key, threading.Lock())
+        with boardLock:
+            with self.lock:
+                if key in self.arrays:
+                    self.arrays.move_to_end(key)
+                    return self.arrays[key]
+            ea = EquityArray(list(board))
+            ea.cache = self
+            with self.lock:
+                self.arrays[key] = ea
+                self.loading.pop(key, None)
+                self.evict()
+        return ea
+
+    def put(self, ea, pin = False):
+        """
+        Input:
+          ea - an EquityArray
+          pin - if True, ea is never evicted (until clear), e.g. because its data (built in
+                memory) couldn't be loaded again
+        Output: N/A
+        Side-effects: makes ea the shared EquityArray for its board (e.g. one built from
+                      in-memory data), evicting old boards as needed
         """
-        boardStr = ''
-        boardAsStrings = pe_card2string(self.board)
-        for i in boardAsStrings:
-            if i != '__':
-                boardStr = boardStr + i
-            if boardStr == '': #this is the case when we have the preflop board
-                boardStr = 'preflop'
-        boardStr = boardStr + '.ea.npy'
-        return boardStr
+        ea.cache = self
+        key = tuple(ea.board)
+        with self.lock:
+            self.arrays[key] = ea
+            self.arrays.move_to_end(key)
+            if pin:
+                self.pinned.add(key)
+            else:
+                self.pinned.discard(key)
+            self.evict()
+
+    def getNumBytes(self):
+        """ Output: total bytes of equity data held by the cache """
+        return numpy.sum([ea.getNumBytes() for ea in self.arrays.values()])
+
+    def evict(self):
+        """ Drop least recently used unpinned boards until we're within budget (always keep the newest) """
+        while self.getNumBytes() > self.maxBytes:
+            oldest = [key for key in list(self.arrays)[:-1] if key not in self.pinned]
+            if not oldest:
+                break
+            del self.arrays[oldest[0]]
+
+    def fitToBudget(self):
+        """ Evict boards if needed, e.g. after an array held has unpacked its matrix """
+        with self.lock:
+            self.evict()
+
+    def setMaxBytes(self, maxBytes):
+        """ Change the byte budget, evicting boards if needed """
+        with self.lock:
+            self.maxBytes = maxBytes
+            self.evict()
+
+    def clear(self):
+        """ Drop every board, pinned or not """
+        with self.lock:
+            self.arrays.clear()
+            self.pinned.clear()
+
+# Byte budget of the shared cache, 512 MB unless set in the environment
+equityArrayCache = EquityArrayCache(int(os.environ.get('HUNL_EA_CACHE_BYTES', 512 * 1024 * 1024)))
+
+def getEquityArray(board):
+    """
+    Input: board - list of numbers representing a board
+    Output: the process-wide shared EquityArray for board (see EquityArrayCache)
+    """
+    return equityArrayCache.get(board)
 
 # Define EquityArray functions
 def getEquityVsHandFast(hand, villainHand, ea):
-    return ea.eArray[hand[0]][hand[1]][villainHand[0]][villainHand[1]]
+    return ea.getEquity(hand, villainHand)
 
 def setHandsWithConflicts(handArray, cardslist, num):
     """ How to handle when hand had conflicts """
@@ -112,27 +325,68 @@ class Range:
     """
     Range class describes a poker hand range
     The data:
-    a numpy array of sides numCards by numCards, r, of numbers between 0 and 1,
-      each of which describes the fraction of a particular hand in the range
-    Note: there is some redundancy in our representation.  For example, (3h, 2h) - (2h, 3h)
-    We are only going to access elements of r, r[i][j] such that j > 1
-    """
-    def __init__(self, initFrac = None):
-        """ Create the class and set all combos to zero """
-        self.r = numpy.zeros((numCards, numCards))
-        if initFrac != None:
+    a numpy vector of length numHands, v, of numbers between 0 and 1, each of which describes
+      the fraction of a particular hand combo in the range.  Combos are numbered as in
+      lib/hunl_combos.py: v[comboIndex[i][j]] is the fraction of the hand [i, j], and
+      comboCards[k] are the two cards of combo k.
+    Whole-range operations (scaling, mixing, removing blockers) are single array expressions
+    on v.  For older code, r gives the range as a numCards by numCards matrix with r[i][j]
+    (i < j) the fraction of hand [i, j].  That matrix is built from v and read-only, so an
+    in-place write like r[i][j] = f raises instead of being lost: use setFrac, or assign a
+    whole matrix to r.
+    A range always keeps its fractions in the same array: setting v copies the new fractions
+    into it.  That lets a range be a view of a row of a bigger array, like the ranges of a
+    StrategyPair (see StrategyPair.rangeBlock).
+    """
+    def __init__(self, initFrac = None, v = None):
+        """
+        Create the class and set all combos to zero, or keep the fractions in v, an existing
+        array of length numHands, if given
+        """
+        self._v = numpy.zeros(numHands) if v is None else v
+        if initFrac is not None:
             self.setAllFracs(initFrac)
 
+    @property
+    def v(self):
+        return self._v
+
+    @v.setter
+    def v(self, v):
+        self._v[:] = v
+
+    @property
+    def r(self):
+        """
+        The range as a numCards by numCards matrix, only the upper triangle used.  It is a
+        read-only copy (writing to it raises ValueError); set r = matrix to change the range.
+        """
+        r = numpy.zeros((numCards, numCards))
+        r[comboCards[:, 0], comboCards[:, 1]] = self.v
+        r.setflags(write=False)
+        return r
+
+    @r.setter
+    def r(self, r):
+        self.v = numpy.array(r[comboCards[:, 0], comboCards[:, 1]], dtype=float)
+
+    def copy(self):
+        """
+        Input: N/A
+        Output: a new Range with the same fractions as this one
+        Side-effects: N/A
+        """
+        result = Range()
+        result.v = self.v.copy()
+        return result
+
     def getFrac(self, hand):
         """
         Input: a hand represented by a list of two numbers
         Output: the fraction of the hand contained in the range
         Side-effects: N/A
         """
-        card1, card2 = hand
-        if card1 > card2:
-            card1,card2 = card2,card1
-        return self.r[card1][card2]
+        return self.v[comboIndex[hand[0]][hand[1]]]
 
     def getNumHands(self):
         """
@@ -140,7 +394,7 @@ class Range:
         Output: total number of hand combinations contained in the range
         Side-effects: N/A
         """
-        return sum(self.r)
+        return numpy.sum(self.v)
 
     def getNumHandsWithoutConflicts(self, cardslist):
         """
@@ -148,9 +402,16 @@ class Range:
         Output: the number of hand combos in the range that do not conflict with cardslist
         Side-effects: N/A
         """
-        temp = numpy.copy(self.r)
-        zeroHandsWithConflicts(temp, cardslist)
-        return sum(temp)
+        return numpy.dot(self.v, getLiveComboMask(cardslist))
+
+    def getNumHandsUnblocked(self):
+        """
+        Input: N/A
+        Output: array of length numHands: for every hand h, the number of hand combos in the
+                range that do not conflict with h (all hands at once, see lib/hunl_combos.py)
+        Side-effects: N/A
+        """
+        return getUnblockedCounts(self.v)
 
     def removeHandsWithConflicts(self, cardslist):
         """
@@ -158,7 +419,7 @@ class Range:
         Output: N/A
         Side-effects: removes hands from range that conflict with cards in cardslist
         """
-        zeroHandsWithConflicts(self.r, cardslist)
+        self.v = self.v * getLiveComboMask(cardslist)
 
     def setFrac(self, hand, f):
         """
@@ -168,10 +429,7 @@ class Range:
         Output: N/A
         Side-effects: sets the fraction of hand in the range to f
         """
-        card1, card2 = hand
-        if card1 > card2:
-            card1,card2 = card2,card1
-        self.r[card1][card2] = f
+        self.v[comboIndex[hand[0]][hand[1]]] = f
 
     def setAllFracs(self, num):
         """
@@ -179,9 +437,7 @@ class Range:
         Output: N/A
         Side-effects: set the fraction of all hand combos to num
         """
-        for i in range(numCards):
-            for j in range(i+1, numCards):
-                self.r[i][j] = num
+        self.v = float(num)
 
     def scaleFracs(self, num):
         """
@@ -192,9 +448,28 @@ class Range:
           the user of the function to ensure that the scaling number does not change any of the fractions
           to be less than 0 or greater than 1.
         """
-        self.r = self.r * num
+        self.v = self.v * num
 
+    def mixWith(self, other, fraction):
+        """
+        Inputs:
+          other - a Range
+          fraction - a number between 0 and 1
+        Output: N/A
+        Side-effect: every fraction becomes (old fraction) * fraction + (fraction in other) * (1 - fraction)
+        """
+        self.v = self.v * fraction + other.v * (1 - fraction)
 
+    def normalize(self, numCombos = 1.0):
+        """
+        Input: numCombos - a number
+        Output: N/A
+        Side-effect: scale the range so that it contains numCombos hand combos in total (an
+                     empty range is left empty)
+        """
+        total = self.getNumHands()
+        if total > 0:
+            self.v = self.v * (numCombos / total)
 
     def setRangeString(self, rangeString, value):
         """
@@ -222,14 +497,16 @@ class Range:
                 if hand[2] == 's': # suited hands
                     for s in suits:
                         self.setFrac(pe_string2card([rank1+s, rank2+s]), value)
-                else: # unsuited hands
+                else: # unsuited hands: every pair of different suits, either way round
                     for i in range(numSuits):
-                        for j in range(i+1, numSuits):
+                        for j in range(numSuits):
+                            if i == j:
+                                continue
                             self.setFrac(pe_string2card([rank1+suits[i], rank2+suits[j]]), value)
             elif len(hand) == 4:
                 card1 = hand[0:2]
                 card2 = hand[2:4]
-                self.setFrac(pe_string2card([card2, card2]), value)
+                self.setFrac(pe_string2card([card1, card2]), value)
             else:
                 print("ERROR! Hand input needs to be 2 to 4 characters")
 
@@ -250,10 +527,8 @@ class Range:
         or AKdd, the result should be 0.5 (not 2).
         Note: if we're interested in pocket pairs then rank1 == rank2 and suited == False
         """
-        nHand = 0.0
-        nFrac = 0.0
-
         # look at every specific hand combo corresponding to rank1, rank 2 and suited
+        combos = []
         for i in suits:
             for j in suits:
                 card1 = rank1 + i
@@ -262,9 +537,8 @@ class Range:
                     continue
                 if (card1 == card2):
                     continue
-                nHand += 1 # short for nHand = nHand + 1
-                nFrac += self.getFrac(pe_string2card([card1,card2]))
-        return nFrac / nHand
+                combos.append(comboIndex[cards.index(card1)][cards.index(card2)])
+        return numpy.mean(self.v[combos])
 
     def _repr_svg_(self):
         """ iPython special function - represent as scalable vector graphic """
@@ -272,13 +546,28 @@ class Range:
         for i in range(numRanks):
             for j in range(numRanks):
                 frac = self.getAmbigFrac(ranks[i], ranks[j], i > j)
-                hexcolor = '#%02x%02x%02x' % (255*(1-frac), 255, 255*(1-frac))
+                hexcolor = '#%02x%02x%02x' % (int(255*(1-frac)), 255, int(255*(1-frac)))
                 result += '<rect x="' + str(i*20) + '" y="' + str(j*20) + '" width="20" height="20" fill="' + hexcolor+'"></rect>'
                 result += '<text x=' + str(i*20)+' y='+str((j+1)*20) + ' font-size=12>' + ranks[i]\
                           + ranks[j] + '</text>'
         result += '</svg>'
         return result
 
+    def getSortedCombosAndEquities(self, villainRange, board):
+        """
+        Input:
+          villainRange - Range object
+          board - list of 5 numbers describing a board
+        Output: (combos, equities) - arrays of the combo numbers of every hand that doesn't
+                conflict with board, sorted by equity vs villainRange on board (highest first),
+                and their equities
+        Side-effects: N/A
+        """
+        eqs = getEquitiesVsRange(villainRange, getEquityArray(board))
+        combos = numpy.nonzero(getLiveComboMask(board))[0]
+        combos = combos[numpy.argsort(-eqs[combos], kind='stable')]
+        return combos, eqs[combos]
+
     def getHandsSortedAndEquities(self, villainRange, board):
         """
         Input:
@@ -290,15 +579,8 @@ class Range:
                               will be sorted by equity (highest first).
         Side-effects: N/A
         """
-        ea = EquityArray(board)
-        result = []
-        for i in range(numCards):
-            for j in range(i+1, numCards):
-                hand = [i,j]
-                if not conflicts(board,hand):
-                    result.append((hand, getEquityVsRange(hand, villainRange, ea)))
-        result.sort(key = lambda x: x[1], reverse = True)
-        return result
+        combos, eqs = self.getSortedCombosAndEquities(villainRange, board)
+        return [(list(comboCards[k]), eq) for k, eq in zip(combos, eqs)]
 
     def setToTop(self, fraction, board):
         """
@@ -308,17 +590,14 @@ class Range:
         Output: N/A
         Side-effects: set fraction of (approx.) the top fraction of hands (as ranked by equity vs ATC) on board to 1, and the rest to 0
         """
-        rangeAllHands = Range()
-        rangeAllHands.setAllFracs(1.0) # ATC range
-        handsSorted = self.getHandsSortedAndEquities(rangeAllHands, board)
+        combosSorted = getEquityArray(board).getHandRanking() # hands ranked by equity vs ATC
 
         numCardsLeft = numCards
         for c in board:
             if c < numCards:
                 numCardsLeft -= 1
         self.setAllFracs(0)
-        for i in range(int(fraction * scipy.misc.comb(numCardsLeft, 2))):
-            self.setFrac(handsSorted[i][0],1.0)
+        self.v[combosSorted[:int(fraction * scipy.special.comb(numCardsLeft, 2))]] = 1.0
 
 # Now that we have Range class, create functions to work with Ranges
 
@@ -329,26 +608,51 @@ def getEquityVsRange(hand, r, ea):
       r - Range object
       ea - Equity Array object
     """
-    herocard1, herocard2 = hand
-    eqs = ea.eArray[herocard1, herocard2, :, :] # Equity of all hands vs hero hands.  ea is an Equity Array of numCards x numCards x numCards x numCards.
-    # r.r                 # numCards x numCards
-    villRange = numpy.copy(r.r)
-    zeroHandsWithConflicts(villRange, hand + ea.board)
-    return sum(numpy.multiply(eqs, villRange)) / sum(villRange) # np.multiply is pairwise multiplication, not matrix
+    eqs = ea.getEquityRow(hand) # Equity of hero hand vs every combo
+    villRange = r.v * getLiveComboMask(hand + ea.board) # villain's range without hands that conflict
+    return numpy.sum(eqs * villRange) / numpy.sum(villRange)
+
+def getEquitiesVsRange(r, ea):
+    """
+    Input:
+      r - Range object
+      ea - Equity Array object
+    Output: array of length numHands holding the equity vs r of every hero combo, each against
+            the part of r that doesn't conflict with it or the board (-1 for hero combos that
+            conflict with the board).  Computed with one matrix-vector product.
+    """
+    boardLive = getLiveComboMask(ea.board)
+    villRange = r.v * boardLive
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        eqs = ea.getEquityMatrix().dot(villRange) / getUnblockedCounts(villRange)
+    eqs[~boardLive] = -1
+    return eqs
+
+def getRangeEquityVsRange(r1, r2, ea):
+    """
+    Input:
+      r1, r2 - Range objects
+      ea - Equity Array object
+    Output: equity of r1 vs r2 on ea's board, averaged over every pair of combos that don't
+            conflict with each other or the board, weighted by both ranges' fractions (nan if
+            there are no such pairs)
+    """
+    boardLive = getLiveComboMask(ea.board)
+    villRange = r2.v * boardLive
+    heroRange = r1.v * boardLive
+    total = numpy.sum(heroRange * getUnblockedCounts(villRange)) # weight of all the pairs of combos
+    if total == 0:
+        return float('nan')
+    return float(numpy.sum(heroRange * ea.getEquityMatrix().dot(villRange)) / total)
 
 def plotEqDistn(r1, r2, board):
     """ Plot equity distributions of r1 vs r2 on board """
-    xs = []
-    ys = []
-    handCount = 0.0
-    for hand in r1.getHandsSortedAndEquities(r2, board):
-        # plot hand at (handCount, equity) and (handCount + r1.getFrac(hand[0]), equity)
-        xs.append(handCount)
-        handCount += r1.getFrac(hand[0])
-        xs.append(handCount)
-        ys.append(hand[1])
-        ys.append(hand[1])
-    return xs, ys
+    # plot every hand at (handCount, equity) and (handCount + r1's fraction of the hand, equity)
+    combos, eqs = r1.getSortedCombosAndEquities(r2, board)
+    handCounts = numpy.concatenate([[0.0], numpy.cumsum(r1.v[combos])])
+    xs = numpy.column_stack([handCounts[:-1], handCounts[1:]]).ravel()
+    ys = numpy.repeat(eqs, 2)
+    return list(xs), list(ys)
 
 def updateRange(r1, r2, n):
     """
@@ -361,66 +665,88 @@ def updateRange(r1, r2, n):
       the end of the function will be (old amount) * (fraction) + (new amount) * (1-fraction)
       where fraction becomes closer to 1 the higher n is.
     """
-    fraction = 1 - 1 / (n + 2.0) # Better if the fraction here is never exactly 0 or exactly 1
-    for i in range(numCards):
-        for j in range(i+1, numCards):
-            hand = [i, j]
-            r1.setFrac(hand, (r1.getFrac(hand)) * (fraction) + (r2.getFrac(hand)) * (1-fraction))
+    r1.mixWith(r2, getMixingFraction(n))
+
+def getMixingFraction(n):
+    """
+    Input: n - positive integer (the iteration number)
+    Output: the fraction of the old range kept by updateRange at iteration n
+    """
+    return 1 - 1 / (n + 2.0) # Better if the fraction here is never exactly 0 or exactly 1
 
-def doShoveFoldGame():
+def doShoveFoldGame(S = 10, nIter = 200, ante = 0.0):
     """
     Solving the shove/fold:
     SB can either shove or fold at his first decision
     SB's strategy is defined by his jamming range, and the BB's by his calling range
 
-    Fictitious play
+    Fictitious play (see lib/hunl_pushfold.py)
 
-    Input: N/A
-    Outputs: N/A
-    Side-effects: display SB shoving range and BB calling range
+    Input:
+      S - stack size in BBs
+      nIter - number of iterations
+      ante - ante paid by each player, in BBs
+    Outputs: (sbJamRange, bbCallRange) - the SB shoving range and the BB calling range
+    Side-effects: N/A
+    """
+    jamFreqs, callFreqs = doShoveFoldSweep([S], nIter, ante)
+    sbJamRange = Range()
+    sbJamRange.v = jamFreqs[0]
+    bbCallRange = Range()
+    bbCallRange.v = callFreqs[0]
+    return sbJamRange, bbCallRange
+
+def doShoveFoldSweep(stacks = None, nIter = 200, ante = 0.0):
     """
-    nIter = 200 # Number of iterations
-    S = 10 # stack size in BBs
-    ea = EquityArray(pe_string2card(['__','__','__','__','__']))
+    Solve the shove/fold game at many stack sizes at once
 
-    # guess some initial ranges
+    Input:
+      stacks - list of stack sizes in BBs (default: 1 to 30 BB in 0.5 BB steps)
+      nIter - number of iterations
+      ante - ante paid by each player, in BBs
+    Outputs: (jamFreqs, callFreqs) - arrays of shape (len(stacks), numHands) holding the
+             SB jamming and BB calling frequency of every combo at every stack size
+    Side-effects: N/A
+    """
+    if stacks is None:
+        stacks = getStackGrid()
+    ea = getEquityArray(pe_string2card(['__','__','__','__','__']))
+    return solveShoveFold(ea.getEquityMatrix(), stacks, ante, nIter)
+
+shoveFoldCharts = None
+
+def getShoveFoldCharts():
+    """
+    Output: the ShoveFoldCharts stored in eqarray/ (see lib/hunl_pushfold.py)
+    Side-effects: the first call loads the charts, building and saving them from the preflop
+                  EquityArray if they haven't been built yet
+    """
+    global shoveFoldCharts
+    if shoveFoldCharts is None:
+        filename = 'eqarray/' + chartsFilename
+        if os.path.isfile(filename):
+            shoveFoldCharts = loadShoveFoldCharts(filename)
+        else:
+            ea = getEquityArray(pe_string2card(['__','__','__','__','__']))
+            shoveFoldCharts = buildShoveFoldCharts(ea.getEquityMatrix())
+            shoveFoldCharts.save(filename)
+    return shoveFoldCharts
+
+def getShoveFoldRanges(S, ante = 0.0):
+    """
+    Input:
+      S - stack size in BBs
+      ante - ante paid by each player, in BBs
+    Outputs: (sbJamRange, bbCallRange) looked up in the shove/fold charts, interpolating
+             between the stacks and antes they were solved at
+    Side-effects: N/A
+    """
+    charts = getShoveFoldCharts()
     sbJamRange = Range()
-    sbJamRange.setAllFracs(0.5)
+    sbJamRange.v = charts.getJamFreqs(S, ante)
     bbCallRange = Range()
-    bbCallRange.setAllFracs(0.5)
-
-    for n in range(nIter):
-        # solve for the SB max expl strat
-        bestSBJamRange = Range()
-        for i in range(numCards):
-            for j in range(i+1, numCards):
-                hand = [i,j]
-                bb_call_freq = bbCallRange.getNumHandsWithoutConflicts(hand) / numVillainHands
-                equity = getEquityVsRange(hand, bbCallRange, ea)
-                evJam = (1 - bb_call_freq) * (S+1) + (bb_call_freq) * equity * 2*S
-                evFold = S - 0.5
-                if (evJam > evFold):
-                    bestSBJamRange.setFrac(hand, 1)
-                else:
-                    bestSBJamRange.setFrac(hand, 0)
-
-        # update the SB strategy
-        updateRange(sbJamRange, bestSBJamRange, n)
-
-        # solve for BB max expl strat
-        bestBBCallRange = Range()
-        for i in range(numCards):
-            for j in range(i+1, numCards):
-                hand = [i, j]
-                equity = getEquityVsRange(hand, sbJamRange, ea)
-                evCall = 2 * S * equity
-                evFold = S - 1
-                if (evCall > evFold):
-                    bestBBCallRange.setFrac(hand, 1)
-                else:
-                    bestBBCallRange.setFrac(hand, 0)
-        # update BB strat
-        updateRange(bbCallRange, bestBBCallRange, n)
+    bbCallRange.v = charts.getCallFreqs(S, ante)
+    return sbJamRange, bbCallRange
 
 ### Set up Classes for Decision Points and Decision Tree ###
 
@@ -436,14 +762,37 @@ class DecPt:
                   one of: "bet", "fold", "check", "call", or board cards
     newCardFreq:  only used if parentAction was new cards being dealt, and we
                   don't want all new cards to have equal probability of falling
+    isoDeals: only used if parentAction was new cards being dealt, and this point stands for
+              several deals that only differ by a suit permutation (see
+              hunl_iso.groupIsomorphicBoards): a list of (board, perm) for every one of them,
+              perm taking the board to this point's board.  newCardFreq is then the total
+              frequency of all of them, and every one comes newCardFreq / len(isoDeals) as often.
+              Only the subtree of this point's board is in the tree; the other deals play the
+              same way with their hands' suits permuted, which is exact as long as both
+              players' ranges before the deal are unchanged by the permutations.
     """
-    def __init__(self, player, initial_sb_cip, initial_bb_cip, eArray, parentAction, newCardFreq = 1.0):
+    def __init__(self, player, initial_sb_cip, initial_bb_cip, eArray, parentAction, newCardFreq = 1.0,
+                 isoDeals = None):
         self.player = player
         self.initial_sb_cip = initial_sb_cip
         self.initial_bb_cip = initial_bb_cip
         self.eArray = eArray
         self.parentAction = parentAction
         self.newCardFreq = newCardFreq
+        self.isoDeals = isoDeals
+
+    def getDeals(self):
+        """
+        Input: N/A
+        Output: list of (board, comboMap, frequency) for every deal this point stands for, where
+                comboMap maps the combos on board to the combos they play like at this point
+                (None for this point's own board)
+        """
+        if self.isoDeals is None:
+            return [(self.eArray.board, None, self.newCardFreq)]
+        freq = self.newCardFreq / float(len(self.isoDeals))
+        return [(board, None if tuple(perm) == identityPerm else getComboPerm(perm), freq)
+                for board, perm in self.isoDeals]
 
     def getPlayerCIP(self, player):
         """
@@ -455,31 +804,89 @@ class DecPt:
         elif (player == "BB"):
             return self.initial_bb_cip
         else:
-            print "ERROR: DecPt.getPlayerCIP given player: " + player
+            print("ERROR: DecPt.getPlayerCIP given player: " + player)
+
+# Node type codes used by Tree.playerCodes
+nodeTypes = ['SB', 'BB', 'Nature', 'Leaf']
+nodeTypeCodes = dict((player, code) for code, player in enumerate(nodeTypes))
+
+def getPathSums(parentIndices, weights):
+    """
+    Inputs:
+      parentIndices: array of the parent of every node of a tree (-1 for the root)
+      weights: array of a number for every node
+    Output: array holding, for every node, the sum of weights over the node and all its ancestors
+    Side-effects: N/A
+    """
+    # pointer jumping: after k rounds, sums[i] covers i's 2^k nearest ancestors and jump[i]
+    # is the next ancestor not covered yet, so this takes log2(depth of the tree) rounds
+    sums = numpy.array(weights, dtype=numpy.int64)
+    jump = numpy.array(parentIndices, dtype=numpy.int64)
+    active = numpy.nonzero(jump >= 0)[0]
+    while len(active) > 0:
+        sums[active] += sums[jump[active]]
+        jump[active] = jump[jump[active]]
+        active = active[jump[active] >= 0]
+    return sums
+
+class ChildLists:
+    """
+    Read-only view of a tree's childIndices and childOffsets as a list of lists:
+    childLists[i] is a list of the numbers of point i's children
+    """
+    def __init__(self, childIndices, childOffsets):
+        self.childIndices = childIndices.tolist()
+        self.childOffsets = childOffsets.tolist()
+
+    def __len__(self):
+        return len(self.childOffsets) - 1
+
+    def __getitem__(self, i):
+        return self.childIndices[self.childOffsets[i]:self.childOffsets[i+1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
 
 class Tree:
     """
-    A simple approach to a tree structure:
+    A struct-of-arrays tree structure:
     Put all our decision points in a list (this implicitly numbers them):
        decPts
-    Then, we need to keep track of parent and child relationship -- use a couple other arrays to do that
-      parents: the i^th element of this array contain the number of the point which is the i^th point's parent
-      children: the i^th entry in this list contain a list of the numbers of points which are the i^th
-                point's children.  And if we want to know point i's children, we can find a list of them in
-                children[i]
+    and keep what the solver needs about every point in NumPy arrays indexed the same way:
+      playerCodes: node type of every point (see nodeTypes)
+      sbCIPs and bbCIPs: initial chips in pot of each player at every point
+      parentIndices: number of every point's parent (-1 for the root)
+      childOffsets and childIndices: the children of point i are childIndices[childOffsets[i]:childOffsets[i+1]]
+      depths: number of ancestors of every point
+      preOrder: every point before its children (children in the order they were added)
+      postOrder: every point after its children
+      rangeIndices: rangeIndices[nodeTypeCodes[player]][i] is the number of the point whose
+                    range player holds at point i, i.e. the point his last action before i
+                    led to (i itself if his action led to i), or -1 if he hasn't acted yet
+                    and still holds his starting range
+    so that solver passes can be flat loops over preOrder or postOrder instead of recursions.
+    Points are added in constant time; the arrays are (re)built the first time one is needed
+    after points were added.  A point's parent is always added before it, so parents have
+    lower numbers than their children.  For code that walks the tree point by point:
+      children: children[i] is a list of the numbers of point i's children
+      parents: parents[i] is the number of point i's parent (None for the root)
     Example:
                 0       1     2        3         4
     decPts: (pointA, pointB, pointC, pointD, pointE)
-    children: [ [], [], [], [1, 2], [0, 3]]
-    parents: [4, 3, 3, 4, None]
+    parentIndices: [-1, 0, 0, 1, 1]
+    childOffsets: [0, 2, 4, 4, 4, 4]    childIndices: [1, 2, 3, 4]
+    children: [ [1, 2], [3, 4], [], [], []]
+    preOrder: [0, 1, 3, 4, 2]    postOrder: [3, 4, 1, 2, 0]
     When we make a new tree, we'll just give it effective stack S, and a first decision point (root)
     Later, we will add new decision points
     """
     def __init__(self, S, root):
         self.effStack = S
         self.decPts = []
-        self.children = []
-        self.parents = []
+        self.indexOf = {} # id() of every decision point -> its number
+        self.parentList = []
+        self.compiledSize = -1
         self.addDecPt(root, None)
 
     def getNumPoints(self):
@@ -490,7 +897,7 @@ class Tree:
         """
         return len(self.decPts)
 
-    def getEffStack():
+    def getEffStack(self):
         """
         Inputs: N/A
         Outputs: Effective stack at the beginning of the decision tree
@@ -501,21 +908,179 @@ class Tree:
 
     def addDecPt(self, point, parent):
         """
-        Adds a new decision point to the tree
+        Adds a new decision point to the tree (in constant time)
         Inputs:
             point: the new point (not previously in the tree)
             parent: a decision point already in the tree
         Outputs: N/A
         Side-effects: Adds a new decision point to the tree
         """
-        self.decPts.append(point)
-        self.children.append([])
         if (parent == None): # this should only be true for the root node
-            self.parents.append(None) # Is this line needed?
+            self.parentList.append(-1)
         else:
-            parentIndex = self.decPts.index(parent)
-            self.children[parentIndex].append(self.getNumPoints() - 1)
-            self.parents.append(parentIndex)
+            self.parentList.append(self.indexOf[id(parent)])
+        self.indexOf[id(point)] = len(self.decPts)
+        self.decPts.append(point)
+
+    def compile(self):
+        """
+        Inputs: N/A
+        Outputs: N/A
+        Side-effects: (re)builds the tree's arrays if points were added since they were last built
+        """
+        n = self.getNumPoints()
+        if self.compiledSize == n:
+            return
+        self._playerCodes = numpy.array([nodeTypeCodes[point.player] for point in self.decPts], dtype=numpy.int8)
+        self._sbCIPs = numpy.array([point.initial_sb_cip for point in self.decPts], dtype=numpy.float64)
+        self._bbCIPs = numpy.array([point.initial_bb_cip for point in self.decPts], dtype=numpy.float64)
+        parentIndices = numpy.array(self.parentList, dtype=numpy.int32)
+        self._parentIndices = parentIndices
+
+        # stable sort keeps every point's children in the order they were added
+        childIndices = numpy.argsort(parentIndices[1:], kind='stable') + 1
+        childOffsets = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(parentIndices[1:], minlength=n), out=childOffsets[1:])
+        self._childIndices = childIndices.astype(numpy.int32)
+        self._childOffsets = childOffsets.astype(numpy.int32)
+
+        depths = getPathSums(parentIndices, numpy.arange(n) > 0)
+        # number of points in every point's subtree, adding up the deepest points first
+        sizes = numpy.ones(n, dtype=numpy.int64)
+        byDepth = numpy.argsort(depths, kind='stable')
+        levelStarts = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(depths))])
+        for d in range(len(levelStarts) - 2, 0, -1):
+            level = byDepth[levelStarts[d]:levelStarts[d+1]]
+            numpy.add.at(sizes, parentIndices[level], sizes[level])
+        # a point comes right after its parent in preOrder, and after the subtrees of the
+        # siblings added before it
+        childSizes = sizes[childIndices]
+        sizesBefore = numpy.cumsum(childSizes) - childSizes
+        steps = numpy.zeros(n, dtype=numpy.int64)
+        steps[childIndices] = 1 + sizesBefore - sizesBefore[childOffsets[parentIndices[childIndices]]]
+        prePositions = getPathSums(parentIndices, steps)
+        # in postOrder, a point comes after its subtree and before its ancestors
+        postPositions = prePositions - depths + sizes - 1
+        self._depths = depths.astype(numpy.int32)
+        # a point gets a player's range from its parent, unless the parent is the player's own
+        # decision; going down the tree a level at a time, parents come first
+        self._rangeIndices = numpy.full((2, n), -1, dtype=numpy.int32)
+        for code in [nodeTypeCodes['SB'], nodeTypeCodes['BB']]:
+            ownAction = numpy.zeros(n, dtype=bool)
+            ownAction[1:] = self._playerCodes[parentIndices[1:]] == code
+            rangeIndices = self._rangeIndices[code]
+            for d in range(1, len(levelStarts) - 1):
+                level = byDepth[levelStarts[d]:levelStarts[d+1]]
+                rangeIndices[level] = numpy.where(ownAction[level], level, rangeIndices[parentIndices[level]])
+        self._preOrder = numpy.empty(n, dtype=numpy.int32)
+        self._preOrder[prePositions] = numpy.arange(n)
+        self._postOrder = numpy.empty(n, dtype=numpy.int32)
+        self._postOrder[postPositions] = numpy.arange(n)
+        self._children = None
+        self._parents = None
+        self.compiledSize = n
+
+    @property
+    def playerCodes(self):
+        self.compile()
+        return self._playerCodes
+
+    @property
+    def sbCIPs(self):
+        self.compile()
+        return self._sbCIPs
+
+    @property
+    def bbCIPs(self):
+        self.compile()
+        return self._bbCIPs
+
+    @property
+    def parentIndices(self):
+        self.compile()
+        return self._parentIndices
+
+    @property
+    def childOffsets(self):
+        self.compile()
+        return self._childOffsets
+
+    @property
+    def childIndices(self):
+        self.compile()
+        return self._childIndices
+
+    @property
+    def depths(self):
+        self.compile()
+        return self._depths
+
+    @property
+    def rangeIndices(self):
+        self.compile()
+        return self._rangeIndices
+
+    @property
+    def preOrder(self):
+        self.compile()
+        return self._preOrder
+
+    @property
+    def postOrder(self):
+        self.compile()
+        return self._postOrder
+
+    @property
+    def children(self):
+        self.compile()
+        if self._children is None:
+            self._children = ChildLists(self._childIndices, self._childOffsets)
+        return self._children
+
+    @property
+    def parents(self):
+        self.compile()
+        if self._parents is None:
+            self._parents = [None] + self._parentIndices[1:].tolist()
+        return self._parents
+
+    def getComboMap(self, iDecPt, board):
+        """
+        Inputs:
+          iDecPt: the number of a decision point
+          board: the board actually dealt at the decision point (a list of 5 numbers, in the order
+                 the cards were dealt), which may be one of the deals that a point above it
+                 stands for (see DecPt.isoDeals) instead of the point's own board
+        Outputs: int array of length numHands mapping the combos on board to the combos they play
+                 like at the point, or None if board is the point's own board
+        Side-effects: N/A
+        """
+        path = []
+        i = iDecPt
+        while i != -1:
+            path.append(i)
+            i = self.parentIndices[i]
+        comboMap = None
+        for i in reversed(path):
+            point = self.decPts[i]
+            if point.isoDeals is None:
+                continue
+            # the deal that the board (with the permutations so far applied) is, comparing as
+            # many cards of it as the deal has
+            numKnown = len([c for c in point.eArray.board if c < numCards])
+            dealt = set(board[:numKnown])
+            for dealBoard, perm in point.isoDeals:
+                if set(dealBoard[:numKnown]) == dealt:
+                    break
+            else:
+                raise ValueError("Board %s isn't dealt at decision point %d" % (getBoardString(board), i))
+            if tuple(perm) != identityPerm:
+                board = permuteCards(board, perm)
+                permMap = getComboPerm(perm)
+                comboMap = permMap if comboMap is None else permMap[comboMap]
+        if set(c for c in board if c < numCards) != set(c for c in self.decPts[iDecPt].eArray.board if c < numCards):
+            raise ValueError("Board %s isn't dealt at decision point %d" % (getBoardString(board), iDecPt))
+        return comboMap
 
     def _repr_png_(self):
         """
@@ -523,6 +1088,7 @@ class Tree:
         Outputs: returns a PNG file displaying the tree
         Side-effects: N/A
         """
+        import pydot # only needed to draw trees, e.g. in the notebook
         g = pydot.Dot(graph_type="digraph")
         for i in range(self.getNumPoints()):
             node_label = str(i) + ': ' + self.decPts[i].player \
@@ -536,6 +1102,16 @@ class Tree:
 
 ### Create Strategy Pair Class ###
 
+def getStrategyPairNumBytes(numPoints):
+    """
+    Input: numPoints - number of decision points in a tree
+    Output: number of bytes a StrategyPair on such a tree holds in EVs and ranges
+    Side-effects: N/A
+    """
+    evBytes = 2 * numPoints * numHands * 4 # evs['SB'] and evs['BB'], float32
+    rangeBytes = numPoints * numHands * 4 # rangeBlock, float32
+    return evBytes + rangeBytes
+
 class StrategyPair:
     """
     Strategy: a range for every action a player can take
@@ -550,23 +1126,29 @@ class StrategyPair:
       - hold a list of ranges, called ranges, such that range[i] is the range of hands that takes the
         parent action of the tree, decPts[i]
           - when we make a new strategy pair, we'll need to set these ranges intelligently
+          - the ranges are views of the rows of one float32 array, rangeBlock, of dimensions
+               num-decision-points by numHands
+            so that whole-tree passes can work on all of them at once
       - find the range that either player holds at any decision points
       - be able to display itself
       - be able to update itself (given a max exploitative strategy and a mixing fraction)
       - store the EVs of having any hand at any decision point for each player
-        - there were will be two 3-D arrays, one for each player, of dimensions
-               num-decision-points by numCards by numCards
-            the first of those dimensions specifies a decision point, and the last two specify hole cards
+        - there were will be two float32 arrays, one for each player, of dimensions
+               num-decision-points by numHands
+            the first of those dimensions specifies a decision point, and the second a hand combo
             and the arrays hold the EVs of having that hand at that decision point
     Come up with a guess for starting ranges that is strategically reasonable?
     """
     def __init__(self, tree, sbStartingRange = None, bbStartingRange = None):
         self.tree = tree
         self.size = self.tree.getNumPoints()
-        self.ranges = [Range() for i in range(self.size)]
+        self.rangeBlock = numpy.zeros((self.size, numHands), dtype=numpy.float32)
+        self.ranges = [Range(v=self.rangeBlock[i]) for i in range(self.size)]
         self.evs = dict()
-        self.evs['SB'] = numpy.zeros((self.size, numCards, numCards))
-        self.evs['BB'] = numpy.zeros((self.size, numCards, numCards))
+        self.evs['SB'] = numpy.zeros((self.size, numHands), dtype=numpy.float32)
+        self.evs['BB'] = numpy.zeros((self.size, numHands), dtype=numpy.float32)
+        self.setActionIndices()
+        self.profiler = None # a SolveProfiler while a profiled solve runs (see lib/hunl_profile.py)
         self.sbStartingRange = sbStartingRange
         if sbStartingRange == None:
             self.sbStartingRange = Range(1.0)
@@ -576,17 +1158,32 @@ class StrategyPair:
         #  initialize the ranges
         self.initialize()
 
+    def setActionIndices(self):
+        """
+        Inputs: N/A
+        Outputs: N/A
+        Side-effects: sets actionIndices["SB"] and actionIndices["BB"] to arrays of the numbers of
+                      the points each player's actions lead to (the children of his decision points)
+        """
+        playerCodes = self.tree.playerCodes
+        parentCodes = playerCodes[self.tree.parentIndices[1:]]
+        self.actionIndices = dict((player, numpy.nonzero(parentCodes == nodeTypeCodes[player])[0] + 1)
+                                  for player in ['SB', 'BB'])
+
     def updateRanges(self, player, maxExplStrat, n):
         """
         Inputs:
          player: "SB" or "BB"
-         maxExplStrat: a dict that maps decision point numbers to ranges for all of player's decision pts
+         maxExplStrat: array of the same shape as rangeBlock holding player's max expl ranges in
+                       the rows of his actions (see getMaxEVStrat)
          n: a positive integer (the iteration number)
+        Side-effects: mixes the max expl ranges into player's ranges, as updateRange does
         """
-        for i in range(self.size):
-            if (self.tree.decPts[i].player == player):
-                for j in self.tree.children[i]:
-                    updateRange(self.ranges[j], maxExplStrat[j], n)
+        rows = self.actionIndices[player]
+        fraction = getMixingFraction(n)
+        self.rangeBlock[rows] = self.rangeBlock[rows] * fraction + maxExplStrat[rows] * (1 - fraction)
+        if self.profiler is not None:
+            self.profiler.count('rangeCopies', len(rows))
 
     def getMostRecentRangeOf(self, player, iDecPt):
         """
@@ -596,13 +1193,11 @@ class StrategyPair:
         Outputs: the range the player holds at the beginning of play at the decision point
         Side-effects: N/A
         """
-        iCurrDecPt = iDecPt
-        while (iCurrDecPt != 0 and self.tree.decPts[self.tree.parents[iCurrDecPt]].player != player):
-            iCurrDecPt = self.tree.parents[iCurrDecPt]
-        if iCurrDecPt == 0:  # we made it to the root
+        iRange = self.tree.rangeIndices[nodeTypeCodes[player]][iDecPt]
+        if iRange < 0:  # the player hasn't acted yet
             return self.getStartingRangeOf(player)
         else:
-            return self.ranges[iCurrDecPt]
+            return self.ranges[iRange]
 
     def getStartingRangeOf(self, player):
         """
@@ -615,16 +1210,32 @@ class StrategyPair:
         elif player == "BB":
             return self.bbStartingRange
         else:
-            print "ERROR in StrategyPair.getStartingRangeOf: passed player: " + player
+            print("ERROR in StrategyPair.getStartingRangeOf: passed player: " + player)
             return None
 
+    def getRangeOnBoard(self, n, board):
+        """
+        Inputs:
+          n: a number
+          board: the board actually dealt at decision point n (see Tree.getComboMap)
+        Outputs: the range associated with the parent action of decision point n, for the hands
+                 on board
+        Side-effects: N/A
+        """
+        comboMap = self.tree.getComboMap(n, board)
+        if comboMap is None:
+            return self.ranges[n].copy()
+        result = Range()
+        result.v = self.ranges[n].v[comboMap]
+        return result
+
     def getRange(self, n):
         """
         Inputs: n: a number
         Outputs: the range associated with the parent action of a decision point n
         Side-effects: N/A
         """
-        return self.range[n]
+        return self.ranges[n]
 
     def dump(self):
         """
@@ -635,15 +1246,10 @@ class StrategyPair:
         for i in range(1, self.size):
             parentActor = self.tree.decPts[self.tree.parents[i]].player
             action = self.tree.decPts[i].parentAction
-            print str(i) + ": " + parentActor + " " + action
+            print(str(i) + ": " + parentActor + " " + action)
             if parentActor != "Nature":
                 display(self.ranges[i])
 
-    # Recursive approach to working on trees:
-    # When we want to do something for every node in a tree, we can write a function f(),
-    # does whatever we want for one node, and then calls itself on all the children of that node.
-    # Then, to do the thing for all the nodes, we just call f() on the root node.
-
     def initialize(self):
         """
         Inputs: N/A
@@ -651,34 +1257,28 @@ class StrategyPair:
         Side-effects: sets all the ranges in the strategy pair, assuming the players start out with
                       their starting ranges and randomly (uniformly) select an action at each dec pt
         """
-        self.initializeHelper(0, 1.0, 1.0)
-
-    def initializeHelper(self, iCurrDecPt, sbScale, bbScale):
-        """
-        Inputs:
-           iCurrDecPt: index of the current decision point
-           sbScale and bbScale: numbers between 0 and 1 -- the fraction of the starting ranges that the
-                                players bring to this decision point
-        Outputs: N/A
-        Side-effects: Set the range corresponding to the current decision point, and call itself
-                      on all of the point's children (so as to do the right thing for them too)
-        """
-        children = self.tree.children[iCurrDecPt]
-        numChildren = len(children)
-        if self.tree.decPts[iCurrDecPt].player == 'SB':
-            sbScale /= numChildren
-            for iChild in children:
-                self.ranges[iChild].r = self.sbStartingRange.r.copy()
-                self.ranges[iChild].scaleFracs(sbScale)
-                self.ranges[iChild].removeHandsWithConflicts(self.tree.decPts[iCurrDecPt].eArray.board)
-        elif self.tree.decPts[iCurrDecPt].player == 'BB':
-            bbScale /= numChildren
-            for iChild in children:
-                self.ranges[iChild].r = self.bbStartingRange.r.copy()
-                self.ranges[iChild].scaleFracs(bbScale)
-                self.ranges[iChild].removeHandsWithConflicts(self.tree.decPts[iCurrDecPt].eArray.board)
-        for iChild in children:
-            self.initializeHelper(iChild, sbScale, bbScale)
+        # sbScales[i] and bbScales[i]: the fraction of the starting ranges that the players
+        # bring to decision point i.  Parents come before their children in preOrder.
+        sbScales = numpy.ones(self.size)
+        bbScales = numpy.ones(self.size)
+        for iCurrDecPt in self.tree.preOrder:
+            children = self.tree.children[iCurrDecPt]
+            sbScale = sbScales[iCurrDecPt]
+            bbScale = bbScales[iCurrDecPt]
+            if self.tree.decPts[iCurrDecPt].player == 'SB':
+                sbScale /= len(children)
+                for iChild in children:
+                    self.ranges[iChild].v = self.sbStartingRange.v.copy()
+                    self.ranges[iChild].scaleFracs(sbScale)
+                    self.ranges[iChild].removeHandsWithConflicts(self.tree.decPts[iCurrDecPt].eArray.board)
+            elif self.tree.decPts[iCurrDecPt].player == 'BB':
+                bbScale /= len(children)
+                for iChild in children:
+                    self.ranges[iChild].v = self.bbStartingRange.v.copy()
+                    self.ranges[iChild].scaleFracs(bbScale)
+                    self.ranges[iChild].removeHandsWithConflicts(self.tree.decPts[iCurrDecPt].eArray.board)
+            sbScales[children] = sbScale
+            bbScales[children] = bbScale
 
 ### Max Exploitative Strategy Functions ###
 
@@ -688,13 +1288,13 @@ class StrategyPair:
 #    assuming we play max exploitatively)
 # 2. Build the max expl strategy
 #
-# How to find the EV at every decision point in the tree?  Agai , we're going to use a recursive traversal
-#  of the tree.  Write a function that finds the EV at one decision point and have it call itself on the points children.
-#  Of course this is also necessary because the EV at any decPt depends on the EVs of the children.
+# How to find the EV at every decision point in the tree?  The EV at any decPt depends on the EVs of the
+#  children, so we write a function that finds the EV at one decision point, and call it on every point of
+#  the tree in post-order (tree.postOrder), which handles every point's children before the point itself.
 #
 # Review Chapter 2
 # So the right thing to do at any decision point is:
-#  - recursively find the EVs of all the children
+#  - the EVs of all the children have already been found
 #  - if we're at a leaf, we capture our equity in the pot if we see a showdown, and if there was a fold, we
 #    ship the pot to the right person
 #  - if we're at Hero's decPt, Hero will make the most profitable choice at any hand (max EV over all choices with our hand)
@@ -703,22 +1303,39 @@ class StrategyPair:
 #  - if we're at Nature's decPt, our EV is an average over EVs that we get after each of the possible future cards (card removal)
 
 
-def setMaxExplEVs(tree, strats, hero, villain):
+def setMaxExplEVs(tree, strats, hero, villain, pool = None):
     """
     Inputs:
       tree: a decision tree object
       strats: a StrategyPair
       hero: "SB" or "BB -- the player whose BB we're calculating
       villain: "SB" or "BB" -- the other guy
+      pool: optional, a NaturePool on tree to find the EVs under Nature points in parallel
     Outputs: N/A
     Side-effects: set all the EVs in strats.evs[hero] to be the max expl EVs
     """
-    setMaxExplEVsHelper(tree, 0, strats, hero, villain)
-
-# Again, the idea here is to work recursively - define a "helper" function that:
-#   - does the job for one decPt
-#   - calls itself on all the decPt's children
-# We do the job for every point in the tree by making one call to the helper starting at the root
+    profiler = strats.profiler
+    if pool is None:
+        postOrder = tree.postOrder
+    else:
+        with timed(profiler, 'pool'):
+            pool.setMaxExplEVs(strats, hero, villain)
+        postOrder = pool.mainNodes
+    if profiler is None:
+        for iDecPt in postOrder:
+            setMaxExplEVsHelper(tree, iDecPt, strats, hero, villain)
+        return
+    # the same, timing every point by its kind (see lib/hunl_profile.py)
+    kinds = {nodeTypeCodes['Leaf']: 'leaf', nodeTypeCodes[hero]: 'hero', nodeTypeCodes[villain]: 'villain',
+             nodeTypeCodes['Nature']: 'nature'}
+    playerCodes = tree.playerCodes
+    for iDecPt in postOrder:
+        start = time.perf_counter()
+        setMaxExplEVsHelper(tree, iDecPt, strats, hero, villain)
+        profiler.addNodeTime(kinds[playerCodes[iDecPt]], time.perf_counter() - start)
+
+# The "helper" function does the job for one decPt, assuming it has already been done for the
+# decPt's children
 
 def setMaxExplEVsHelper(tree, iDecPt, strats, hero, villain):
     """
@@ -729,7 +1346,8 @@ def setMaxExplEVsHelper(tree, iDecPt, strats, hero, villain):
       hero: "SB" or "BB -- the player whose BB we're calculating
       villain: "SB" or "BB" -- the other guy
     Outputs: N/A
-    Side-effects: set all the EVs in strats.evs[hero] to be the max expl EVs
+    Side-effects: set the EVs in strats.evs[hero][iDecPt] to be the max expl EVs, given the
+                  max expl EVs at the decision point's children
     """
     currDecPt = tree.decPts[iDecPt]
     if (currDecPt.player == 'Leaf'):
@@ -749,26 +1367,24 @@ def setMaxExplEVsAtLeaf(tree, iDecPt, strats, hero, villain):
     currDecPt = tree.decPts[iDecPt]
     if (currDecPt.parentAction == "fold"):
         if (tree.decPts[tree.parents[iDecPt]].player == hero): # Hero folded
-            strats.evs[hero][iDecPt] = numpy.ones_like(strats.evs[hero][iDecPt])*(tree.effStack - currDecPt.getPlayerCIP(hero))
+            strats.evs[hero][iDecPt] = tree.effStack - currDecPt.getPlayerCIP(hero)
         else: #Villain folded
-            strats.evs[hero][iDecPt] = numpy.ones_like(strats.evs[hero][iDecPt])*(tree.effStack + currDecPt.getPlayerCIP(villain))
+            strats.evs[hero][iDecPt] = tree.effStack + currDecPt.getPlayerCIP(villain)
     else: # we are seeing a showdown -- Hero's EV are all (S - (hero cip) + (hero cip + villain vip)*equity)
-        for i in range(0, numCards):
-            for j in range(i+1, numCards):
-                strats.evs[hero][iDecPt][i][j] = (tree.effStack - currDecPt.getPlayerCIP(hero)) +\
-                                                 (currDecPt.getPlayerCIP(hero)+currDecPt.getPlayerCIP(villain))*\
-                                                  getEquityVsRange([i, j],strats.getMostRecentRangeOf(villain,iDecPt),currDecPt.eArray)
-    setHandsWithConflicts(strats.evs[hero][iDecPt], currDecPt.eArray.board, -1)
+        eqs = getEquitiesVsRange(strats.getMostRecentRangeOf(villain, iDecPt), currDecPt.eArray)
+        if strats.profiler is not None:
+            strats.profiler.count('equityQueries')
+        strats.evs[hero][iDecPt] = (tree.effStack - currDecPt.getPlayerCIP(hero)) +\
+                                   (currDecPt.getPlayerCIP(hero)+currDecPt.getPlayerCIP(villain))*eqs
+    strats.evs[hero][iDecPt][~getLiveComboMask(currDecPt.eArray.board)] = -1
 
 def setMaxExplEVsAtHeroDP(tree, iDecPt, strats, hero, villain):
     """
     Signature is the same as for setMaxExplEVsHelper, but now we
       know the current decPt is Hero's
     """
-    strats.evs[hero][iDecPt] = -1 * numpy.ones_like(strats.evs[hero][iDecPt])
-    for iChild in tree.children[iDecPt]:
-        setMaxExplEVsHelper(tree, iChild, strats, hero, villain)
-        strats.evs[hero][iDecPt] = numpy.maximum(strats.evs[hero][iDecPt], strats.evs[hero][iChild])
+    children = tree.children[iDecPt]
+    strats.evs[hero][iDecPt] = numpy.maximum(numpy.max(strats.evs[hero][children], axis=0), -1)
 
 def setMaxExplEVsAtVillainDP(tree, iDecPt, strats, hero, villain):
     """
@@ -776,18 +1392,26 @@ def setMaxExplEVsAtVillainDP(tree, iDecPt, strats, hero, villain):
     current decPt is Villian's or every hand, our EV is (how often Villain
     takes each action) * (our EV when he takes that action)
     """
-    for iChild in tree.children[iDecPt]:
-        setMaxExplEVsHelper(tree, iChild, strats, hero, villain)
-    for i in range(0, numCards):
-        for j in range(i+1, numCards):
-            comboCounts = {}
-            totalNumHandsinRange = 0
-            for iChild in tree.children[iDecPt]:
-                comboCounts[iChild] = strats.ranges[iChild].getNumHandsWithoutConflicts([i,j])
-                totalNumHandsinRange += comboCounts[iChild]
-            strats.evs[hero][iDecPt][i][j] = 0
-            for iChild in tree.children[iDecPt]:
-                strats.evs[hero][iDecPt][i][j] += strats.evs[hero][iChild][i][j] * (comboCounts[iChild] / totalNumHandsinRange)
+    children = tree.children[iDecPt]
+    # for every child and every hand, the number of combos in the child's range that don't
+    # conflict with the hand, and our EV there
+    childCounts = getUnblockedCounts(strats.rangeBlock[children].T).T
+    if strats.profiler is not None:
+        strats.profiler.count('blockerCounts', len(children))
+    strats.evs[hero][iDecPt] = weightChildEVs(strats.evs[hero][children], childCounts)
+
+def weightChildEVs(childEVs, childCounts):
+    """
+    Inputs:
+      childEVs: array (number of children, numHands) of Hero's EV of every hand at every child
+      childCounts: array of the same shape of how often we get to each child with every hand
+    Output: array of length numHands of the average of the childEVs weighted by childCounts,
+            -1 (impossible) for hands that get to no child
+    Side-effects: N/A
+    """
+    total = numpy.sum(childCounts, axis=0)
+    weighted = numpy.sum(childEVs * childCounts, axis=0)
+    return numpy.where(total > 0, weighted / numpy.where(total > 0, total, 1.0), -1.0)
 
 # Signature is the same as for setMaxExplEVsHelper, but now we know the current decPt is Nature's
 #
@@ -829,32 +1453,203 @@ def setMaxExplEVsAtVillainDP(tree, iDecPt, strats, hero, villain):
 #    and those trees are necessarily approximations anyway).
 
 def setMaxExplEVsAtNatureDP(tree, iDecPt, strats, hero, villain):
-    for iChild in tree.children[iDecPt]:
-        setMaxExplEVsHelper(tree, iChild, strats, hero, villain)
+    children = tree.children[iDecPt]
     villainRange = strats.getMostRecentRangeOf(villain, iDecPt)
-    for i in range(0, numCards):
-        for j in range(i+1, numCards):
-            if conflicts([i,j], tree.decPts[iDecPt].eArray.board):
-                strats.evs[hero][iDecPt][i][j] = -1 # Mark -1 to indicate impossible situation
-            else:
-                comboCounts = {} # number of combos in Villain's range that don't conflict with the new card (or hero's hand)
-                comboSum = 0.0   # sum of comboCounts for all the children
-                for iChild in tree.children[iDecPt]:
-                    newBoard = tree.decPts[iChild].eArray.board
-                    if (conflicts(newBoard, [i,j])):
-                        comboCounts[iChild] = 0
-                    else:
-                        comboCounts[iChild] = villainRange.getNumHandsWithoutConflicts([i,j]) * tree.decPts[iChild].newCardFreq
-                    comboSum += comboCounts[iChild]
-                strats.evs[hero][iDecPt][i][j] = 0
-                if (comboSum == 0.0):
-                    strats.evs[hero][iDecPt][i][j] = -1
-                else:
-                    for iChild in tree.children[iDecPt]:
-                        strats.evs[hero][iDecPt][i][j] += strats.evs[hero][iChild][i][j] * (comboCounts[iChild] / comboSum)
+    boardLive = getLiveComboMask(tree.decPts[iDecPt].eArray.board)
+    # For every child, the number of combos in Villain's range that don't conflict with the new
+    # board, for every hand (0 for hands that conflict with the new board themselves)
+    # A child standing for several isomorphic deals counts once for every one of them, with
+    # Hero's hands mapped to the ones they play like in the child
+    childCounts = []
+    childEVs = []
+    for iChild in children:
+        evs = strats.evs[hero][iChild]
+        for board, comboMap, freq in tree.decPts[iChild].getDeals():
+            newBoardLive = getLiveComboMask(board)
+            childCounts.append(getUnblockedCounts(villainRange.v * newBoardLive) * newBoardLive * freq)
+            childEVs.append(evs if comboMap is None else evs[comboMap])
+    evs = weightChildEVs(numpy.array(childEVs), numpy.array(childCounts))
+    if strats.profiler is not None:
+        strats.profiler.count('blockerCounts', len(childCounts))
+    evs[~boardLive] = -1 # Mark -1 to indicate impossible situation
+    strats.evs[hero][iDecPt] = evs
+
+### Parallel Max Exploitative EVs ###
+
+# Given both players' ranges, the subtrees under a Nature point (one per card that can come) don't
+# depend on each other, so their max expl EVs can be found at the same time in different processes.
+# A NaturePool sends every subtree under the highest Nature points of a tree to a pool of worker
+# processes, and setMaxExplEVs(..., pool) then only has to do the points above them itself.
+# The workers rebuild the tree once when they start, and memory-map the same equity files as the
+# main process, so the operating system keeps one copy of every EquityArray.  Ranges go to the
+# workers, and EVs come back, through shared memory blocks instead of being pickled.
+
+def getSubtreeSizes(tree):
+    """
+    Input: tree - a Tree
+    Output: array of the number of points in the subtree of every point (counting the point)
+    Side-effects: N/A
+    """
+    n = tree.getNumPoints()
+    prePositions = numpy.empty(n, dtype=numpy.int64)
+    prePositions[tree.preOrder] = numpy.arange(n)
+    postPositions = numpy.empty(n, dtype=numpy.int64)
+    postPositions[tree.postOrder] = numpy.arange(n)
+    # a point's subtree comes right before it in postOrder and right after it in preOrder
+    return postPositions - prePositions + tree.depths + 1
+
+class NaturePool:
+    """
+    A pool of worker processes finding max expl EVs in the subtrees under a tree's Nature points
+    The data:
+      tree - the Tree (which must not change while the pool is open)
+      tasks - the points whose subtrees the workers handle, biggest subtrees first: the children
+              of every Nature point without a Nature point above it
+      taskNodes - every point in those subtrees
+      mainNodes - the other points, in postOrder; setMaxExplEVs does these itself
+      ranges and evs - NumPy arrays in shared memory holding every point's range and Hero's EVs
+    Constructor
+    Input:
+      tree - a Tree
+      workers - number of worker processes (default: one per CPU)
+    """
+    def __init__(self, tree, workers = None):
+        self.tree = tree
+        n = tree.getNumPoints()
+        natureCode = nodeTypeCodes['Nature']
+        isNature = tree.playerCodes == natureCode
+        # Nature points with no other Nature point above them
+        topNature = isNature & (getPathSums(tree.parentIndices, isNature) == 1)
+        sizes = getSubtreeSizes(tree)
+        postPositions = numpy.empty(n, dtype=numpy.int64)
+        postPositions[tree.postOrder] = numpy.arange(n)
+        tasks = [int(c) for i in numpy.nonzero(topNature)[0] for c in tree.children[i]]
+        self.tasks = sorted(tasks, key=lambda c: -sizes[c])
+        inTask = numpy.zeros(n, dtype=bool)
+        for c in self.tasks:
+            inTask[tree.postOrder[postPositions[c] - sizes[c] + 1:postPositions[c] + 1]] = True
+        self.taskNodes = numpy.nonzero(inTask)[0]
+        self.mainNodes = tree.postOrder[~inTask[tree.postOrder]]
+
+        self.rangesMemory = shared_memory.SharedMemory(create=True, size=(n + 2) * numHands * 4)
+        self.evsMemory = shared_memory.SharedMemory(create=True, size=n * numHands * 4)
+        # the last two rows of ranges are the SB's and BB's starting ranges
+        self.ranges = numpy.ndarray((n + 2, numHands), dtype=numpy.float32, buffer=self.rangesMemory.buf)
+        self.evs = numpy.ndarray((n, numHands), dtype=numpy.float32, buffer=self.evsMemory.buf)
+        self.pool = multiprocessing.Pool(workers, initializer=initNatureWorker,
+                                         initargs=(getTreeArrays(tree), self.rangesMemory.name, self.evsMemory.name))
+
+    def setMaxExplEVs(self, strats, hero, villain):
+        """
+        Inputs:
+          strats: a StrategyPair on the pool's tree
+          hero, villain: as for setMaxExplEVs
+        Output: N/A
+        Side-effects: sets strats.evs[hero] at every point in the pool's tasks' subtrees
+        """
+        n = self.tree.getNumPoints()
+        self.ranges[:n] = strats.rangeBlock
+        self.ranges[n] = strats.sbStartingRange.v
+        self.ranges[n + 1] = strats.bbStartingRange.v
+        self.pool.map(doNatureTask, [(c, hero, villain) for c in self.tasks], chunksize=1)
+        strats.evs[hero][self.taskNodes] = self.evs[self.taskNodes]
+
+    def close(self):
+        """
+        Inputs: N/A
+        Outputs: N/A
+        Side-effects: stops the worker processes and frees the shared memory
+        """
+        self.pool.close()
+        self.pool.join()
+        self.ranges = None
+        self.evs = None
+        for memory in [self.rangesMemory, self.evsMemory]:
+            memory.close()
+            memory.unlink()
+
+# What a worker process of a NaturePool keeps between tasks
+natureWorker = {}
+
+def initNatureWorker(treeArrays, rangesName, evsName):
+    """
+    Inputs:
+      treeArrays: getTreeArrays() of the pool's tree
+      rangesName and evsName: names of the pool's shared memory blocks
+    Outputs: N/A
+    Side-effects: rebuilds the tree in the worker process, and a StrategyPair on it whose ranges
+                  and EVs are views of the shared memory blocks
+    """
+    tree = makeTreeFromArrays(treeArrays)
+    n = tree.getNumPoints()
+    rangesMemory = shared_memory.SharedMemory(name=rangesName)
+    evsMemory = shared_memory.SharedMemory(name=evsName)
+    ranges = numpy.ndarray((n + 2, numHands), dtype=numpy.float32, buffer=rangesMemory.buf)
+    evs = numpy.ndarray((n, numHands), dtype=numpy.float32, buffer=evsMemory.buf)
+    # the ranges are set by the main process, so skip StrategyPair's initialization
+    strats = StrategyPair.__new__(StrategyPair)
+    strats.tree = tree
+    strats.size = n
+    strats.rangeBlock = ranges[:n]
+    strats.ranges = [Range(v=ranges[i]) for i in range(n)]
+    strats.sbStartingRange = Range(v=ranges[n])
+    strats.bbStartingRange = Range(v=ranges[n + 1])
+    # only Hero's EVs are read while finding Hero's max expl EVs
+    strats.evs = {'SB': evs, 'BB': evs}
+    strats.profiler = None
+    natureWorker['memory'] = (rangesMemory, evsMemory)
+    natureWorker['strats'] = strats
+    natureWorker['subtreeSizes'] = getSubtreeSizes(tree)
+    natureWorker['postPositions'] = numpy.argsort(tree.postOrder)
+
+def doNatureTask(task):
+    """
+    Input: task - tuple (number of the point at the top of a subtree, hero, villain)
+    Output: N/A
+    Side-effects: sets the max expl EVs of hero in the subtree, in the shared EVs
+    """
+    iTop, hero, villain = task
+    strats = natureWorker['strats']
+    tree = strats.tree
+    last = natureWorker['postPositions'][iTop]
+    for iDecPt in tree.postOrder[last - natureWorker['subtreeSizes'][iTop] + 1:last + 1]:
+        setMaxExplEVsHelper(tree, iDecPt, strats, hero, villain)
 
 ### Fictitious Play Functions ###
 
+def getMaxEVStrat(tree, hero, strats):
+    """
+    Inputs:
+      tree: a decision tree
+      hero: "SB" or "BB"
+      strats: a StrategyPair containing hero's max expl EVs (see setMaxExplEVs)
+    Output: array of the same shape as strats.rangeBlock whose rows for the children of hero's
+            decision points hold the (maximally exploitative) ranges taking those actions
+    Side-effects: N/A
+    """
+    result = numpy.zeros_like(strats.rangeBlock)
+    evs = strats.evs[hero]
+    startingRange = strats.getStartingRangeOf(hero).v
+    heroCode = nodeTypeCodes[hero]
+    # the row of result with the range hero gets to each point with (see Tree.rangeIndices).
+    # Hero's decision points are done in preOrder, so that row is set by the time we get to one.
+    rangeIndices = tree.rangeIndices[heroCode]
+    preOrder = tree.preOrder
+    for iCurrDecPt in preOrder[tree.playerCodes[preOrder] == heroCode]:
+        children = tree.children[iCurrDecPt]
+        iRange = rangeIndices[iCurrDecPt]
+        currRange = startingRange if iRange < 0 else result[iRange]
+        # every hand in the current range takes its highest-EV action (the first one, on ties);
+        # hands with no action of EV >= 0 are dropped
+        childEVs = evs[children]
+        iBest = numpy.argmax(childEVs, axis=0)
+        playable = (numpy.max(childEVs, axis=0) >= 0) & (currRange > 0)
+        for k, iChild in enumerate(children):
+            result[iChild] = numpy.where(playable & (iBest == k), currRange, 0.0)
+    if strats.profiler is not None:
+        strats.profiler.count('rangeCopies', len(strats.actionIndices[hero]))
+    return result
+
 def getAvgEV(strats, player, index):
     """
     Inputs:
@@ -863,39 +1658,302 @@ def getAvgEV(strats, player, index):
       index: the index or the number of an action (index is 0 at the top of the tree)
     Output: the average EV, over all hands, of player at index using strats
     """
-    numCombos = 0.0
-    summedEV = 0.0
     playerRange = strats.getMostRecentRangeOf(player, index)
-    for i in range(numCards):
-        for j in range(i+1, numCards):
-            ev = strats.evs[player][index][i][j] # ev of hand ij at this point
-            frac = playerRange.r[i][j] # fraction in range of hand ij at this point
-            if ev >= 0:
-                summedEV += ev * frac
-                numCombos += frac
-    return summedEV / numCombos
+    evs = strats.evs[player][index] # ev of every combo at this point
+    fracs = playerRange.v * (evs >= 0) # fraction in range of every combo, skipping impossible hands
+    return numpy.sum(evs * fracs, dtype=numpy.float64) / numpy.sum(fracs, dtype=numpy.float64)
 
-def doFP(tree, nIter, sbStartingRange = None, bbStartingRange = None):
+def doFPIteration(tree, strats, i, pool = None):
     """
     Inputs:
-      tree: a Tree that we are going to solve
-      nIter: number of iterations to run for
-      sbStartingRange and bbStartingRange: optional, Range objects
+      tree: a Tree
+      strats: the StrategyPair being solved for
+      i: the iteration number (starting from 1)
+      pool: optional, a NaturePool on tree
+    Outputs: (SB average EV, BB average EV) at the root, each vs the other's strategy
+    Side-effects: mixes each player's max expl strategy into strats, SB first; if strats has a
+                  profiler, records the time spent in each phase in it
     """
-    # initialize guess at strategies for both players
-    strats = StrategyPair(tree, sbStartingRange, bbStartingRange)
-
-    for i in range(1, nIter+1):
-        print i
-
-        setMaxExplEVs(tree, strats, "SB", "BB")
+    profiler = strats.profiler
+    with timed(profiler, 'maxExplEVs'):
+        setMaxExplEVs(tree, strats, "SB", "BB", pool)
+    with timed(profiler, 'maxEVStrat'):
         sbMaxEVStrat = getMaxEVStrat(tree, "SB", strats)
+    with timed(profiler, 'updateRanges'):
         strats.updateRanges("SB", sbMaxEVStrat, i)
-        print "SB average EV:" + str(getAvgEV(strats, 'SB', 0))
+    with timed(profiler, 'avgEV'):
+        sbAvgEV = getAvgEV(strats, 'SB', 0)
 
-        setMaxExplEVs(tree, strats, "BB", "SB")
+    with timed(profiler, 'maxExplEVs'):
+        setMaxExplEVs(tree, strats, "BB", "SB", pool)
+    with timed(profiler, 'maxEVStrat'):
         bbMaxEVStrat = getMaxEVStrat(tree, "BB", strats)
+    with timed(profiler, 'updateRanges'):
         strats.updateRanges("BB", bbMaxEVStrat, i)
-        print "BB average EV:" + str(getAvgEV(strats, 'BB', 0))
+    with timed(profiler, 'avgEV'):
+        bbAvgEV = getAvgEV(strats, 'BB', 0)
+    return sbAvgEV, bbAvgEV
 
+def getExploitability(tree, strats, pool = None):
+    """
+    Inputs:
+      tree: a Tree
+      strats: a StrategyPair
+      pool: optional, a NaturePool on tree
+    Output: how far strats is from equilibrium in BB: the average of what the two players'
+            max expl strategies win vs the other's strategy, (SB max expl EV + BB max expl EV - 2*S) / 2
+    Side-effects: sets strats.evs to the max expl EVs of both players
+    """
+    setMaxExplEVs(tree, strats, "SB", "BB", pool)
+    setMaxExplEVs(tree, strats, "BB", "SB", pool)
+    return (getAvgEV(strats, 'SB', 0) + getAvgEV(strats, 'BB', 0) - 2 * tree.effStack) / 2.0
+
+### Solve Checkpoints ###
+
+def getTreeArrays(tree):
+    """
+    Input: tree - a Tree
+    Output: dict of NumPy arrays describing tree completely: its effective stack, and the
+            player, chips in pot, board, parent action, new card frequency, isomorphic deals
+            and parent of every point.  The isomorphic deals of point i are the isoBoards and
+            isoPerms (numbers in hunl_iso.suitPerms) from isoOffsets[i] to isoOffsets[i+1].
+    Side-effects: N/A
+    """
+    isoDeals = [point.isoDeals or [] for point in tree.decPts]
+    isoOffsets = numpy.zeros(tree.getNumPoints() + 1, dtype=numpy.int64)
+    numpy.cumsum([len(deals) for deals in isoDeals], out=isoOffsets[1:])
+    return {'effStack': numpy.array(tree.effStack, dtype=numpy.float64),
+            'playerCodes': tree.playerCodes,
+            'sbCIPs': tree.sbCIPs,
+            'bbCIPs': tree.bbCIPs,
+            'boards': numpy.array([point.eArray.board for point in tree.decPts], dtype=numpy.uint8),
+            'parentActions': numpy.array([point.parentAction for point in tree.decPts], dtype=numpy.str_),
+            'newCardFreqs': numpy.array([point.newCardFreq for point in tree.decPts], dtype=numpy.float64),
+            'isoOffsets': isoOffsets,
+            'isoBoards': numpy.array([board for deals in isoDeals for board, perm in deals],
+                                     dtype=numpy.uint8).reshape(-1, 5),
+            'isoPerms': numpy.array([suitPerms.index(tuple(perm)) for deals in isoDeals for board, perm in deals],
+                                    dtype=numpy.int8),
+            'parentIndices': tree.parentIndices}
+
+def makeTreeFromArrays(arrays):
+    """
+    Input: arrays - dict (or loaded npz file) of arrays returned by getTreeArrays
+    Output: a new Tree with the same points, numbered the same way
+    Side-effects: loads (or builds) the EquityArray of every board in the tree
+    """
+    # read every array once (an npz file reads an array from disk every time it is indexed)
+    playerCodes = arrays['playerCodes'].tolist()
+    sbCIPs = arrays['sbCIPs'].tolist()
+    bbCIPs = arrays['bbCIPs'].tolist()
+    boards = arrays['boards'].tolist()
+    parentActions = arrays['parentActions'].tolist()
+    newCardFreqs = arrays['newCardFreqs'].tolist()
+    parentIndices = arrays['parentIndices'].tolist()
+    if 'isoOffsets' in arrays:
+        isoOffsets = arrays['isoOffsets'].tolist()
+        isoBoards = arrays['isoBoards'].tolist()
+        isoPerms = arrays['isoPerms'].tolist()
+    else: # written before points could stand for isomorphic deals
+        isoOffsets = [0] * (len(playerCodes) + 1)
+    points = []
+    tree = None
+    for i in range(len(playerCodes)):
+        isoDeals = None
+        if isoOffsets[i+1] > isoOffsets[i]:
+            isoDeals = [(isoBoards[k], suitPerms[isoPerms[k]]) for k in range(isoOffsets[i], isoOffsets[i+1])]
+        point = DecPt(nodeTypes[playerCodes[i]], sbCIPs[i], bbCIPs[i], getEquityArray(boards[i]),
+                      parentActions[i], newCardFreqs[i], isoDeals)
+        if i == 0:
+            tree = Tree(float(arrays['effStack']), point)
+        else:
+            tree.addDecPt(point, points[parentIndices[i]])
+        points.append(point)
+    return tree
+
+def isSameTree(tree, arrays):
+    """
+    Inputs:
+      tree: a Tree
+      arrays: dict (or loaded npz file) of arrays returned by getTreeArrays
+    Output: True if arrays describes tree
+    Side-effects: N/A
+    """
+    treeArrays = getTreeArrays(tree)
+    return all(numpy.array_equal(treeArrays[key], arrays[key]) for key in treeArrays if key in arrays)
+
+def saveFPCheckpoint(path, strats):
+    """
+    Inputs:
+      path: file to write (an .npz file)
+      strats: the StrategyPair being solved for; strats.iteration is the number of the last
+              iteration done
+    Output: N/A
+    Side-effects: atomically writes everything needed to continue the solve to path: the tree,
+                  the starting ranges, every point's range, the iteration number and the
+                  exploitability checks so far.  The EVs aren't saved: each iteration
+                  recomputes them from the ranges.
+    """
+    arrays = getTreeArrays(strats.tree)
+    arrays['ranges'] = strats.rangeBlock
+    arrays['sbStartingRange'] = strats.sbStartingRange.v
+    arrays['bbStartingRange'] = strats.bbStartingRange.v
+    arrays['iteration'] = numpy.array(strats.iteration)
+    arrays['convergence'] = numpy.array(strats.convergence, dtype=numpy.float64).reshape(-1, 2)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        numpy.savez(f, **arrays)
+    os.replace(tmpPath, path)
+
+def loadFPCheckpoint(path, tree = None):
+    """
+    Inputs:
+      path: a file written by saveFPCheckpoint
+      tree: optional, the Tree the checkpoint was written for; if not given, the tree is
+            rebuilt from the checkpoint
+    Output: the StrategyPair as it was when the checkpoint was written, with its iteration
+            and convergence attributes set
+    Side-effects: N/A
+    """
+    with numpy.load(path) as data:
+        if tree is None:
+            tree = makeTreeFromArrays(data)
+        elif not isSameTree(tree, data):
+            raise ValueError("Checkpoint %s was written for a different tree" % path)
+        sbStartingRange = Range()
+        sbStartingRange.v = data['sbStartingRange']
+        bbStartingRange = Range()
+        bbStartingRange.v = data['bbStartingRange']
+        strats = StrategyPair(tree, sbStartingRange, bbStartingRange)
+        strats.rangeBlock[:] = data['ranges']
+        strats.iteration = int(data['iteration'])
+        strats.convergence = [(int(i), float(e)) for i, e in data['convergence']]
+    return strats
+
+### Solving ###
+
+def doFP(tree, nIter, sbStartingRange = None, bbStartingRange = None, checkEvery = 10,
+         targetExploitability = None, targetPctPot = None, checkpointPath = None, checkpointEvery = 10,
+         workers = None, profiler = None):
+    """
+    Inputs:
+      tree: a Tree that we are going to solve
+      nIter: most iterations to run for
+      sbStartingRange and bbStartingRange: optional, Range objects
+      checkEvery: number of iterations between exploitability checks
+      targetExploitability: optional; stop at the first check where exploitability is at most
+                            this many BB
+      targetPctPot: optional; stop at the first check where exploitability is at most this
+                    percentage of the pot at the root
+      checkpointPath: optional; file to write a checkpoint to (see saveFPCheckpoint) every
+                      checkpointEvery iterations and when the solve stops, so that an
+                      interrupted solve can be continued with resumeFP
+      workers: optional; if more than 1, the subtrees under Nature points are solved in a
+               NaturePool of this many processes
+      profiler: optional, a SolveProfiler (see lib/hunl_profile.py) to record the solve's timings,
+                counts and memory use in
+    Output: the StrategyPair.  Its convergence attribute lists (iteration, exploitability in BB)
+            for every check.  Exploitability is that of the ranges after the iteration (see
+            getExploitability), so a check costs about one more iteration
+    """
+    # initialize guess at strategies for both players
+    strats = StrategyPair(tree, sbStartingRange, bbStartingRange)
+    strats.iteration = 0
+    strats.convergence = []
+    runFP(strats, nIter, checkEvery, targetExploitability, targetPctPot, checkpointPath, checkpointEvery, workers,
+          profiler)
     return strats
+
+def resumeFP(checkpointPath, nIter, tree = None, checkEvery = 10, targetExploitability = None,
+             targetPctPot = None, checkpointEvery = 10, workers = None, profiler = None):
+    """
+    Inputs:
+      checkpointPath: a checkpoint written by doFP (or resumeFP); it keeps being updated
+      nIter: total iterations to run for, counting the ones done before the checkpoint
+      tree: optional, the Tree being solved; if not given, it is rebuilt from the checkpoint
+      other inputs: as for doFP
+    Output: the StrategyPair, exactly as doFP would have returned it had it not been interrupted
+            (with the same checkEvery)
+    """
+    strats = loadFPCheckpoint(checkpointPath, tree)
+    # a solve that stopped at its last iteration checked there too; an uninterrupted one wouldn't have
+    strats.convergence = [(i, e) for i, e in strats.convergence if i % checkEvery == 0]
+    print("Resuming after iteration %d" % strats.iteration)
+    runFP(strats, nIter, checkEvery, targetExploitability, targetPctPot, checkpointPath, checkpointEvery, workers,
+          profiler)
+    return strats
+
+def runFP(strats, nIter, checkEvery, targetExploitability, targetPctPot, checkpointPath, checkpointEvery,
+          workers = None, profiler = None):
+    """
+    Inputs:
+      strats: a StrategyPair with iteration and convergence attributes
+      other inputs: as for doFP
+    Output: N/A
+    Side-effects: continues fictitious play on strats from iteration strats.iteration + 1
+    """
+    tree = strats.tree
+    pool = None
+    if workers is not None and workers > 1 and numpy.any(tree.playerCodes == nodeTypeCodes['Nature']):
+        pool = NaturePool(tree, workers)
+    if profiler is not None:
+        profiler.startSolve(tree, nIter, strats.iteration + 1)
+    strats.profiler = profiler
+    try:
+        runFPIterations(strats, nIter, checkEvery, targetExploitability, targetPctPot, checkpointPath,
+                        checkpointEvery, pool)
+    finally:
+        strats.profiler = None
+        if profiler is not None:
+            profiler.endSolve()
+        if pool is not None:
+            pool.close()
+
+def runFPIterations(strats, nIter, checkEvery, targetExploitability, targetPctPot, checkpointPath,
+                    checkpointEvery, pool):
+    """
+    Inputs: as for runFP, with the NaturePool to use (or None) instead of a number of workers
+    Output: N/A
+    Side-effects: see runFP
+    """
+    tree = strats.tree
+    profiler = strats.profiler
+    pot = tree.decPts[0].initial_sb_cip + tree.decPts[0].initial_bb_cip
+
+    for i in range(strats.iteration + 1, nIter+1):
+        print(i)
+        if profiler is not None:
+            profiler.startIteration(i)
+        sbAvgEV, bbAvgEV = doFPIteration(tree, strats, i, pool)
+        strats.iteration = i
+        print("SB average EV:" + str(sbAvgEV))
+        print("BB average EV:" + str(bbAvgEV))
+
+        done = i == nIter
+        exploitability = None
+        if i % checkEvery == 0 or i == nIter:
+            # the average EVs above are for (SB_i, BB_i-1) and (SB_i, BB_i), so measure the pair
+            # actually returned with both max expl strategies against it
+            with timed(profiler, 'exploitability'):
+                exploitability = float(getExploitability(tree, strats, pool))
+            strats.convergence.append((i, exploitability))
+            print("Exploitability: %g BB (%g%% of pot)" % (exploitability, 100.0 * exploitability / pot))
+            if ((targetExploitability is not None and exploitability <= targetExploitability) or
+                (targetPctPot is not None and 100.0 * exploitability / pot <= targetPctPot)):
+                print("Reached target exploitability after %d iterations" % i)
+                done = True
+        if profiler is not None:
+            fields = {'sbAvgEV': sbAvgEV, 'bbAvgEV': bbAvgEV}
+            if exploitability is not None:
+                fields['exploitability'] = exploitability
+            profiler.endIteration(**fields)
+
+        if checkpointPath is not None and (done or i % checkpointEvery == 0):
+            saveFPCheckpoint(checkpointPath, strats)
+            if profiler is not None:
+                profiler.checkpoint(checkpointPath)
+        if done:
+            break
@@ -0,0 +1,146 @@
+"""
+Suit isomorphism
+
+Two boards that differ only by a relabelling of the suits (e.g. AhJd2c and AsJc2d) are the
+same strategic spot.  Every board is mapped to one canonical representative plus the suit
+permutation taking the board to it, so that one equity array can serve every board
+isomorphic to it: the equity of hand vs villainHand on a board is the equity of the permuted
+hands on the canonical board.
+
+A suit permutation is a tuple perm such that suit s becomes suit perm[s] (suits numbered as
+in hunl_fn, card c has suit c // 13).
+"""
+import itertools
+import numpy
+from lib.hunl_combos import numCards, comboCards, comboIndex
+
+numRanks = 13
+numSuits = 4
+
+suitPerms = list(itertools.permutations(range(numSuits)))
+identityPerm = suitPerms[0]
+
+# cardPerms[k][c] is card c after applying suitPerms[k] (with 255, the empty card, unchanged)
+cardPerms = numpy.zeros((len(suitPerms), numCards + 1), dtype=numpy.int32)
+for _k, _perm in enumerate(suitPerms):
+    for _c in range(numCards):
+        cardPerms[_k][_c] = _perm[_c // numRanks] * numRanks + _c % numRanks
+    cardPerms[_k][numCards] = 255
+
+# comboPerms[k][a] is the combo that combo a becomes under suitPerms[k]
+comboPerms = comboIndex[cardPerms[:, comboCards[:, 0]], cardPerms[:, comboCards[:, 1]]]
+
+def _cardSortKey(c):
+    """ Canonical boards list their cards from the highest rank down, ties broken by suit """
+    return (numRanks - 1 - c % numRanks, c // numRanks)
+
+def permuteCards(cardsList, perm):
+    """
+    Input:
+      cardsList - list of card numbers (255 for empty cards)
+      perm - a suit permutation
+    Output: the cards with their suits relabelled by perm
+    Side-effects: N/A
+    """
+    k = suitPerms.index(tuple(perm))
+    return [int(cardPerms[k][min(c, numCards)]) for c in cardsList]
+
+def getComboPerm(perm):
+    """
+    Input: perm - a suit permutation
+    Output: int array of length numHands mapping every combo to the combo it becomes under perm
+    Side-effects: N/A
+    """
+    return comboPerms[suitPerms.index(tuple(perm))]
+
+def getCanonicalBoard(board):
+    """
+    Input: board - list of numbers describing a board (255 for cards not yet dealt)
+    Output: (canonicalBoard, perm) where perm is a suit permutation such that
+            permuteCards(board, perm) holds the same cards as canonicalBoard.  canonicalBoard is
+            the same for every board isomorphic to this one; it lists its cards in canonical
+            order (highest rank first) followed by the same number of 255s as board.
+    Side-effects: N/A
+    """
+    known = [c for c in board if c < numCards]
+    best = None
+    for k, perm in enumerate(suitPerms):
+        key = sorted(_cardSortKey(int(cardPerms[k][c])) for c in known)
+        if best is None or key < best[0]:
+            best = (key, perm)
+    key, perm = best
+    canonicalBoard = [(numRanks - 1 - r) + s * numRanks for r, s in key]
+    return canonicalBoard + [255] * (len(board) - len(known)), perm
+
+def isCanonicalBoard(board):
+    """
+    Input: board - list of numbers describing a board
+    Output: True if board is its own canonical representative (same cards, same order)
+    Side-effects: N/A
+    """
+    return list(board) == getCanonicalBoard(board)[0]
+
+def getCanonicalBoards(nCards, baseBoard = None):
+    """
+    Input:
+      nCards - number of board cards (3 for flops, 4 for turns, 5 for rivers)
+      baseBoard - optional list of known board cards; only boards extending it are listed
+    Output: list of the distinct canonical boards of nCards cards, each padded to 5 with 255s.
+            e.g. getCanonicalBoards(3) lists the 1755 strategically distinct flops
+    Side-effects: N/A
+    """
+    base = [c for c in (baseBoard or []) if c < numCards]
+    deck = [c for c in range(numCards) if c not in base]
+    seen = set()
+    result = []
+    for extra in itertools.combinations(deck, nCards - len(base)):
+        canonicalBoard = tuple(getCanonicalBoard(base + list(extra))[0])
+        if canonicalBoard not in seen:
+            seen.add(canonicalBoard)
+            result.append(list(canonicalBoard) + [255] * (5 - nCards))
+    return result
+
+# the cards of every street on a 5-card board: flop, turn and river
+streetSlices = [slice(0, 3), slice(3, 4), slice(4, 5)]
+
+def getBoardStabilizer(board):
+    """
+    Input: board - list of 5 numbers describing a board (255 for cards not yet dealt)
+    Output: list of the suit permutations that map every street of board onto itself (as a
+            set of cards), so that they don't change anything that has happened on the board
+    Side-effects: N/A
+    """
+    result = []
+    for k, perm in enumerate(suitPerms):
+        if all(sorted(int(cardPerms[k][min(c, numCards)]) for c in board[s]) == sorted(board[s])
+               for s in streetSlices):
+            result.append(perm)
+    return result
+
+def groupIsomorphicBoards(board, nextBoards):
+    """
+    Input:
+      board - list of 5 numbers describing the board before a deal
+      nextBoards - list of the boards the deal can make (board plus the new cards)
+    Output: list of (representative, deals), one for every class of nextBoards that only differ
+            by a suit permutation leaving board unchanged (see getBoardStabilizer).  The
+            representative is the first board of its class in nextBoards, and deals lists
+            (nextBoard, perm) for every board of the class, where perm takes nextBoard to the
+            representative.
+    Side-effects: N/A
+    """
+    stabilizer = getBoardStabilizer(board)
+    known = set(c for c in board if c < numCards)
+    groups = []
+    repIndex = {}
+    for nextBoard in nextBoards:
+        newCards = sorted(c for c in nextBoard if c < numCards and c not in known)
+        for perm in stabilizer:
+            key = tuple(sorted(permuteCards(newCards, perm)))
+            if key in repIndex:
+                groups[repIndex[key]][1].append((list(nextBoard), perm))
+                break
+        else:
+            repIndex[tuple(newCards)] = len(groups)
+            groups.append((list(nextBoard), [(list(nextBoard), identityPerm)]))
+    return groups
@@ -0,0 +1,147 @@
+"""
+Batch precompute of equity arrays
+
+Builds the compact equity files (see lib/hunl_equity.py) for many boards at once, spread over
+a pool of worker processes.  Run from the repository root, e.g.
+
+    python -m lib.hunl_precompute '***'              # every canonical flop (1755 boards)
+    python -m lib.hunl_precompute 'AhKdQs*'          # every turn under AhKdQs
+    python -m lib.hunl_precompute 'AhKdQs**' 8c7c2d  # every river under AhKdQs, plus one flop
+    python -m lib.hunl_precompute --file boards.txt --workers 8
+
+Each board pattern is a board string where every trailing '*' stands for one more card, in
+every way it can fall.  Boards are reduced to their canonical representatives first, so each
+strategically distinct board is built exactly once, and boards whose file already exists are
+skipped.  Workers checkpoint their progress into <outdir>/partial/ every --checkpoint-every
+runouts and every file is written atomically, so a killed run can simply be started again and
+resumes where it left off.
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from lib.hunl_combos import parseCards
+from lib.hunl_iso import getCanonicalBoard, getCanonicalBoards
+from lib.hunl_equity import EquityTableBuilder, packEquityTable, rankHands, getBoardString, \
+    getEquityFilename, getRankingFilename, saveArrayAtomic, equityDir
+
+def expandBoardPattern(pattern):
+    """
+    Input: pattern - board string with optional trailing '*'s, e.g. 'AhKdQs*' or '***'
+    Output: list of the distinct canonical boards (padded to 5 cards) matching pattern
+    Side-effects: N/A
+    """
+    base = parseCards(pattern.rstrip('*'))
+    nCards = len(base) + pattern.count('*')
+    if nCards < 3 or nCards > 5:
+        raise ValueError("Board pattern %s must describe a flop, turn or river" % pattern)
+    if nCards == len(base):
+        return [getCanonicalBoard(base + [255] * (5 - nCards))[0]]
+    return getCanonicalBoards(nCards, base)
+
+def getBoardList(patterns):
+    """
+    Input: patterns - list of board patterns
+    Output: list of distinct canonical boards matching any of the patterns, in order
+    Side-effects: N/A
+    """
+    seen = set()
+    boards = []
+    for pattern in patterns:
+        for board in expandBoardPattern(pattern):
+            if tuple(board) not in seen:
+                seen.add(tuple(board))
+                boards.append(board)
+    return boards
+
+def getCheckpointPath(outdir, board):
+    """ Output: path of the partial-progress file for board """
+    return os.path.join(outdir, 'partial', getBoardString(board) + '.ckpt.npz')
+
+def buildBoard(job):
+    """
+    Input: job - tuple (board, outdir, checkpointEvery)
+    Output: tuple (board, number of runouts enumerated by this call)
+    Side-effects: builds and atomically writes the board's equity and hand ranking files,
+                  resuming from and periodically writing a checkpoint in outdir/partial/
+    """
+    board, outdir, checkpointEvery = job
+    checkpointPath = getCheckpointPath(outdir, board)
+    builder = EquityTableBuilder(board)
+    if os.path.isfile(checkpointPath):
+        builder.loadCheckpoint(checkpointPath)
+    startRunout = builder.nextRunout
+    while not builder.isDone():
+        builder.addRunouts(checkpointEvery)
+        if not builder.isDone():
+            builder.saveCheckpoint(checkpointPath)
+    table = builder.getTable()
+    saveArrayAtomic(os.path.join(outdir, getRankingFilename(board)), rankHands(table, board))
+    saveArrayAtomic(os.path.join(outdir, getEquityFilename(board)), packEquityTable(table))
+    if os.path.isfile(checkpointPath):
+        os.remove(checkpointPath)
+    return board, builder.getNumRunouts() - startRunout
+
+def precompute(boards, outdir = equityDir, workers = None, checkpointEvery = 100):
+    """
+    Input:
+      boards - list of canonical boards
+      outdir - directory to write the equity files to
+      workers - number of worker processes (default: one per CPU)
+      checkpointEvery - number of runouts between checkpoints of a board in progress
+    Output: number of boards built
+    Side-effects: builds the equity file of every board in boards that doesn't have one yet,
+                  printing progress and throughput as boards finish
+    """
+    if not os.path.isdir(os.path.join(outdir, 'partial')):
+        os.makedirs(os.path.join(outdir, 'partial'))
+    todo = [b for b in boards if not os.path.isfile(os.path.join(outdir, getEquityFilename(b)))]
+    print("%d boards requested, %d already built, %d to build" % (len(boards), len(boards) - len(todo), len(todo)))
+    if not todo:
+        return 0
+    jobs = [(b, outdir, checkpointEvery) for b in todo]
+    pool = multiprocessing.Pool(workers)
+    startTime = time.time()
+    nDone = 0
+    try:
+        for board, nRunouts in pool.imap_unordered(buildBoard, jobs):
+            nDone += 1
+            minutes = (time.time() - startTime) / 60.0
+            print("[%d/%d] %s (%d runouts)  %.1f boards/min" %
+                  (nDone, len(todo), getBoardString(board), nRunouts, nDone / minutes))
+            sys.stdout.flush()
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print("Interrupted after %d boards; run again to resume" % nDone)
+        raise
+    except BaseException: # e.g. a worker failed; stop the others and report its error
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    minutes = (time.time() - startTime) / 60.0
+    print("Built %d boards in %.1f minutes (%.1f boards/min)" % (nDone, minutes, nDone / minutes))
+    return nDone
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Build equity arrays for many boards in parallel.")
+    parser.add_argument('patterns', nargs='*', help="board patterns, e.g. AhKdQs, 'AhKdQs*' or '***'")
+    parser.add_argument('--file', help="file with one board pattern per line")
+    parser.add_argument('--outdir', default=equityDir, help="output directory (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--checkpoint-every', type=int, default=100,
+                        help="runouts between checkpoints of a board in progress (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    patterns = list(args.patterns)
+    if args.file:
+        with open(args.file) as f:
+            patterns += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    if not patterns:
+        parser.error("no boards given")
+    precompute(getBoardList(patterns), args.outdir, args.workers, args.checkpoint_every)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Solve instrumentation
+
+A SolveProfiler records where a fictitious-play solve (hunl_fn.doFP) spends its time: wall
+time per iteration, split by phase (max expl EVs, max expl strategies, range updates, average
+EVs, exploitability checks) and by the kind of point the max expl EVs are found at (leaf, hero, villain, nature),
+counts of the expensive operations (showdown equity queries, blocker counts, range vectors
+written) and the process's peak memory.  Everything is emitted as events (dicts that can be
+written as JSON) to a callback and/or a JSONL file, one line per event:
+
+    profiler = SolveProfiler(path='solve.jsonl')
+    strats = hunl.doFP(tree, 100, profiler=profiler)
+    profiler.printSummary()
+
+Events have an 'event' field: 'start' (tree size and points of every kind), 'iteration'
+(everything recorded during one iteration), 'checkpoint' and 'end' (totals over the solve).
+"""
+import sys
+import json
+import time
+import contextlib
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+# the kinds of point max expl EVs are found at
+nodeKinds = ['leaf', 'hero', 'villain', 'nature']
+
+def getPeakMemoryBytes():
+    """ Output: peak resident memory of this process in bytes, None where it can't be found """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # bytes on macOS, KB elsewhere
+
+def timed(profiler, phase):
+    """
+    Inputs:
+      profiler: a SolveProfiler, or None
+      phase: name of the phase
+    Output: context manager adding the time spent in it to phase in profiler (doing nothing
+            if profiler is None)
+    """
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.timePhase(phase)
+
+class SolveProfiler:
+    """
+    Collects timings and counts during a solve, and emits them as events
+    The data:
+      callback - function called with every event, or None
+      path - JSONL file every event is appended to, or None
+      phaseSeconds, nodeSeconds, nodeCounts, counts - what has been recorded during the
+                                                      current iteration
+      totals - the same, summed over all iterations so far
+    Constructor
+    Input:
+      callback - optional function of one argument, called with every event (a dict)
+      path - optional file to append every event to, as a line of JSON
+    """
+    def __init__(self, callback = None, path = None):
+        self.callback = callback
+        self.path = path
+        self.file = open(path, 'a') if path is not None else None
+        self.totals = {'seconds': 0.0, 'iterations': 0, 'phaseSeconds': {}, 'nodeSeconds': {},
+                       'nodeCounts': {}, 'counts': {}}
+        self.resetIteration()
+
+    def resetIteration(self):
+        """ Side-effects: clears what has been recorded during the current iteration """
+        self.phaseSeconds = {}
+        self.nodeSeconds = dict((kind, 0.0) for kind in nodeKinds)
+        self.nodeCounts = dict((kind, 0) for kind in nodeKinds)
+        self.counts = {}
+        self.iterationStart = time.perf_counter()
+
+    def emit(self, event):
+        """
+        Input: event - dict
+        Output: N/A
+        Side-effects: passes event to the callback and appends it to the JSONL file
+        """
+        event = dict(event, time=time.time())
+        if self.callback is not None:
+            self.callback(event)
+        if self.file is not None:
+            self.file.write(json.dumps(event) + '\n')
+            self.file.flush()
+
+    def startSolve(self, tree, nIter, firstIteration):
+        """
+        Inputs:
+          tree: the Tree being solved
+          nIter: last iteration to run
+          firstIteration: first iteration to run (more than 1 when resuming)
+        Side-effects: emits a 'start' event
+        """
+        kinds = {}
+        for point in tree.decPts:
+            kinds[point.player] = kinds.get(point.player, 0) + 1
+        self.emit({'event': 'start', 'numPoints': tree.getNumPoints(), 'pointsByPlayer': kinds,
+                   'firstIteration': firstIteration, 'nIter': nIter})
+        self.solveStart = time.perf_counter()
+
+    def startIteration(self, i):
+        """ Side-effects: starts recording iteration i """
+        self.iteration = i
+        self.resetIteration()
+
+    @contextlib.contextmanager
+    def timePhase(self, phase):
+        """ Context manager adding the time spent in it to phase (see timed) """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phaseSeconds[phase] = self.phaseSeconds.get(phase, 0.0) + time.perf_counter() - start
+
+    def addNodeTime(self, kind, seconds):
+        """ Side-effects: records seconds spent finding the max expl EVs at a point of kind (see nodeKinds) """
+        self.nodeSeconds[kind] += seconds
+        self.nodeCounts[kind] += 1
+
+    def count(self, name, n = 1):
+        """ Side-effects: adds n to the counter name """
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def endIteration(self, **fields):
+        """
+        Input: fields - more fields for the event, e.g. the average EVs
+        Output: N/A
+        Side-effects: emits an 'iteration' event with everything recorded during the iteration,
+                      and adds it to the totals
+        """
+        seconds = time.perf_counter() - self.iterationStart
+        event = {'event': 'iteration', 'iteration': self.iteration, 'seconds': seconds,
+                 'phaseSeconds': self.phaseSeconds, 'nodeSeconds': self.nodeSeconds,
+                 'nodeCounts': self.nodeCounts, 'counts': self.counts,
+                 'peakMemoryBytes': getPeakMemoryBytes()}
+        event.update((key, float(value)) for key, value in fields.items())
+        self.emit(event)
+        self.totals['seconds'] += seconds
+        self.totals['iterations'] += 1
+        for key in ['phaseSeconds', 'nodeSeconds', 'nodeCounts', 'counts']:
+            for name, value in event[key].items():
+                self.totals[key][name] = self.totals[key].get(name, 0) + value
+
+    def checkpoint(self, path):
+        """ Side-effects: emits a 'checkpoint' event for a checkpoint written to path """
+        self.emit({'event': 'checkpoint', 'iteration': self.iteration, 'path': path})
+
+    def endSolve(self):
+        """ Side-effects: emits an 'end' event with the totals over the solve """
+        self.emit(dict(self.totals, event='end', wallSeconds=time.perf_counter() - self.solveStart,
+                       peakMemoryBytes=getPeakMemoryBytes()))
+
+    def printSummary(self):
+        """
+        Inputs: N/A
+        Outputs: N/A
+        Side-effects: prints the share of the solve's time spent in every phase and at every
+                      kind of point, and the counters
+        """
+        total = self.totals['seconds']
+        print("%d iterations in %.3f s" % (self.totals['iterations'], total))
+        for key in ['phaseSeconds', 'nodeSeconds']:
+            for name, seconds in sorted(self.totals[key].items(), key=lambda item: -item[1]):
+                print("  %-14s %10.3f s %6.1f%%" % (name, seconds, 100.0 * seconds / total if total > 0 else 0.0))
+        for name, n in sorted(self.totals['counts'].items()):
+            print("  %-14s %10d" % (name, n))
+        peak = getPeakMemoryBytes()
+        if peak is not None:
+            print("  peak memory    %10.1f MB" % (peak / 1e6))
+
+    def close(self):
+        """ Side-effects: closes the JSONL file """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,250 @@
+"""
+Shove/fold solver
+
+The SB either jams his whole stack or folds, and facing a jam the BB either calls or folds.
+Each player starts the hand with S BB, posts an ante (possibly 0) and then his blind, so
+a called jam plays for a pot of 2*S.  Payoffs are measured as the chips a player ends the
+hand with:
+
+    SB folds                    SB ends with S - ante - 0.5
+    SB jams, BB folds           SB ends with S + ante + 1, BB with S - ante - 1
+    SB jams, BB calls           each ends with 2*S times his equity
+
+Strategies are found by fictitious play, as in hunl_fn.doShoveFoldGame: at every iteration
+each player's best response to the other's current strategy is mixed into his strategy.
+Both best responses are computed for every combo at once from the preflop equity matrix,
+and a whole grid of stack sizes is solved side by side (one column per stack), so each
+iteration costs a couple of matrix products no matter how many stacks are being solved.
+
+The converged frequencies over a grid of stacks and antes are stored as a chart table
+(ShoveFoldCharts), which answers queries at any stack and ante in the grid's span by
+interpolating between grid points, without running fictitious play again.  To build the
+table from the preflop equity array, run from the repository root
+
+    python -m lib.hunl_pushfold
+"""
+import os
+import argparse
+import numpy
+from lib.hunl_combos import numHands, comboIndex, getUnblockedCounts
+from lib.hunl_equity import unpackEquityTable, getEquityFilename, equityDir
+
+numVillainHands = 1225 # nchoosek(50,2)
+
+def getStackGrid(minStack = 1.0, maxStack = 30.0, step = 0.5):
+    """
+    Input: minStack, maxStack, step - numbers of BB
+    Output: array of the stack sizes from minStack to maxStack (inclusive) in steps of step
+    Side-effects: N/A
+    """
+    return numpy.arange(minStack, maxStack + step / 2.0, step)
+
+def getJamEVs(eqMatrix, stacks, callFreqs, ante = 0.0):
+    """
+    Input:
+      eqMatrix - numHands x numHands preflop equity matrix, 0 for conflicting matchups
+                 (see EquityArray.getEquityMatrix)
+      stacks - array of k stack sizes in BB
+      callFreqs - numHands x k array of BB calling frequencies, one column per stack size
+      ante - ante paid by each player, in BB
+    Output: numHands x k array of the SB's EV of jamming every combo vs callFreqs
+    Side-effects: N/A
+    """
+    S = numpy.asarray(stacks, dtype=numpy.float64)
+    callCounts = getUnblockedCounts(callFreqs)
+    return (1 - callCounts / numVillainHands) * (S + 1 + ante) + eqMatrix.dot(callFreqs) * (2 * S / numVillainHands)
+
+def getCallEVs(eqMatrix, stacks, jamFreqs):
+    """
+    Input:
+      eqMatrix - numHands x numHands preflop equity matrix, 0 for conflicting matchups
+      stacks - array of k stack sizes in BB
+      jamFreqs - numHands x k array of SB jamming frequencies, one column per stack size
+    Output: numHands x k array of the BB's EV of calling a jam with every combo vs jamFreqs
+            (0 where the SB never jams)
+    Side-effects: N/A
+    """
+    S = numpy.asarray(stacks, dtype=numpy.float64)
+    jamCounts = getUnblockedCounts(jamFreqs)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where(jamCounts > 0, 2 * S * eqMatrix.dot(jamFreqs) / jamCounts, 0.0)
+
+def solveShoveFold(eqMatrix, stacks, ante = 0.0, nIter = 200):
+    """
+    Input:
+      eqMatrix - numHands x numHands preflop equity matrix, 0 for conflicting matchups
+                 (see EquityArray.getEquityMatrix)
+      stacks - list of stack sizes in BB, e.g. getStackGrid()
+      ante - ante paid by each player, in BB
+      nIter - number of fictitious play iterations
+    Output: (jamFreqs, callFreqs) - arrays of shape (len(stacks), numHands) holding the SB
+            jamming frequency and the BB calling frequency of every combo at every stack size
+    Side-effects: N/A
+    """
+    eqMatrix = numpy.asarray(eqMatrix, dtype=numpy.float64)
+    S = numpy.asarray(stacks, dtype=numpy.float64)
+    if S.ndim != 1 or numpy.any(S <= 0):
+        raise ValueError("stacks must be a list of positive stack sizes")
+    evSBFold = S - ante - 0.5
+    evBBFold = S - ante - 1
+
+    # guess some initial ranges
+    jamFreqs = numpy.full((numHands, len(S)), 0.5)
+    callFreqs = numpy.full((numHands, len(S)), 0.5)
+
+    for n in range(nIter):
+        fraction = 1 - 1 / (n + 2.0) # same schedule as hunl_fn.updateRange
+        # SB max expl strat vs the current calling ranges
+        evJam = getJamEVs(eqMatrix, S, callFreqs, ante)
+        jamFreqs = jamFreqs * fraction + (evJam > evSBFold) * (1 - fraction)
+        # BB max expl strat vs the updated jamming ranges
+        evCall = getCallEVs(eqMatrix, S, jamFreqs)
+        callFreqs = callFreqs * fraction + (evCall > evBBFold) * (1 - fraction)
+
+    return numpy.ascontiguousarray(jamFreqs.T), numpy.ascontiguousarray(callFreqs.T)
+
+### Charts ###
+
+chartsFilename = 'pushfold.npz'
+
+def getAnteGrid(maxAnte = 0.25, step = 0.025):
+    """
+    Input: maxAnte, step - numbers of BB
+    Output: array of the antes from 0 to maxAnte (inclusive) in steps of step
+    Side-effects: N/A
+    """
+    return numpy.arange(0.0, maxAnte + step / 2.0, step)
+
+def _getBracket(grid, x, name):
+    """ Output: (i, j, t) such that x == grid[i] * (1 - t) + grid[j] * t """
+    if x < grid[0] - 1e-9 or x > grid[-1] + 1e-9:
+        raise ValueError("%s %g is outside the chart's range [%g, %g]" % (name, x, grid[0], grid[-1]))
+    j = min(max(int(numpy.searchsorted(grid, x)), 1), len(grid) - 1)
+    if j == 0:
+        return 0, 0, 0.0
+    t = min(max((x - grid[j-1]) / (grid[j] - grid[j-1]), 0.0), 1.0)
+    return j - 1, j, t
+
+class ShoveFoldCharts:
+    """
+    Converged shove/fold strategies over a grid of stacks and antes:
+    stacks: sorted array of stack sizes in BB
+    antes: sorted array of antes in BB
+    jamFreqs: float32 array (len(antes), len(stacks), numHands) of SB jamming frequencies
+    callFreqs: same for the BB calling frequencies
+    nIter: number of fictitious play iterations the strategies were run for
+    """
+    def __init__(self, stacks, antes, jamFreqs, callFreqs, nIter):
+        self.stacks = numpy.asarray(stacks, dtype=numpy.float64)
+        self.antes = numpy.asarray(antes, dtype=numpy.float64)
+        self.jamFreqs = numpy.asarray(jamFreqs, dtype=numpy.float32)
+        self.callFreqs = numpy.asarray(callFreqs, dtype=numpy.float32)
+        self.nIter = nIter
+
+    def save(self, path):
+        """
+        Input: path - .npz file to write
+        Output: N/A
+        Side-effects: atomically writes the charts to path
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            numpy.savez(f, stacks=self.stacks, antes=self.antes, jamFreqs=self.jamFreqs,
+                        callFreqs=self.callFreqs, nIter=self.nIter)
+        os.replace(tmpPath, path)
+
+    def _interpolate(self, freqs, stack, ante):
+        """ Bilinear interpolation of freqs (indexed [ante, stack, ...]) at stack and ante """
+        a0, a1, ta = _getBracket(self.antes, ante, "Ante")
+        s0, s1, ts = _getBracket(self.stacks, stack, "Stack")
+        low = freqs[a0, s0] * (1 - ts) + freqs[a0, s1] * ts
+        high = freqs[a1, s0] * (1 - ts) + freqs[a1, s1] * ts
+        return low * (1 - ta) + high * ta
+
+    def getJamFreqs(self, stack, ante = 0.0):
+        """
+        Input: stack, ante - numbers of BB within the chart's grid
+        Output: array of length numHands of the SB jamming frequency of every combo
+        """
+        return self._interpolate(self.jamFreqs, stack, ante).astype(numpy.float64)
+
+    def getCallFreqs(self, stack, ante = 0.0):
+        """
+        Input: stack, ante - numbers of BB within the chart's grid
+        Output: array of length numHands of the BB calling frequency of every combo
+        """
+        return self._interpolate(self.callFreqs, stack, ante).astype(numpy.float64)
+
+    def getJamFreq(self, hand, stack, ante = 0.0):
+        """
+        Input:
+          hand - list of two card numbers
+          stack, ante - numbers of BB within the chart's grid
+        Output: the SB jamming frequency of hand
+        """
+        return float(self._interpolate(self.jamFreqs[:, :, comboIndex[hand[0]][hand[1]]], stack, ante))
+
+    def getCallFreq(self, hand, stack, ante = 0.0):
+        """
+        Input:
+          hand - list of two card numbers
+          stack, ante - numbers of BB within the chart's grid
+        Output: the BB calling frequency of hand
+        """
+        return float(self._interpolate(self.callFreqs[:, :, comboIndex[hand[0]][hand[1]]], stack, ante))
+
+def loadShoveFoldCharts(path):
+    """
+    Input: path - .npz file written by ShoveFoldCharts.save
+    Output: the ShoveFoldCharts stored in path
+    Side-effects: N/A
+    """
+    with numpy.load(path) as data:
+        return ShoveFoldCharts(data['stacks'], data['antes'], data['jamFreqs'], data['callFreqs'],
+                               int(data['nIter']))
+
+def buildShoveFoldCharts(eqMatrix, stacks = None, antes = None, nIter = 200):
+    """
+    Input:
+      eqMatrix - numHands x numHands preflop equity matrix, 0 for conflicting matchups
+      stacks - sorted list of stack sizes in BB (default: getStackGrid())
+      antes - sorted list of antes in BB (default: getAnteGrid())
+      nIter - number of fictitious play iterations
+    Output: ShoveFoldCharts solved at every stack and ante of the grid
+    Side-effects: N/A
+    """
+    stacks = getStackGrid() if stacks is None else numpy.asarray(stacks, dtype=numpy.float64)
+    antes = getAnteGrid() if antes is None else numpy.asarray(antes, dtype=numpy.float64)
+    if numpy.any(numpy.diff(stacks) <= 0) or numpy.any(numpy.diff(antes) <= 0):
+        raise ValueError("stacks and antes must be sorted and distinct")
+    jamFreqs = numpy.empty((len(antes), len(stacks), numHands), dtype=numpy.float32)
+    callFreqs = numpy.empty((len(antes), len(stacks), numHands), dtype=numpy.float32)
+    for i, ante in enumerate(antes):
+        jamFreqs[i], callFreqs[i] = solveShoveFold(eqMatrix, stacks, ante, nIter)
+    return ShoveFoldCharts(stacks, antes, jamFreqs, callFreqs, nIter)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Build the shove/fold chart table.")
+    parser.add_argument('--outdir', default=equityDir,
+                        help="directory holding preflop.ea16.npy and receiving %s (default: %%(default)s)" % chartsFilename)
+    parser.add_argument('--min-stack', type=float, default=1.0, help="smallest stack in BB (default: %(default)s)")
+    parser.add_argument('--max-stack', type=float, default=30.0, help="largest stack in BB (default: %(default)s)")
+    parser.add_argument('--stack-step', type=float, default=0.5, help="stack grid step in BB (default: %(default)s)")
+    parser.add_argument('--max-ante', type=float, default=0.25, help="largest ante in BB (default: %(default)s)")
+    parser.add_argument('--ante-step', type=float, default=0.025, help="ante grid step in BB (default: %(default)s)")
+    parser.add_argument('--iterations', type=int, default=200, help="fictitious play iterations (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    # the preflop board is its own canonical board, so its table is already in actual combos
+    eqMatrix = numpy.maximum(unpackEquityTable(numpy.load(os.path.join(args.outdir, getEquityFilename([255] * 5)))), 0)
+    charts = buildShoveFoldCharts(eqMatrix, getStackGrid(args.min_stack, args.max_stack, args.stack_step),
+                                  getAnteGrid(args.max_ante, args.ante_step), args.iterations)
+    charts.save(os.path.join(args.outdir, chartsFilename))
+    print("Saved %d stacks x %d antes to %s" % (len(charts.stacks), len(charts.antes),
+                                                 os.path.join(args.outdir, chartsFilename)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Equity queries from the command line
+
+Answers hand vs range and range vs range equity queries without the GUI (nothing here
+imports Qt or matplotlib).  Queries are read as JSONL (one object per line) or CSV (with a
+header row) from a file or stdin, and results are written as JSONL or CSV, e.g. from the
+repository root
+
+    python -m lib.hunl_query queries.jsonl > results.jsonl
+    python -m lib.hunl_query --format csv < queries.csv > results.csv
+
+A query has the fields
+  id - optional; the query's number in the input (from 1) if missing
+  board - cards run together, e.g. 'AhKdQs', or '' preflop
+  hand - hero's hand, e.g. 'AsKs', for hand vs range; or
+  hero - hero's range, for range vs range
+  villain - villain's range
+where a range is either a fraction ('0.3' or '30%': the top fraction of hands on the board,
+as ranked by equity vs any two cards, like the GUI's sliders) or comma-separated terms of
+the form XX, XYs, XYo or XaYb (see Range.setRangeString).
+
+Every result has the query's id, the input line it came from and its board, and either its
+equity or an error message; a bad query, or a line that isn't a query at all, gets an error
+result and doesn't stop the run.  Queries are answered one at a time, in input order, and
+every result is written (and flushed) as soon as it is done, so the tool can sit at the end
+of a pipe.  The boards used most recently are kept with their equity array and the ranges and
+equities vs villain ranges computed on them, so queries on the same board don't redo that work.
+"""
+import re
+import sys
+import csv
+import json
+import argparse
+import collections
+import numpy
+from lib.hunl_combos import comboIndex, cardStrings
+from lib.hunl_fn import Range, getEquityArray, getEquitiesVsRange, getRangeEquityVsRange
+
+formats = ['jsonl', 'csv']
+resultFields = ['id', 'line', 'board', 'equity', 'error']
+
+rangeTermPattern = re.compile(r'^([2-9TJQKA]{2}[so]?|[2-9TJQKA][hdcs][2-9TJQKA][hdcs])$')
+fractionPattern = re.compile(r'^(\d+(\.\d*)?|\.\d+)(%?)$')
+
+### Parsing ###
+
+def parseCardString(cardsStr, what):
+    """
+    Input:
+      cardsStr - cards run together in one string, e.g. 'AhKd2c'
+      what - what the cards are, for error messages
+    Output: list of card numbers
+    Side-effects: raises ValueError if cardsStr isn't made of distinct cards
+    """
+    cardsStr = cardsStr.replace(' ', '')
+    if len(cardsStr) % 2 != 0:
+        raise ValueError("%s %r isn't made of two-character cards" % (what, cardsStr))
+    cards = []
+    for i in range(0, len(cardsStr), 2):
+        if cardsStr[i:i+2] not in cardStrings:
+            raise ValueError("%s %r has an unknown card %r" % (what, cardsStr, cardsStr[i:i+2]))
+        cards.append(cardStrings.index(cardsStr[i:i+2]))
+    if len(set(cards)) != len(cards):
+        raise ValueError("%s %r has a repeated card" % (what, cardsStr))
+    return cards
+
+def parseBoard(boardStr):
+    """
+    Input: boardStr - 0, 3, 4 or 5 cards run together, e.g. 'AhKdQs'
+    Output: list of 5 numbers describing the board (255 for cards not dealt yet)
+    Side-effects: raises ValueError for anything else
+    """
+    board = parseCardString(boardStr, "board")
+    if len(board) not in [0, 3, 4, 5]:
+        raise ValueError("board %r should have 0, 3, 4 or 5 cards" % boardStr)
+    return board + [255] * (5 - len(board))
+
+def parseHand(handStr, board):
+    """
+    Input:
+      handStr - 2 cards run together, e.g. 'AsKs'
+      board - list of 5 numbers describing the board
+    Output: combo number of the hand
+    Side-effects: raises ValueError if handStr isn't a hand that can be held on board
+    """
+    hand = parseCardString(handStr, "hand")
+    if len(hand) != 2:
+        raise ValueError("hand %r should have 2 cards" % handStr)
+    if any(c in board for c in hand):
+        raise ValueError("hand %r conflicts with the board" % handStr)
+    return comboIndex[hand[0]][hand[1]]
+
+def makeRange(rangeStr, board):
+    """
+    Input:
+      rangeStr - a fraction of the top hands ('0.3' or '30%') or a range string (see the module docstring)
+      board - list of 5 numbers describing the board
+    Output: the Range, without the hands that conflict with board
+    Side-effects: raises ValueError if rangeStr is neither
+    """
+    rangeStr = rangeStr.replace(' ', '')
+    match = fractionPattern.match(rangeStr)
+    r = Range()
+    if match:
+        fraction = float(match.group(1)) / (100.0 if match.group(3) else 1.0)
+        if fraction > 1:
+            raise ValueError("range fraction %r is more than 1" % rangeStr)
+        r.setToTop(fraction, board)
+        return r
+    terms = rangeStr.split(',')
+    for term in terms:
+        if not rangeTermPattern.match(term) or (len(term) == 3 and term[0] == term[1]) or \
+                (len(term) == 4 and term[0:2] == term[2:4]):
+            raise ValueError("range %r has a bad term %r" % (rangeStr, term))
+    r.setRangeString(rangeStr, 1.0)
+    r.removeHandsWithConflicts(board)
+    return r
+
+### Reading and writing ###
+
+def readQueries(f, fmt):
+    """
+    Input:
+      f - file object (or any iterable of lines) to read queries from
+      fmt - one of formats
+    Output: generator of (line, query, error) for every query in f, in order: line is the
+            number of the input line it ends on (from 1), and either query is the query as a
+            dict, with its id (the line number unless given), and error is None, or query is
+            None and error says why the line isn't a query
+    Side-effects: reads f one line at a time, as the queries are asked for
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        while True:
+            try:
+                query = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield reader.line_num, None, "line %d isn't valid CSV: %s" % (reader.line_num, e)
+                continue
+            if None in query: # more fields than the header has
+                yield reader.line_num, None, "line %d has more fields than the header" % reader.line_num
+                continue
+            yield reader.line_num, setDefaultId(query, reader.line_num), None
+    else:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                query = json.loads(text)
+            except ValueError as e:
+                yield line, None, "line %d isn't valid JSON: %s" % (line, e)
+                continue
+            if not isinstance(query, dict):
+                yield line, None, "line %d isn't a JSON object" % line
+                continue
+            yield line, setDefaultId(query, line), None
+
+def setDefaultId(query, line):
+    """ Output: query, with its id set to line if it doesn't have one """
+    if query.get('id') in [None, '']:
+        query['id'] = line
+    return query
+
+class ResultWriter:
+    """
+    Writes results to a file object as JSONL or CSV, flushing after every one so that
+    results reach a pipe as soon as they're done
+    """
+    def __init__(self, f, fmt):
+        self.f = f
+        self.csvWriter = None
+        if fmt == 'csv':
+            self.csvWriter = csv.DictWriter(f, resultFields, extrasaction='ignore')
+            self.csvWriter.writeheader()
+
+    def write(self, result):
+        """
+        Input: result - a result dict
+        Output: N/A
+        Side-effects: writes it to the file
+        """
+        if self.csvWriter is not None:
+            self.csvWriter.writerow(result)
+        else:
+            self.f.write(json.dumps(result) + '\n')
+        self.f.flush()
+
+### Answering ###
+
+def getField(query, name):
+    """ Output: the query's field name as a string, '' if it is missing """
+    value = query.get(name)
+    return '' if value is None else str(value)
+
+class BoardQueries:
+    """
+    What queries on one board share: the board's EquityArray, the Ranges on the board, and the
+    equities of every combo vs villain ranges, each made once, the first time a query needs it
+    Constructor
+    Input: board - list of 5 numbers describing the board
+    """
+    maxRanges = 1000 # range strings remembered; beyond that the memos start over
+
+    def __init__(self, board):
+        self.board = board
+        self.ea = getEquityArray(board)
+        self.ranges = {} # range string -> Range on board
+        self.villainEqs = {} # villain's range string -> equity of every combo vs it
+
+    def getRange(self, rangeStr):
+        """ Output: the Range rangeStr describes on the board (see makeRange) """
+        if rangeStr not in self.ranges:
+            if len(self.ranges) >= self.maxRanges:
+                self.ranges.clear()
+            self.ranges[rangeStr] = makeRange(rangeStr, self.board)
+        return self.ranges[rangeStr]
+
+    def getVillainEqs(self, rangeStr):
+        """ Output: array of the equity of every combo vs the range rangeStr (see getEquitiesVsRange) """
+        if rangeStr not in self.villainEqs:
+            if len(self.villainEqs) >= self.maxRanges:
+                self.villainEqs.clear()
+            self.villainEqs[rangeStr] = getEquitiesVsRange(self.getRange(rangeStr), self.ea)
+        return self.villainEqs[rangeStr]
+
+    def answer(self, query):
+        """
+        Input: query - a query on the board
+        Output: its equity
+        Side-effects: raises ValueError if the query can't be answered
+        """
+        villainStr = getField(query, 'villain')
+        if getField(query, 'hand'):
+            combo = parseHand(getField(query, 'hand'), self.board)
+            equity = float(self.getVillainEqs(villainStr)[combo])
+        elif getField(query, 'hero'):
+            equity = getRangeEquityVsRange(self.getRange(getField(query, 'hero')), self.getRange(villainStr), self.ea)
+        else:
+            raise ValueError("query has neither a hand nor a hero range")
+        if numpy.isnan(equity):
+            raise ValueError("no hands of the villain range are left against hero")
+        return equity
+
+def answerQueries(records, maxBoards = 64):
+    """
+    Input:
+      records - iterable of (line, query, error), as from readQueries
+      maxBoards - number of boards whose BoardQueries are kept (least recently used dropped first)
+    Output: generator of the result of every record, in order, each yielded as soon as it is done
+    Side-effects: loads the boards' EquityArrays; reads records one at a time
+    """
+    boards = collections.OrderedDict() # board (as a tuple) -> its BoardQueries
+    for line, query, error in records:
+        if query is None:
+            yield {'id': line, 'line': line, 'error': error}
+            continue
+        result = {'id': query['id'], 'line': line, 'board': getField(query, 'board')}
+        try:
+            key = tuple(parseBoard(getField(query, 'board')))
+            if key in boards:
+                boards.move_to_end(key)
+            else:
+                boards[key] = BoardQueries(list(key))
+                if len(boards) > maxBoards:
+                    boards.popitem(last=False)
+            result['equity'] = boards[key].answer(query)
+        except (OSError, ValueError) as e: # e.g. a bad range, or the preflop equity array isn't there
+            result['error'] = str(e)
+        yield result
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Answer hand vs range and range vs range equity queries.")
+    parser.add_argument('input', nargs='?', default='-', help="JSONL or CSV file of queries (default: stdin)")
+    parser.add_argument('--format', choices=formats,
+                        help="format of the queries and results (default: csv for .csv files, else jsonl)")
+    parser.add_argument('--output', default='-', help="file to write the results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+    fin = sys.stdin if args.input == '-' else open(args.input, newline='')
+    fout = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        writer = ResultWriter(fout, fmt)
+        for result in answerQueries(readQueries(fin, fmt)):
+            writer.write(result)
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+
+if __name__ == '__main__':
+    main()
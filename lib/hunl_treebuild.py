@@ -0,0 +1,308 @@
+"""
+Betting tree builder
+
+Builds a full heads-up no-limit Tree from a TreeSpec instead of adding every DecPt by hand.
+The tree follows the same conventions as the hand-built trees in the notebook:
+  - preflop the SB acts first (facing the BB's blind); after the flop the BB acts first
+  - a bet or raise is labelled 'bet <chips>' with the bettor's chips in pot after it, other
+    actions are 'check', 'call' and 'fold'
+  - a fold, a called all-in, and a check or call closing the river lead to a Leaf; a check or
+    call closing an earlier street leads to a Nature point whose children are the BB's first
+    decision on every board the next card (or flop) can make, labelled with that board
+  - every point gets the EquityArray of the board as it is at that point
+
+Bet and raise sizes are fractions of the pot after calling, so a size f makes the bettor's
+chips in pot (opponent's chips in pot) * (1 + 2f).  Sizes that would commit at least
+allInThreshold of the bettor's remaining stack (or more than his stack) become all-in.
+
+With mergeIsomorphic, deals that only differ by a suit permutation leaving the board so far
+unchanged (e.g. the clubs and spades turns on a flop with no clubs or spades) share one Nature
+child, standing for all of them (see DecPt.isoDeals).  On a monotone flop that cuts the 49 turns
+to 23, and two-tone boards save about a quarter; rainbow flops have no such permutations.  It
+is exact when both players' starting ranges are unchanged by the permutations (e.g. full
+ranges, or ranges given by hand classes) and, if only some cards are dealt, the cards listed
+include every suit permutation of each other (e.g. both 6c and 6s).
+
+estimateTree() walks the same betting sequences without creating any points, so a tree's
+size and the memory a StrategyPair on it will need can be checked before building it.
+"""
+import numpy
+from lib.hunl_combos import numCards, numHands
+from lib.hunl_equity import numPairs, getBoardString
+from lib.hunl_iso import groupIsomorphicBoards
+from lib.hunl_fn import DecPt, Tree, getEquityArray, getStrategyPairNumBytes
+from lib.hunl_cfr import getCFRSolverNumBytes
+
+streets = ['preflop', 'flop', 'turn', 'river']
+
+# default sizes, as fractions of the pot
+defaultBetSizes = {'preflop': [1.0], 'flop': [0.5, 1.0], 'turn': [0.75], 'river': [0.75]}
+defaultRaiseSizes = {'preflop': [1.0], 'flop': [1.0], 'turn': [1.0], 'river': [1.0]}
+
+class TreeSpec:
+    """
+    Everything needed to build a tree:
+    S: effective stack in BB (each player's stack at the start of the hand)
+    board: list of 5 card numbers, 255 for cards not yet dealt; the number of known cards
+           sets the street the tree starts on
+    pot: pot at the root for trees starting after the flop, split equally between the players
+         (preflop trees start with the blinds posted)
+    betSizes: dict mapping street names to lists of bet sizes (fractions of the pot)
+    raiseSizes: dict mapping street names to lists of raise sizes (fractions of the pot)
+    raiseCap: most bets and raises allowed on a street
+    allInThreshold: bets committing at least this fraction of the bettor's remaining stack
+                    become all-in
+    allInOption: if True, all-in is also offered at every bet or raise
+    flops: list of flops (lists of 3 card numbers) to deal after preflop
+    turnCards and riverCards: lists of the card numbers to deal on the turn and river
+                              (None for every card that can come)
+    mergeIsomorphic: if True, deals that only differ by a suit permutation share one Nature child
+    """
+    def __init__(self, S, board, pot = None, betSizes = None, raiseSizes = None, raiseCap = 3,
+                 allInThreshold = 1.0, allInOption = False, flops = None, turnCards = None, riverCards = None,
+                 mergeIsomorphic = False):
+        self.S = float(S)
+        self.board = list(board) + [255] * (5 - len(board))
+        self.pot = pot
+        self.betSizes = dict(defaultBetSizes if betSizes is None else betSizes)
+        self.raiseSizes = dict(defaultRaiseSizes if raiseSizes is None else raiseSizes)
+        self.raiseCap = raiseCap
+        self.allInThreshold = allInThreshold
+        self.allInOption = allInOption
+        self.flops = flops
+        self.turnCards = turnCards
+        self.riverCards = riverCards
+        self.mergeIsomorphic = mergeIsomorphic
+        if self.getStartingStreet() != 0 and (pot is None or pot <= 0):
+            raise ValueError("A tree starting after the flop needs a positive pot")
+
+    def getStartingStreet(self):
+        """ Output: index in streets of the street the tree starts on """
+        numKnown = len([c for c in self.board if c < numCards])
+        if numKnown not in (0, 3, 4, 5):
+            raise ValueError("Board must have 0, 3, 4 or 5 known cards")
+        return {0: 0, 3: 1, 4: 2, 5: 3}[numKnown]
+
+    def getStartingCIPs(self):
+        """ Output: (SB, BB) chips in pot at the root """
+        if self.getStartingStreet() == 0:
+            return 0.5, 1.0
+        return self.pot / 2.0, self.pot / 2.0
+
+    def getBetCIPs(self, street, ownCIP, oppCIP):
+        """
+        Inputs:
+          street: index in streets
+          ownCIP, oppCIP: chips in pot of the player to act and of his opponent
+        Output: sorted list of the distinct chips in pot the player can bet or raise to
+        """
+        facing = oppCIP > ownCIP
+        sizes = (self.raiseSizes if facing else self.betSizes).get(streets[street], [])
+        minCIP = oppCIP + max(oppCIP - ownCIP, 1.0) # a raise is at least the last bet or raise
+        result = set()
+        for f in sizes:
+            newCIP = max(oppCIP * (1 + 2 * f), minCIP)
+            if newCIP >= self.S or newCIP - ownCIP >= self.allInThreshold * (self.S - ownCIP):
+                newCIP = self.S
+            result.add(round(newCIP, 6))
+        if self.allInOption:
+            result.add(self.S)
+        return sorted(result)
+
+    def getNextBoards(self, board, street):
+        """
+        Inputs:
+          board: list of 5 card numbers
+          street: index in streets of the street about to be dealt
+        Output: list of the boards the deal can make
+        """
+        known = [c for c in board if c < numCards]
+        if street == 1:
+            if self.flops is None:
+                raise ValueError("The flops to deal after preflop must be listed")
+            flops = [list(flop) for flop in self.flops if not set(flop) & set(known)]
+            return [flop + [255, 255] for flop in flops]
+        cards = self.turnCards if street == 2 else self.riverCards
+        if cards is None:
+            cards = range(numCards)
+        return [known + [c] + [255] * (4 - len(known)) for c in cards if c not in known]
+
+    def getDeals(self, board, street):
+        """
+        Inputs:
+          board: list of 5 card numbers
+          street: index in streets of the street about to be dealt
+        Output: list of (board, isoDeals), one for every Nature child the deal gets: the
+                child's board, and the deals it stands for (see DecPt.isoDeals), or None
+                if it only stands for its own board
+        """
+        nextBoards = self.getNextBoards(board, street)
+        if not self.mergeIsomorphic:
+            return [(nextBoard, None) for nextBoard in nextBoards]
+        return [(nextBoard, deals if len(deals) > 1 else None)
+                for nextBoard, deals in groupIsomorphicBoards(board, nextBoards)]
+
+### Walking the betting sequences ###
+
+def walkTree(spec, visit):
+    """
+    Inputs:
+      spec: a TreeSpec
+      visit: function visit(player, sbCIP, bbCIP, board, parentAction, parent, isoDeals = None)
+             called for every point of the tree, parents before children, where parent is what
+             visit returned for the point's parent (None for the root), and isoDeals is only
+             given for Nature children standing for several deals (see TreeSpec.getDeals)
+    Output: N/A
+    Side-effects: calls visit on every point of the tree spec describes
+    """
+    street = spec.getStartingStreet()
+    sbCIP, bbCIP = spec.getStartingCIPs()
+    player = 'SB' if street == 0 else 'BB'
+    root = visit(player, sbCIP, bbCIP, spec.board, "", None)
+    walkDecision(spec, visit, root, player, sbCIP, bbCIP, spec.board, street, 0, False)
+
+def walkDecision(spec, visit, point, player, sbCIP, bbCIP, board, street, numBets, checkCloses):
+    """
+    Inputs:
+      spec, visit: as for walkTree
+      point: what visit returned for this decision point
+      player: "SB" or "BB", whose decision it is
+      sbCIP, bbCIP: chips in pot at the decision point
+      board: list of 5 card numbers
+      street: index in streets
+      numBets: number of bets and raises made on this street so far
+      checkCloses: True if checking here ends the street
+    Output: N/A
+    Side-effects: calls visit on all of the decision point's descendants
+    """
+    opponent = 'BB' if player == 'SB' else 'SB'
+    ownCIP, oppCIP = (sbCIP, bbCIP) if player == 'SB' else (bbCIP, sbCIP)
+
+    def cips(newOwnCIP):
+        return (newOwnCIP, oppCIP) if player == 'SB' else (oppCIP, newOwnCIP)
+
+    if oppCIP > ownCIP: # facing a bet (or the BB's blind)
+        visit('Leaf', sbCIP, bbCIP, board, "fold", point)
+        newSB, newBB = cips(oppCIP)
+        if street == 0 and numBets == 0 and oppCIP < spec.S:
+            # the SB completing the blind gives the BB the option to raise
+            option = visit(opponent, newSB, newBB, board, "call", point)
+            walkDecision(spec, visit, option, opponent, newSB, newBB, board, street, numBets, True)
+        else:
+            walkStreetEnd(spec, visit, point, newSB, newBB, board, street, "call")
+    else:
+        if checkCloses:
+            walkStreetEnd(spec, visit, point, sbCIP, bbCIP, board, street, "check")
+        else:
+            child = visit(opponent, sbCIP, bbCIP, board, "check", point)
+            walkDecision(spec, visit, child, opponent, sbCIP, bbCIP, board, street, numBets, True)
+
+    if numBets < spec.raiseCap and ownCIP < spec.S and oppCIP < spec.S:
+        for newCIP in spec.getBetCIPs(street, ownCIP, oppCIP):
+            newSB, newBB = cips(newCIP)
+            child = visit(opponent, newSB, newBB, board, "bet %g" % newCIP, point)
+            walkDecision(spec, visit, child, opponent, newSB, newBB, board, street, numBets + 1, False)
+
+def walkStreetEnd(spec, visit, point, sbCIP, bbCIP, board, street, action):
+    """
+    Inputs:
+      spec, visit: as for walkTree
+      point: what visit returned for the point whose action ends the street
+      sbCIP, bbCIP: (equal) chips in pot once the street is over
+      board: list of 5 card numbers
+      street: index in streets of the street that ended
+      action: the action ending the street, "check" or "call"
+    Output: N/A
+    Side-effects: calls visit on the showdown or the Nature point (and its descendants) that
+                  follow action; raises ValueError if spec leaves nothing to deal on board
+    """
+    if street == len(streets) - 1 or sbCIP >= spec.S:
+        visit('Leaf', sbCIP, bbCIP, board, action, point)
+        return
+    deals = spec.getDeals(board, street + 1)
+    if not deals:
+        raise ValueError("No %s can be dealt on %s: every one listed is already on the board"
+                         % (streets[street + 1], getBoardString(board)))
+    nature = visit('Nature', sbCIP, bbCIP, board, action, point)
+    for newBoard, isoDeals in deals:
+        child = visit('BB', sbCIP, bbCIP, newBoard, getBoardString(newBoard), nature, isoDeals)
+        walkDecision(spec, visit, child, 'BB', sbCIP, bbCIP, newBoard, street + 1, 0, False)
+
+### Estimates and building ###
+
+def estimateTree(spec):
+    """
+    Input: spec: a TreeSpec
+    Output: dict with
+              numPoints: number of decision points
+              numByPlayer: dict mapping "SB", "BB", "Nature" and "Leaf" to numbers of points
+              numBoards: number of distinct boards (EquityArrays) in the tree
+              strategyBytes: memory a StrategyPair on the tree needs
+              equityBytes: memory the tree's EquityArrays need, with their equity matrices unpacked
+              totalBytes: strategyBytes + equityBytes
+              cfrBytes: memory a CFRSolver (lib/hunl_cfr.py) on the tree needs on top of
+                        totalBytes, for solving with doCFR instead of doFP
+    Side-effects: N/A
+    """
+    numByPlayer = {'SB': 0, 'BB': 0, 'Nature': 0, 'Leaf': 0}
+    boards = set()
+
+    def count(player, sbCIP, bbCIP, board, parentAction, parent, isoDeals = None):
+        numByPlayer[player] += 1
+        boards.add(tuple(board))
+
+    walkTree(spec, count)
+    numPoints = numpy.sum(list(numByPlayer.values()))
+    estimate = {'numPoints': int(numPoints),
+                'numByPlayer': numByPlayer,
+                'numBoards': len(boards),
+                'strategyBytes': getStrategyPairNumBytes(numPoints),
+                'equityBytes': len(boards) * (numPairs * 2 + numHands * numHands * 4)}
+    estimate['totalBytes'] = estimate['strategyBytes'] + estimate['equityBytes']
+    estimate['cfrBytes'] = getCFRSolverNumBytes(numPoints)
+    return estimate
+
+def printTreeEstimate(estimate):
+    """
+    Input: estimate: a dict returned by estimateTree
+    Output: N/A
+    Side-effects: prints the estimate
+    """
+    print("%d decision points (%s)" % (estimate['numPoints'],
+          ", ".join("%d %s" % (estimate['numByPlayer'][p], p) for p in ['SB', 'BB', 'Nature', 'Leaf'])))
+    print("%d boards" % estimate['numBoards'])
+    print("StrategyPair: %.1f MB, EquityArrays: %.1f MB, total: %.1f MB" %
+          (estimate['strategyBytes'] / 1e6, estimate['equityBytes'] / 1e6, estimate['totalBytes'] / 1e6))
+    print("CFRSolver (with doCFR): %.1f MB more" % (estimate['cfrBytes'] / 1e6))
+
+def buildTree(spec, maxBytes = None):
+    """
+    Inputs:
+      spec: a TreeSpec
+      maxBytes: optional memory budget; the tree isn't built if estimateTree says that it and
+                its StrategyPair would need more than this
+    Output: the Tree spec describes
+    Side-effects: loads (or builds) the EquityArray of every board in the tree
+    """
+    if maxBytes is not None:
+        estimate = estimateTree(spec)
+        if estimate['totalBytes'] > maxBytes:
+            raise ValueError("Tree needs %.1f MB, more than the %.1f MB allowed" %
+                             (estimate['totalBytes'] / 1e6, maxBytes / 1e6))
+    eArrays = {}
+    trees = []
+
+    def add(player, sbCIP, bbCIP, board, parentAction, parent, isoDeals = None):
+        key = tuple(board)
+        if key not in eArrays:
+            eArrays[key] = getEquityArray(board)
+        newCardFreq = 1.0 if isoDeals is None else float(len(isoDeals))
+        point = DecPt(player, sbCIP, bbCIP, eArrays[key], parentAction, newCardFreq, isoDeals)
+        if parent is None:
+            trees.append(Tree(spec.S, point))
+        else:
+            trees[0].addDecPt(point, parent)
+        return point
+
+    walkTree(spec, add)
+    return trees[0]
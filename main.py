@@ -8,6 +8,7 @@ from ui.hunl_hvr import Ui_hvr
 from ui.hunl_rvr import Ui_rvr
 import sys
 import matplotlib
+matplotlib.use('Qt5Agg')
 from PyQt5.QtWidgets import (QMainWindow, QTextEdit, QWidget, QDialog,
     QAction, QFileDialog, QApplication, QPushButton, QLineEdit, QMessageBox)
 from PyQt5 import QtWidgets
@@ -21,7 +22,7 @@ import matplotlib.pyplot as plt
 def printRange(hand, board, top):
     vill = hunl.Range()
     vill.setToTop(top, board)
-    eq = hunl.getEquityVsRange(hand, vill, hunl.EquityArray(board))
+    eq = hunl.getEquityVsRange(hand, vill, hunl.getEquityArray(board))
     return eq
 
 def parseboard(board):
@@ -0,0 +1,30 @@
+import os
+import numpy
+from lib.hunl_bench import makeSyntheticEquityTable, installSyntheticEquityArray, riverBoard, turnBoard
+from lib.hunl_combos import parseCards
+from lib.hunl_fn import equityArrayCache, getEquityArray
+from lib.hunl_iso import suitPerms, getComboPerm, permuteCards
+
+def test_synthetic_table_has_the_board_symmetries():
+    board = parseCards('AhKh2d2c2s')
+    table = makeSyntheticEquityTable(board, seed=3)
+    symmetries = [perm for perm in suitPerms if set(permuteCards(board, perm)) == set(board)]
+    assert len(symmetries) == 6
+    for perm in symmetries:
+        comboPerm = getComboPerm(perm)
+        assert numpy.array_equal(table[numpy.ix_(comboPerm, comboPerm)], table)
+
+def test_synthetic_arrays_survive_a_small_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    maxBytes = equityArrayCache.maxBytes
+    equityArrayCache.setMaxBytes(1)
+    try:
+        river = installSyntheticEquityArray(riverBoard)
+        turn = installSyntheticEquityArray(turnBoard + [255])
+        river.getEquityMatrix()
+        assert getEquityArray(riverBoard) is river
+        assert getEquityArray(turnBoard + [255]) is turn
+    finally:
+        equityArrayCache.clear()
+        equityArrayCache.setMaxBytes(maxBytes)
+    assert not os.path.exists('eqarray')
@@ -0,0 +1,64 @@
+import numpy
+import pytest
+from lib.hunl_combos import numHands, comboCards, comboIndex, parseCards, getLiveComboMask
+from lib.hunl_equity import EquityTableBuilder, EQ_SCALE, packEquityTable, unpackEquityTable, \
+    getPackedEquityRow, getPackedEquity
+from lib.hunl_eval import getEquityVsHand
+from lib.hunl_fn import EquityArray
+from lib.hunl_iso import getCanonicalBoard
+
+def buildTable(board):
+    builder = EquityTableBuilder(board)
+    while not builder.isDone():
+        builder.addRunouts(7) # in several steps, as precompute does
+    return builder.getTable()
+
+def getRandomMatchups(board, n, seed = 0):
+    rng = numpy.random.RandomState(seed)
+    live = numpy.nonzero(getLiveComboMask(board))[0]
+    matchups = []
+    while len(matchups) < n:
+        a, b = rng.choice(live, 2, replace=False)
+        if not set(comboCards[a]) & set(comboCards[b]):
+            matchups.append((a, b))
+    return matchups
+
+@pytest.mark.parametrize('boardStr', ['AhKdQs2d6c', 'Th9h2c2d'])
+def test_builder_matches_exact_equity(boardStr):
+    board = parseCards(boardStr)
+    board += [255] * (5 - len(board))
+    table = buildTable(board)
+    for a, b in getRandomMatchups(board, 40):
+        exact = getEquityVsHand(list(comboCards[a]), list(comboCards[b]), board)
+        assert table[a, b] == pytest.approx(exact, abs=1e-6)
+        assert table[a, b] + table[b, a] == pytest.approx(1.0, abs=1e-6)
+    # hands holding board cards, and hands sharing a card, conflict
+    assert numpy.all(table[comboIndex[board[0]][board[1]]] == -1)
+    assert table[comboIndex[20][30], comboIndex[20][40]] == -1
+
+def test_pack_unpack_round_trip():
+    board = parseCards('AhKdQs2d6c')
+    table = buildTable(board)
+    packed = packEquityTable(table)
+    unpacked = unpackEquityTable(packed)
+    conflict = table < 0
+    assert numpy.array_equal(unpacked < 0, conflict)
+    assert numpy.max(numpy.abs(unpacked - table)[~conflict]) <= 1.0 / EQ_SCALE
+    for a, b in getRandomMatchups(board, 20):
+        assert getPackedEquity(packed, a, b) == pytest.approx(unpacked[a, b], abs=1e-6)
+        assert numpy.allclose(getPackedEquityRow(packed, a), unpacked[a], atol=1e-6)
+
+def test_canonical_board_lookups_match_the_board():
+    board = parseCards('AsJc2d7h3c')
+    canonicalBoard = getCanonicalBoard(board)[0]
+    assert canonicalBoard != board
+    table = buildTable(board) # built directly on the non-canonical board
+    ea = EquityArray(board, packEquityTable(buildTable(canonicalBoard)))
+    matrix = ea.getEquityMatrix()
+    live = table >= 0
+    assert numpy.max(numpy.abs(matrix - table)[live]) <= 1.0 / EQ_SCALE
+    assert numpy.all(matrix[~live] == 0)
+    for a, b in getRandomMatchups(board, 20):
+        hand, villainHand = list(comboCards[a]), list(comboCards[b])
+        assert ea.getEquity(hand, villainHand) == pytest.approx(table[a, b], abs=1.0 / EQ_SCALE)
+        assert numpy.max(numpy.abs(ea.getEquityRow(hand) - table[a])) <= 1.0 / EQ_SCALE
@@ -0,0 +1,66 @@
+import collections
+import itertools
+import numpy
+from lib.hunl_eval import evalHands, handCategory, STRAIGHT_FLUSH, QUADS, FULL_HOUSE, STRAIGHT
+from lib.hunl_combos import parseCards
+
+def getReferenceValue5(cards):
+    """ (category, tie-breaking ranks) of a 5-card hand, the textbook way """
+    ranks = sorted((c % 13 for c in cards), reverse=True)
+    counts = collections.Counter(ranks)
+    byCount = [r for r, n in sorted(counts.items(), key=lambda item: (item[1], item[0]), reverse=True)]
+    shape = sorted(counts.values(), reverse=True)
+    flush = len(set(c // 13 for c in cards)) == 1
+    straightHigh = None
+    if len(counts) == 5:
+        if ranks[0] - ranks[4] == 4:
+            straightHigh = ranks[0]
+        elif ranks == [12, 3, 2, 1, 0]: # the wheel, five high
+            straightHigh = 3
+    if straightHigh is not None and flush:
+        return (8, [straightHigh])
+    if shape == [4, 1]:
+        return (7, byCount)
+    if shape == [3, 2]:
+        return (6, byCount)
+    if flush:
+        return (5, ranks)
+    if straightHigh is not None:
+        return (4, [straightHigh])
+    if shape == [3, 1, 1]:
+        return (3, byCount)
+    if shape == [2, 2, 1]:
+        return (2, byCount)
+    if shape == [2, 1, 1, 1]:
+        return (1, byCount)
+    return (0, ranks)
+
+def getReferenceValue(cards):
+    return max(getReferenceValue5(five) for five in itertools.combinations(cards, 5))
+
+def checkSameOrder(hands):
+    values = evalHands(hands)
+    references = [getReferenceValue(hand) for hand in hands]
+    assert [handCategory(int(v)) for v in values] == [ref[0] for ref in references]
+    order = sorted(range(len(hands)), key=lambda k: references[k])
+    for a, b in zip(order, order[1:]):
+        if references[a] == references[b]:
+            assert values[a] == values[b]
+        else:
+            assert values[a] < values[b]
+
+def test_random_seven_card_hands_match_brute_force():
+    rng = numpy.random.RandomState(0)
+    hands = [list(rng.choice(52, 7, replace=False)) for k in range(1500)]
+    checkSameOrder(hands)
+
+def test_rare_hands_match_brute_force():
+    hands = [parseCards(s) for s in ['Ah2h3h4h5hKdQc', '6h2h3h4h5hAcKd', 'AhAdAcAsKhQd2c',
+                                      'KhKdKcAsAhQd2c', 'Ah2d3c4s5hKdKc', '6h2d3c4s5hKdKc', 'ThJhQhKhAh2c3d',
+                                      '9h9d9c9s2h2d2c', 'AhAdKcKsQhQd2c', '2h2d3c3s4h4d5c']]
+    values = evalHands(hands)
+    assert handCategory(int(values[0])) == STRAIGHT_FLUSH
+    assert handCategory(int(values[2])) == QUADS
+    assert handCategory(int(values[3])) == FULL_HOUSE
+    assert handCategory(int(values[4])) == STRAIGHT
+    checkSameOrder(hands)
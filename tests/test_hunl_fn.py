@@ -0,0 +1,95 @@
+import numpy
+from lib.hunl_bench import makeSyntheticTree, turnBoard
+from lib.hunl_fn import Range, doFP, resumeFP
+
+def getStartingRange():
+    r = Range(1.0)
+    r.removeHandsWithConflicts(turnBoard)
+    return r
+
+def test_resume_matches_uninterrupted_solve(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tree = makeSyntheticTree('small')
+    path = str(tmp_path / 'solve.npz')
+    straight = doFP(tree, 20, getStartingRange(), getStartingRange(), checkEvery=5)
+    doFP(tree, 12, getStartingRange(), getStartingRange(), checkEvery=5, checkpointPath=path)
+    resumed = resumeFP(path, 20, tree, checkEvery=5)
+    assert resumed.iteration == straight.iteration == 20
+    assert numpy.array_equal(resumed.rangeBlock, straight.rangeBlock)
+    assert resumed.convergence == straight.convergence
+    assert [i for i, e in resumed.convergence] == [5, 10, 15, 20]
+
+def test_equity_matrix_unpacked_once_across_threads(monkeypatch):
+    import threading
+    import time
+    import lib.hunl_fn as hunl
+    from lib.hunl_bench import makeSyntheticEquityTable, riverBoard
+    from lib.hunl_equity import packEquityTable
+    calls = []
+
+    def slowUnpack(eqs):
+        calls.append(1)
+        time.sleep(0.05)
+        return unpack(eqs)
+
+    unpack = hunl.unpackEquityTable
+    monkeypatch.setattr(hunl, 'unpackEquityTable', slowUnpack)
+    ea = hunl.EquityArray(list(riverBoard), packEquityTable(makeSyntheticEquityTable(riverBoard)))
+    threads = [threading.Thread(target=ea.getEquityMatrix) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+def test_cache_counts_unpacked_matrices_not_mapped_files(tmp_path, monkeypatch):
+    import lib.hunl_fn as hunl
+    from lib.hunl_bench import makeSyntheticEquityTable, riverBoard
+    from lib.hunl_equity import packEquityTable, getEquityFilename
+    from lib.hunl_iso import getCanonicalBoard
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'eqarray').mkdir()
+    canonicalBoard = getCanonicalBoard(riverBoard)[0]
+    numpy.save(str(tmp_path / 'eqarray' / getEquityFilename(canonicalBoard)),
+               packEquityTable(makeSyntheticEquityTable(canonicalBoard)))
+    other = hunl.EquityArray(list(turnBoard) + [255], packEquityTable(makeSyntheticEquityTable(turnBoard + [255])))
+    cache = hunl.EquityArrayCache(other.getNumBytes())
+    ea = cache.get(list(riverBoard))
+    assert ea.getNumBytes() == 0 # the file is only mapped
+    cache.put(other)
+    assert len(cache.arrays) == 2
+    ea.getEquityMatrix() # now over budget, so the least recently used board goes
+    assert list(cache.arrays) == [tuple(other.board)]
+
+def test_range_matrix_is_read_only():
+    import pytest
+    r = Range(0.5)
+    with pytest.raises(ValueError):
+        r.r[0][1] = 1.0
+    m = r.r.copy()
+    m[0][1] = 1.0
+    r.r = m
+    assert r.getFrac([0, 1]) == 1.0
+    assert r.r[0][1] == 1.0
+
+def test_range_string_sets_every_combo():
+    for rangeString, numCombos in [('AKo', 12), ('AKs', 4), ('AK', 16), ('QQ', 6), ('AhKd', 1)]:
+        r = Range()
+        r.setRangeString(rangeString, 1.0)
+        assert r.getNumHands() == numCombos, rangeString
+    r = Range()
+    r.setRangeString('AKo', 1.0)
+    assert r.getAmbigFrac('A', 'K', False) == 1.0
+
+def test_nature_pool_matches_serial_solve(tmp_path, monkeypatch):
+    from lib.hunl_combos import parseCards
+    from lib.hunl_treebuild import TreeSpec, buildTree
+    monkeypatch.chdir(tmp_path) # the tree's (real) equity arrays are built here
+    board = parseCards('AhKhQd2d')
+    tree = buildTree(TreeSpec(20, board, pot=4, raiseCap=2, riverCards=parseCards('6c6sTc3h')))
+    startingRange = Range(1.0)
+    startingRange.removeHandsWithConflicts(board)
+    serial = doFP(tree, 4, startingRange, startingRange.copy(), checkEvery=2)
+    pooled = doFP(tree, 4, startingRange, startingRange.copy(), checkEvery=2, workers=2)
+    assert numpy.array_equal(pooled.rangeBlock, serial.rangeBlock)
+    assert pooled.convergence == serial.convergence
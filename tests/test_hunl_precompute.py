@@ -0,0 +1,17 @@
+import os
+import multiprocessing
+import pytest
+from lib.hunl_combos import parseCards
+from lib.hunl_iso import getCanonicalBoard
+from lib.hunl_precompute import precompute, getCheckpointPath
+
+def test_worker_error_is_reported_and_pool_stopped(tmp_path):
+    board = getCanonicalBoard(parseCards('AhKdQs2d6c'))[0]
+    outdir = str(tmp_path)
+    os.makedirs(os.path.join(outdir, 'partial'))
+    with open(getCheckpointPath(outdir, board), 'w') as f:
+        f.write('not a checkpoint')
+    with pytest.raises(ValueError) as info:
+        precompute([board], outdir, workers=1)
+    assert 'Pool is still running' not in str(info.value)
+    assert multiprocessing.active_children() == []
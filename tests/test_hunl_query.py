@@ -0,0 +1,65 @@
+import io
+import json
+import pytest
+from lib.hunl_bench import installSyntheticEquityArray, riverBoard
+from lib.hunl_query import readQueries, answerQueries, main
+
+query = {'board': 'AhKdQs2d6c', 'hand': 'AsKs', 'villain': '0.3'}
+
+@pytest.fixture(autouse=True)
+def syntheticEquities(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    installSyntheticEquityArray(riverBoard)
+
+def runMain(tmp_path, lines, *args):
+    path = tmp_path / 'queries.jsonl'
+    path.write_text('\n'.join(lines) + '\n')
+    out = tmp_path / 'results.jsonl'
+    main([str(path), '--output', str(out)] + list(args))
+    return [json.loads(line) for line in out.read_text().splitlines()]
+
+def test_malformed_line_between_queries(tmp_path):
+    results = runMain(tmp_path, [json.dumps(query), '{"board": "AhKdQs2d6c", "hand":', json.dumps(query)])
+    assert [r['line'] for r in results] == [1, 2, 3]
+    assert 'equity' in results[0] and 'equity' in results[2]
+    assert results[0]['equity'] == results[2]['equity']
+    assert 'line 2' in results[1]['error']
+
+def test_non_object_line_between_queries(tmp_path):
+    results = runMain(tmp_path, [json.dumps(query), '[1, 2]', '"AsKs"', json.dumps(query)])
+    assert [r['line'] for r in results] == [1, 2, 3, 4]
+    assert "isn't a JSON object" in results[1]['error']
+    assert "isn't a JSON object" in results[2]['error']
+    assert 'equity' in results[3]
+
+def test_bad_queries_get_errors_in_order(tmp_path):
+    lines = [json.dumps(dict(query, board='AhKdQs2d6x')), json.dumps(dict(query, villain='AAs')),
+             json.dumps(dict(query, hand='AhKs')), json.dumps({'id': 'x', 'board': 'AhKdQs2d6c', 'hero': 'AA,KQs',
+                                                                'villain': '30%'})]
+    results = runMain(tmp_path, lines)
+    assert [r['id'] for r in results] == [1, 2, 3, 'x']
+    assert ['error' in r for r in results] == [True, True, True, False]
+
+def test_results_stream_as_lines_arrive():
+    linesRead = []
+
+    def lines():
+        for k in range(3):
+            linesRead.append(k)
+            yield json.dumps(query) + '\n'
+
+    results = answerQueries(readQueries(lines(), 'jsonl'))
+    assert 'equity' in next(results)
+    assert len(linesRead) == 1
+
+def test_csv_row_with_extra_fields_between_queries():
+    text = 'id,board,hand,hero,villain\n1,AhKdQs2d6c,AsKs,,0.3\n2,AhKdQs2d6c,AsKs,,0.3,oops\n3,AhKdQs2d6c,,QQ,KK\n'
+    results = list(answerQueries(readQueries(io.StringIO(text), 'csv')))
+    assert [r['line'] for r in results] == [2, 3, 4]
+    assert 'equity' in results[0] and 'equity' in results[2]
+    assert 'more fields' in results[1]['error']
+
+def test_offsuit_range_term_has_every_combo():
+    from lib.hunl_query import makeRange
+    assert makeRange('AKo', [255] * 5).getNumHands() == 12
+    assert makeRange('AKs', [255] * 5).getNumHands() == 4
@@ -0,0 +1,60 @@
+import pytest
+from lib.hunl_combos import parseCards
+from lib.hunl_treebuild import TreeSpec, walkTree, estimateTree, buildTree
+
+def test_nothing_left_to_deal_raises(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # buildTree makes EquityArrays for the boards it reaches
+    # after the 2c turn, the only river listed is already on the board
+    spec = TreeSpec(20, parseCards('AhKh2d'), pot=4, turnCards=parseCards('2c3c'), riverCards=parseCards('2c'))
+    with pytest.raises(ValueError, match='river'):
+        estimateTree(spec)
+    with pytest.raises(ValueError, match='river'):
+        buildTree(spec)
+
+def test_every_nature_point_gets_children():
+    spec = TreeSpec(20, parseCards('AhKh2d'), pot=4, turnCards=parseCards('2c3c'), riverCards=parseCards('2c4c'))
+    players = []
+    numChildren = []
+
+    def visit(player, sbCIP, bbCIP, board, parentAction, parent, isoDeals = None):
+        players.append(player)
+        numChildren.append(0)
+        if parent is not None:
+            numChildren[parent] += 1
+        return len(players) - 1
+
+    walkTree(spec, visit)
+    assert 'Nature' in players
+    assert all(n > 0 for player, n in zip(players, numChildren) if player == 'Nature')
+
+def test_merged_tree_solves_the_same_game(tmp_path, monkeypatch):
+    import numpy
+    from lib.hunl_cfr import doCFR
+    from lib.hunl_fn import Range, StrategyPair, getExploitability
+    monkeypatch.chdir(tmp_path) # the trees' (real) equity arrays are built here
+    board = parseCards('AhKhQd2d') # clubs and spades can be swapped
+    trees = [buildTree(TreeSpec(20, board, pot=4, raiseCap=2, riverCards=parseCards('6c6sTcTs3h'),
+                                mergeIsomorphic=merge)) for merge in [False, True]]
+    assert trees[1].getNumPoints() < trees[0].getNumPoints()
+    startingRange = Range(1.0)
+    startingRange.removeHandsWithConflicts(board)
+
+    # best responses to the same (initial) strategies
+    strats = [StrategyPair(tree, startingRange, startingRange.copy()) for tree in trees]
+    exploitabilities = [getExploitability(tree, s) for tree, s in zip(trees, strats)]
+    assert exploitabilities[1] == pytest.approx(exploitabilities[0], abs=1e-5)
+    for player in ['SB', 'BB']:
+        assert numpy.max(numpy.abs(strats[1].evs[player][0] - strats[0].evs[player][0])) < 1e-4
+
+    # CFR has no ties to break, so it follows the same path on both trees
+    solved = [doCFR(tree, 10, startingRange, startingRange.copy(), checkEvery=5) for tree in trees]
+    for (i0, e0), (i1, e1) in zip(solved[0].convergence, solved[1].convergence):
+        assert i0 == i1 and e1 == pytest.approx(e0, abs=1e-5)
+    # ranges after the 6s river, which the merged tree plays as the 6c
+    river = parseCards('AhKhQd2d6s')
+    i0 = next(i for i, p in enumerate(trees[0].decPts) if p.player == 'BB' and p.parentAction == 'AhKhQd2d6s')
+    i1 = next(i for i, p in enumerate(trees[1].decPts) if p.player == 'BB' and p.parentAction == 'AhKhQd2d6c')
+    for c0, c1 in zip(trees[0].children[i0], trees[1].children[i1]):
+        r0 = solved[0].getRangeOnBoard(c0, river)
+        r1 = solved[1].getRangeOnBoard(c1, river)
+        assert numpy.max(numpy.abs(r1.v - r0.v)) < 1e-5